@@ -0,0 +1,62 @@
+"""add_cohort_rollup_tables
+
+Revision ID: 0ad94a9ac9fc
+Revises: 90accf53d20b
+Create Date: 2026-10-18 18:03:29.661045
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0ad94a9ac9fc'
+down_revision: Union[str, Sequence[str], None] = '90accf53d20b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('cohort_sizes',
+    sa.Column('cohort_month', sa.Date(), nullable=False),
+    sa.Column('users', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('cohort_month')
+    )
+    op.create_table('cohort_activity',
+    sa.Column('cohort_month', sa.Date(), nullable=False),
+    sa.Column('activity_month', sa.Date(), nullable=False),
+    sa.Column('active_users', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('cohort_month', 'activity_month')
+    )
+
+    # Первичное заполнение (тот же расчет, что CohortRollupService.rebuild)
+    op.execute("""
+        INSERT INTO cohort_sizes (cohort_month, users)
+        SELECT CAST(date_trunc('month', registration_date) AS date), COUNT(*)
+        FROM users
+        GROUP BY 1
+    """)
+    op.execute("""
+        INSERT INTO cohort_activity (cohort_month, activity_month, active_users)
+        SELECT c.cohort_month, a.activity_month, COUNT(*)
+        FROM (
+            SELECT DISTINCT user_id, CAST(date_trunc('month', completed_at) AS date) AS activity_month
+            FROM survey_responses
+            WHERE completed_at IS NOT NULL
+        ) a
+        JOIN (
+            SELECT user_id, CAST(date_trunc('month', registration_date) AS date) AS cohort_month
+            FROM users
+        ) c ON c.user_id = a.user_id
+        WHERE a.activity_month >= c.cohort_month
+        GROUP BY 1, 2
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('cohort_activity')
+    op.drop_table('cohort_sizes')
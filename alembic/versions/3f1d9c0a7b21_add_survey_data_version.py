@@ -0,0 +1,33 @@
+"""add_survey_data_version
+
+Revision ID: 3f1d9c0a7b21
+Revises: 2308848b6589
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1d9c0a7b21'
+down_revision: Union[str, Sequence[str], None] = '2308848b6589'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Версия данных опроса: увеличивается при каждом новом ответе или правке в админке.
+    # Используется как ключ кэша страницы результатов.
+    op.add_column(
+        'surveys',
+        sa.Column('data_version', sa.Integer(), server_default='1', nullable=False)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('surveys', 'data_version')
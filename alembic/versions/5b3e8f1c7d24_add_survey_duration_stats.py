@@ -0,0 +1,49 @@
+"""add_survey_duration_stats
+
+Revision ID: 5b3e8f1c7d24
+Revises: 0ad94a9ac9fc
+Create Date: 2026-10-18 19:12:47.208311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b3e8f1c7d24'
+down_revision: Union[str, Sequence[str], None] = '0ad94a9ac9fc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('survey_duration_stats',
+    sa.Column('survey_id', sa.Integer(), nullable=False),
+    sa.Column('n', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('mean', sa.Double(), server_default='0', nullable=False),
+    sa.Column('m2', sa.Double(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['survey_id'], ['surveys.survey_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('survey_id')
+    )
+
+    # Первичное заполнение (тот же расчет, что DurationStatsService.rebuild)
+    op.execute("""
+        INSERT INTO survey_duration_stats (survey_id, n, mean, m2)
+        SELECT survey_id, COUNT(*), AVG(x), COALESCE(VAR_SAMP(x) * (COUNT(*) - 1), 0)
+        FROM (
+            SELECT survey_id, EXTRACT(EPOCH FROM duration) AS x
+            FROM survey_responses
+            WHERE completed_at IS NOT NULL
+        ) d
+        GROUP BY survey_id
+    """)
+    op.create_index('idx_responses_survey_duration', 'survey_responses', ['survey_id', 'duration'], unique=False, postgresql_where=sa.text('completed_at IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_responses_survey_duration', table_name='survey_responses', postgresql_where=sa.text('completed_at IS NOT NULL'))
+    op.drop_table('survey_duration_stats')
@@ -0,0 +1,32 @@
+"""add_profile_keyset_indexes
+
+Revision ID: 8e4b2a6d5c13
+Revises: 3f1d9c0a7b21
+Create Date: 2026-10-18 11:03:47.118552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4b2a6d5c13'
+down_revision: Union[str, Sequence[str], None] = '3f1d9c0a7b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keyset-пагинация истории и созданных опросов в профиле:
+    # WHERE user_id = ? AND (started_at, response_id) < (?, ?) ORDER BY ... DESC
+    op.create_index('idx_responses_user_history', 'survey_responses', ['user_id', 'started_at', 'response_id'], unique=False)
+    op.create_index('idx_surveys_author_created', 'surveys', ['author_id', 'created_at', 'survey_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_surveys_author_created', table_name='surveys')
+    op.drop_index('idx_responses_user_history', table_name='survey_responses')
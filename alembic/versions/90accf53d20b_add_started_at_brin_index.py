@@ -0,0 +1,34 @@
+"""add_started_at_brin_index
+
+Revision ID: 90accf53d20b
+Revises: e1a1896f44ef
+Create Date: 2026-10-18 17:25:47.093216
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '90accf53d20b'
+down_revision: Union[str, Sequence[str], None] = 'e1a1896f44ef'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Строки survey_responses вставляются при прохождении, started_at растет вместе
+    # с физическим порядком — BRIN занимает несколько страниц вместо размера B-tree
+    # и обслуживает диапазоны по времени (пересчет rollup, активные опросы за неделю)
+    op.create_index(
+        'idx_responses_started_brin', 'survey_responses', ['started_at'], unique=False,
+        postgresql_using='brin'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_responses_started_brin', table_name='survey_responses')
@@ -0,0 +1,50 @@
+"""add_trigram_search_indexes
+
+Revision ID: c4a7e19b2f60
+Revises: 8e4b2a6d5c13
+Create Date: 2026-10-18 12:21:05.402317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a7e19b2f60'
+down_revision: Union[str, Sequence[str], None] = '8e4b2a6d5c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (индекс, таблица, колонка) — текстовые колонки, по которым ищет админка
+TRGM_INDEXES = [
+    ('idx_countries_name_trgm', 'countries', 'name'),
+    ('idx_users_full_name_trgm', 'users', 'full_name'),
+    ('idx_users_email_trgm', 'users', 'email'),
+    ('idx_tags_name_trgm', 'tags', 'name'),
+    ('idx_surveys_title_trgm', 'surveys', 'title'),
+    ('idx_questions_text_trgm', 'questions', 'question_text'),
+    ('idx_options_text_trgm', 'options', 'option_text'),
+    ('idx_answers_text_trgm', 'user_answers', 'text_answer'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ILIKE '%q%' не использует B-tree, а триграммный GIN индекс — использует
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    for index_name, table_name, column_name in TRGM_INDEXES:
+        op.create_index(
+            index_name, table_name, [column_name], unique=False,
+            postgresql_using='gin',
+            postgresql_ops={column_name: 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for index_name, table_name, _ in reversed(TRGM_INDEXES):
+        op.drop_index(index_name, table_name=table_name)
+    # Расширение не удаляем: им могут пользоваться другие объекты базы
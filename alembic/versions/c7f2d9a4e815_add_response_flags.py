@@ -0,0 +1,44 @@
+"""add_response_flags
+
+Revision ID: c7f2d9a4e815
+Revises: 5b3e8f1c7d24
+Create Date: 2026-10-18 20:31:05.734219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f2d9a4e815'
+down_revision: Union[str, Sequence[str], None] = '5b3e8f1c7d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('response_flags',
+    sa.Column('response_id', sa.Integer(), nullable=False),
+    sa.Column('survey_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Double(), nullable=False),
+    sa.Column('straightline', sa.Double(), nullable=True),
+    sa.Column('ip_burst', sa.Integer(), nullable=True),
+    sa.Column('completion_burst', sa.Integer(), nullable=True),
+    sa.Column('duplicate_text', sa.Integer(), nullable=True),
+    sa.Column('detected_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['response_id'], ['survey_responses.response_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['survey_id'], ['surveys.survey_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('response_id')
+    )
+    op.create_index('idx_response_flags_score', 'response_flags', ['score'], unique=False)
+    op.create_index('idx_response_flags_survey_score', 'response_flags', ['survey_id', 'score'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_response_flags_survey_score', table_name='response_flags')
+    op.drop_index('idx_response_flags_score', table_name='response_flags')
+    op.drop_table('response_flags')
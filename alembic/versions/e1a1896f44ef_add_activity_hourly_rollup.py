@@ -0,0 +1,44 @@
+"""add_activity_hourly_rollup
+
+Revision ID: e1a1896f44ef
+Revises: c4a7e19b2f60
+Create Date: 2026-10-18 16:40:12.518903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a1896f44ef'
+down_revision: Union[str, Sequence[str], None] = 'c4a7e19b2f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # PK (hour_bucket, survey_id) одновременно служит индексом для выборки по периоду
+    op.create_table('activity_hourly',
+    sa.Column('hour_bucket', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('survey_id', sa.Integer(), nullable=False),
+    sa.Column('starts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('completions', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['survey_id'], ['surveys.survey_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('hour_bucket', 'survey_id')
+    )
+
+    # Первичное заполнение из существующих прохождений (дальше — scripts/backfill_rollups.py)
+    op.execute("""
+        INSERT INTO activity_hourly (hour_bucket, survey_id, starts, completions)
+        SELECT date_trunc('hour', started_at), survey_id, COUNT(*), COUNT(completed_at)
+        FROM survey_responses
+        GROUP BY 1, 2
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('activity_hourly')
@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+from app.core.metrics import register_collector
+
+
+class LRUCache:
+    """
+    Простой in-process LRU кэш с опциональным TTL.
+
+    Живет в памяти одного процесса (воркера uvicorn), поэтому годится для
+    данных, актуальность которых проверяется отдельно (например, по версии
+    в БД) или которые меняются крайне редко (справочники).
+    """
+
+    # Все созданные кэши — для счетчиков попаданий в /metrics
+    instances: List["LRUCache"] = []
+
+    def __init__(self, name: str, max_size: int = 256, ttl: Optional[float] = None):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        LRUCache.instances.append(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        stored_at, value = item
+        if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _cache_metrics():
+    for cache in LRUCache.instances:
+        labels = {"cache": cache.name}
+        yield "app_cache_hits_total", "counter", "Cache lookups served from memory", labels, cache.hits
+        yield "app_cache_misses_total", "counter", "Cache lookups that missed or expired", labels, cache.misses
+        yield "app_cache_entries", "gauge", "Entries currently stored in the cache", labels, len(cache)
+
+
+register_collector(_cache_metrics)
+
@@ -19,6 +19,30 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
 
+    # statement_timeout по классам маршрутов (мс, 0 — без ограничения)
+    STATEMENT_TIMEOUT_INTERACTIVE_MS: int = 2000
+    STATEMENT_TIMEOUT_ANALYTICS_MS: int = 15000
+    STATEMENT_TIMEOUT_EXPORT_MS: int = 0
+
+    # Предупреждение о N+1: одна форма SQL повторилась больше N раз за запрос
+    SQL_REPEAT_WARN_THRESHOLD: int = 10
+
+    # Профилирование запросов по флагу (?_profile=1), отчеты в PROFILE_DIR
+    PROFILING_ENABLED: bool = True
+    PROFILE_DIR: str = "profiles"
+    PROFILE_KEEP: int = 50
+
+    # Перечитывать измененные шаблоны без рестарта (для разработки; в production — false)
+    TEMPLATES_AUTO_RELOAD: bool = True
+    # Каталог кэша байткода Jinja ("" — без кэша)
+    TEMPLATE_CACHE_DIR: str = ".jinja_cache"
+
+    # Токен для GET /metrics (Authorization: Bearer <токен>); пустой — /metrics доступен только с localhost
+    METRICS_TOKEN: str = ""
+
+    # Сколько самых активных опросов прогревать в кэше результатов при старте
+    WARMUP_TOP_SURVEYS: int = 20
+
     model_config = SettingsConfigDict(
         env_file=".env", 
         env_ignore_empty=True,
@@ -42,4 +66,12 @@ class Settings(BaseSettings):
 
         return url_object
 
+    @property
+    def statement_timeouts(self) -> dict:
+        return {
+            "interactive": self.STATEMENT_TIMEOUT_INTERACTIVE_MS,
+            "analytics": self.STATEMENT_TIMEOUT_ANALYTICS_MS,
+            "export": self.STATEMENT_TIMEOUT_EXPORT_MS,
+        }
+
 settings = Settings()
\ No newline at end of file
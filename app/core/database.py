@@ -1,13 +1,37 @@
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Callable
+from fastapi import Depends, Request
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core.metrics import (
+    db_statement_timeouts, db_pool_checkout_wait, db_pool_checkout_timeouts, register_collector
+)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул соединений, который измеряет ожидание свободного соединения и таймауты pool_timeout."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            db_pool_checkout_timeouts.inc()
+            raise
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - started)
+
 
 # Initialize the asynchronous engine
 engine = create_async_engine(
     settings.database_url,
     echo=False,  # Set to False in production to reduce log noise
     pool_pre_ping=True,
+    poolclass=InstrumentedPool,
     pool_size=2,
     max_overflow=0,
     pool_timeout=10
@@ -20,10 +44,47 @@ async_session_maker = async_sessionmaker(
     autoflush=False
 )
 
+DEFAULT_ROUTE_CLASS = "interactive"
+
+
+def _pool_metrics():
+    pool = engine.pool
+    yield "db_pool_size", "gauge", "Configured connection pool size", {}, pool.size()
+    yield "db_pool_checked_out", "gauge", "Connections currently checked out", {}, pool.checkedout()
+    yield "db_pool_overflow", "gauge", "Connections opened beyond pool_size", {}, max(pool.overflow(), 0)
+
+
+register_collector(_pool_metrics)
+
 class Base(DeclarativeBase):
     """Base class for all SQLAlchemy ORM models."""
     pass
 
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    """
+    SET LOCAL действует до конца транзакции, поэтому выставляем таймаут
+    в начале каждой транзакции сессии (после commit() начинается новая).
+    """
+    route_class = session.info.get("route_class")
+    if route_class is None:
+        return
+    timeout_ms = settings.statement_timeouts.get(route_class, 0)
+    connection.info["route_class"] = route_class
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _count_statement_timeouts(context):
+    # 57014 = query_canceled: и statement_timeout, и отмена по запросу клиента
+    if getattr(context.original_exception, "sqlstate", None) != "57014":
+        return
+    if "statement timeout" in str(context.original_exception):
+        route_class = context.connection.info.get("route_class", "") if context.connection is not None else ""
+        db_statement_timeouts.inc(route_class=route_class)
+
+
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
     Dependency generator that yields a database session.
@@ -35,4 +96,27 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         AsyncSession: An asynchronous database session.
     """
     async with async_session_maker() as session:
-        yield session
\ No newline at end of file
+        session.info["route_class"] = DEFAULT_ROUTE_CLASS
+        yield session
+
+
+def route_class(name: str) -> Callable:
+    """
+    Dependency factory: задает класс маршрута (interactive / analytics / export),
+    от которого зависит statement_timeout запросов этой сессии.
+
+    Usage:
+        @router.get("/analytics", dependencies=[Depends(route_class("analytics"))])
+    """
+    if name not in settings.statement_timeouts:
+        raise ValueError(f"Unknown route class: {name}")
+
+    async def dependency(request: Request, db: AsyncSession = Depends(get_db)) -> None:
+        db.info["route_class"] = name
+        # Для счетчика отмен в DisconnectCancelMiddleware
+        request.scope["route_class"] = name
+        if db.in_transaction():
+            # Транзакция уже начата другой зависимостью — применяем таймаут сразу
+            await db.execute(text(f"SET LOCAL statement_timeout = {int(settings.statement_timeouts[name])}"))
+
+    return dependency
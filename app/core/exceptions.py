@@ -1,14 +1,11 @@
 from fastapi import Request
-from fastapi.templating import Jinja2Templates
+from app.core.templating import templates
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from app.core.database import async_session_maker
 from app.core.deps import get_optional_user
 
 
-# Инициализируем шаблоны здесь или импортируем из конфига
-templates = Jinja2Templates(directory="app/templates")
-
 async def get_user_context(request: Request):
     """
     Вспомогательная функция: пытается получить пользователя для контекста шаблона,
@@ -0,0 +1,190 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Метрики живут в памяти одного процесса (воркера uvicorn). Блокировок нет:
+# обновления идут из event loop и потоков greenlet SQLAlchemy под GIL, а потеря
+# единичного инкремента при гонке потоков для мониторинга допустима.
+
+_REGISTRY: List["_Metric"] = []
+_COLLECTORS: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    Монотонный счетчик с метками в памяти процесса.
+
+    Значения хранятся по кортежу значений меток, например
+    counter.inc(route_class="analytics") -> {("analytics",): 1}.
+    """
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def items(self):
+        return list(self._values.items())
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и убывать (например, запросы в обработке)."""
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными границами корзин. Для каждого набора меток
+    заранее выделяется список счетчиков, observe() — бинарный поиск и инкремент.
+    Кумулятивные значения bucket считаются только при выдаче /metrics.
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # [счетчики корзин..., +Inf, сумма]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return int(sum(series[:-1])) if series else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, series in list(self._series.items()):
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += hits
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {_format_value(cumulative)}")
+        return lines
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]) -> None:
+    """
+    Регистрирует функцию, которая при выдаче /metrics возвращает значения,
+    хранящиеся вне реестра (размер пула, счетчики кэшей): кортежи
+    (имя, тип, описание, метки, значение).
+    """
+    _COLLECTORS.append(collector)
+
+
+def render_metrics() -> str:
+    """Все метрики процесса в текстовом формате Prometheus (version 0.0.4)."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+
+    # Формат требует, чтобы все ряды одной метрики шли подряд после HELP/TYPE
+    families: Dict[str, List[str]] = {}
+    for collector in _COLLECTORS:
+        for name, type_name, description, labels, value in collector():
+            if name not in families:
+                families[name] = [f"# HELP {name} {description}", f"# TYPE {name} {type_name}"]
+            families[name].append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+    for family in families.values():
+        lines.extend(family)
+    return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# Запросы, прерванные PostgreSQL по statement_timeout
+db_statement_timeouts = Counter(
+    "db_statement_timeouts_total", "Queries cancelled by statement_timeout", ["route_class"]
+)
+
+# Обработка запросов, отмененная из-за отключения клиента (вместе с выполнявшимся SQL)
+requests_cancelled = Counter(
+    "http_requests_cancelled_total", "Requests cancelled after client disconnect", ["route_class"]
+)
+
+# Время обработки по шаблону маршрута (/surveys/{survey_id}), а не по фактическому пути
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", LATENCY_BUCKETS, ["method", "route", "status"]
+)
+
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed"
+)
+
+# Ожидание свободного соединения в пуле (pool_size маленький, очередь бывает)
+db_pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", FAST_BUCKETS
+)
+
+db_pool_checkout_timeouts = Counter(
+    "db_pool_checkout_timeouts_total", "Pool checkouts that hit pool_timeout"
+)
+
+template_render_duration = Histogram(
+    "template_render_seconds", "Jinja2 template render time", FAST_BUCKETS, ["template"]
+)
@@ -1,11 +1,23 @@
+import asyncio
+import contextlib
+import cProfile
+import json
+import logging
+import time
 from fastapi import Request, Response
 import jwt
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
 from starlette.datastructures import MutableHeaders
 import secrets
 from app.core.config import settings
 from app.core.security import create_access_token
+from app.core.metrics import requests_cancelled, http_request_duration, http_requests_in_flight
+from app.core.query_stats import QueryStats, current_query_stats
+from app.core.profiling import is_profile_requested, is_admin_request, new_profile_id, save_profile
+
+logger = logging.getLogger("app.sql")
 
 async def refresh_token_middleware(request: Request, call_next):
     """
@@ -86,4 +98,249 @@ class CsrfMiddleware(BaseHTTPMiddleware):
                 secure=False # True для HTTPS
             )
 
-        return response
\ No newline at end of file
+        return response
+
+
+class DisconnectCancelMiddleware:
+    """
+    Чистый ASGI middleware: если клиент закрыл соединение, пока запрос еще
+    обрабатывается, отменяет задачу обработчика. asyncpg при отмене корутины
+    отправляет серверу cancel request, так что тяжелый SQL не продолжает
+    занимать соединение из маленького пула.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # maxsize=1 сохраняет backpressure при загрузке тела запроса
+        messages: asyncio.Queue = asyncio.Queue(maxsize=1)
+        disconnected = asyncio.Event()
+
+        async def reader():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        async def wrapped_receive():
+            return await messages.get()
+
+        response_complete = False
+
+        async def tracking_send(message):
+            nonlocal response_complete
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+
+        reader_task = asyncio.create_task(reader())
+        app_task = asyncio.create_task(self.app(scope, wrapped_receive, tracking_send))
+        disconnect_task = asyncio.create_task(disconnected.wait())
+        try:
+            await asyncio.wait({app_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not app_task.done() and response_complete:
+                # Сервер сообщает о disconnect и после полной отправки ответа —
+                # даем обработчику спокойно завершиться (закрыть сессию БД и т.п.)
+                await app_task
+            elif not app_task.done():
+                app_task.cancel()
+                requests_cancelled.inc(route_class=scope.get("route_class", "interactive"))
+                with contextlib.suppress(asyncio.CancelledError):
+                    await app_task
+            else:
+                app_task.result()
+        finally:
+            for task in (reader_task, disconnect_task, app_task):
+                task.cancel()
+
+
+class QueryStatsMiddleware:
+    """
+    Собирает статистику SQL запроса (число запросов, суммарное и максимальное
+    время) через события движка, отдает ее в заголовке Server-Timing и пишет
+    одну JSON-строку в лог. Повторы одной формы SQL сверх порога — warning (N+1).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        started = time.perf_counter()
+        status_code = None
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Для потоковых ответов учитываются только запросы до начала ответа
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", (
+                    f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries", '
+                    f"db-slowest;dur={stats.slowest_ms:.1f}, "
+                    f"app;dur={(time.perf_counter() - started) * 1000:.1f}"
+                ))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_query_stats.reset(token)
+            self._log(scope, stats, status_code, (time.perf_counter() - started) * 1000)
+
+    @staticmethod
+    def _log(scope, stats: QueryStats, status_code, duration_ms: float) -> None:
+        if stats.count == 0:
+            return
+        logger.info(json.dumps({
+            "event": "request_sql",
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status_code,
+            "duration_ms": round(duration_ms, 1),
+            "queries": stats.count,
+            "db_ms": round(stats.total_ms, 1),
+            "slowest_ms": round(stats.slowest_ms, 1),
+            "slowest_sql": " ".join(stats.slowest_sql.split())[:300],
+        }, ensure_ascii=False))
+
+        for shape, calls in stats.repeated(settings.SQL_REPEAT_WARN_THRESHOLD):
+            logger.warning(json.dumps({
+                "event": "sql_repeated",
+                "method": scope["method"],
+                "path": scope["path"],
+                "calls": calls,
+                "shape": shape[:300],
+            }, ensure_ascii=False))
+
+
+class MetricsMiddleware:
+    """
+    Латентность по шаблону маршрута и число запросов в обработке для /metrics.
+    Шаблон ("/surveys/{survey_id}") берется из scope["route"], который FastAPI
+    заполняет при сопоставлении, — так число рядов гистограммы не растет с id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(scope.get("route"), "path", "unmatched"),
+                status=str(status_code)
+            )
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование одного запроса по флагу (?_profile=1 или заголовок X-Profile: 1),
+    только для администратора. Без флага запрос проходит напрямую, без cProfile
+    и без обращения к БД. cProfile снимает весь поток, поэтому одновременно
+    профилируется только один запрос; отчет доступен по X-Profile-Url.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or not is_profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        # Флаг занимаем до await проверки роли: иначе два запроса одновременно пройдут
+        # проверку и второй profiler.enable() упадет с ValueError
+        self._active = True
+        try:
+            is_admin = await is_admin_request(scope)
+        except Exception:
+            self._active = False
+            raise
+        if not is_admin:
+            self._active = False
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = new_profile_id()
+        status_code = None
+
+        async def send_with_link(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Profile-Id", profile_id)
+                headers.append("X-Profile-Url", f"/admin/profiles/{profile_id}")
+            await send(message)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Поток уже профилирует другой инструмент (например, внешний профайлер)
+            self._active = False
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_link)
+        finally:
+            profiler.disable()
+            self._active = False
+            await self._save(profile_id, profiler, scope, status_code, started)
+
+    @staticmethod
+    async def _save(profile_id, profiler, scope, status_code, started):
+        """
+        Рендер отчета и запись файлов — в пуле потоков, чтобы не блокировать event loop.
+        Ошибка сохранения только логируется: ответ уже отправлен и не должен ее маскировать.
+        """
+        # Статистику SQL заполняет внешний QueryStatsMiddleware
+        stats = current_query_stats.get()
+        try:
+            await run_in_threadpool(save_profile, profile_id, profiler, {
+                "id": profile_id,
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "queries": stats.count if stats else None,
+                "db_ms": round(stats.total_ms, 1) if stats else None,
+            })
+        except Exception:
+            logging.getLogger("app.profiling").exception("Не удалось сохранить профиль %s", profile_id)
@@ -0,0 +1,235 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import secrets
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import jwt
+from sqlalchemy import text
+from starlette.requests import HTTPConnection
+
+from app.core.config import settings
+
+PROFILE_ID_RE = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{6}$")
+# Узлы дерева меньше этой доли общего времени не показываются
+MIN_NODE_FRACTION = 0.002
+MAX_TREE_DEPTH = 60
+
+
+def profile_dir() -> Path:
+    return Path(settings.PROFILE_DIR)
+
+
+def is_profile_requested(scope) -> bool:
+    """Флаг профилирования: ?_profile=1 в URL или заголовок X-Profile: 1."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("_profile") == ["1"]:
+        return True
+    return any(name == b"x-profile" and value == b"1" for name, value in scope.get("headers", ()))
+
+
+async def is_admin_request(scope) -> bool:
+    """Проверка по access_token из cookie; запрос в БД выполняется только при включенном флаге."""
+    from app.core.database import async_session_maker
+
+    token = HTTPConnection(scope).cookies.get("access_token")
+    if not token:
+        return False
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except jwt.PyJWTError:
+        return False
+
+    async with async_session_maker() as session:
+        role = await session.scalar(
+            text("SELECT role FROM users WHERE email = :email"), {"email": payload.get("sub")}
+        )
+    return role == "admin"
+
+
+# --- ДЕРЕВО ВЫЗОВОВ ---
+
+def _label(func: Tuple[str, int, str]) -> Dict[str, Any]:
+    filename, line, name = func
+    if filename == "~":
+        return {"name": name, "file": "", "line": 0}
+    return {"name": f"{name} ({os.path.basename(filename)}:{line})", "file": filename, "line": line}
+
+
+def build_call_tree(stats: pstats.Stats) -> Dict[str, Any]:
+    """
+    Дерево вызовов из агрегированной статистики cProfile (как в snakeviz):
+    время ребра caller -> callee берется из cumulative time этого ребра.
+    Для функций, вызываемых из разных мест, это приближение, но для поиска
+    "куда ушло время" его достаточно. Рекурсия обрезается по пути.
+    """
+    children: Dict[tuple, List[Tuple[tuple, float]]] = {}
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            roots.append((func, ct))
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    total = sum(ct for _, ct in roots) or 1e-9
+    min_value = total * MIN_NODE_FRACTION
+
+    def build(func, value, path, depth):
+        node = {**_label(func), "value": value, "children": []}
+        if depth >= MAX_TREE_DEPTH:
+            return node
+        kids = sorted(children.get(func, []), key=lambda kv: -kv[1])
+        kids_total = sum(v for f, v in kids if f not in path)
+        # Приближенные времена детей не должны превышать время родителя
+        scale = min(1.0, value / kids_total) if kids_total else 1.0
+        for child, child_value in kids:
+            child_value *= scale
+            if child in path or child_value < min_value:
+                continue
+            node["children"].append(build(child, child_value, path | {child}, depth + 1))
+        return node
+
+    root = {"name": "request", "file": "", "line": 0, "value": total, "children": []}
+    for func, ct in sorted(roots, key=lambda kv: -kv[1]):
+        if ct >= min_value:
+            root["children"].append(build(func, ct, {func}, 1))
+    return root
+
+
+def flatten_for_icicle(root: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Прямоугольники icicle-графика: глубина, смещение и ширина в процентах от корня."""
+    total = root["value"] or 1e-9
+    rects = []
+
+    def walk(node, depth, offset):
+        rects.append({
+            "depth": depth,
+            "left": offset / total * 100,
+            "width": node["value"] / total * 100,
+            "name": node["name"],
+            "ms": node["value"] * 1000,
+        })
+        x = offset
+        for child in node["children"]:
+            walk(child, depth + 1, x)
+            x += child["value"]
+
+    walk(root, 0, 0.0)
+    return rects
+
+
+def to_speedscope(root: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """Дерево в формате speedscope (evented profile), открывается на speedscope.app."""
+    frames: List[Dict[str, Any]] = []
+    frame_index: Dict[Tuple[str, str, int], int] = {}
+    events: List[Dict[str, Any]] = []
+
+    def frame_id(node) -> int:
+        key = (node["name"], node["file"], node["line"])
+        if key not in frame_index:
+            frame_index[key] = len(frames)
+            frames.append({"name": node["name"], "file": node["file"], "line": node["line"]})
+        return frame_index[key]
+
+    def walk(node, start):
+        fid = frame_id(node)
+        events.append({"type": "O", "frame": fid, "at": start})
+        at = start
+        for child in node["children"]:
+            walk(child, at)
+            at += child["value"]
+        events.append({"type": "C", "frame": fid, "at": start + node["value"]})
+
+    walk(root, 0.0)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "evented",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": root["value"],
+            "events": events,
+        }],
+        "name": name,
+        "exporter": "survey-platform",
+    }
+
+
+def top_functions(stats: pstats.Stats, key: str, limit: int = 30) -> List[Dict[str, Any]]:
+    """Самые дорогие функции по собственному (tottime) или полному (cumtime) времени."""
+    index = 2 if key == "tottime" else 3
+    rows = sorted(stats.stats.items(), key=lambda kv: -kv[1][index])[:limit]
+    return [{
+        "name": _label(func)["name"],
+        "file": func[0],
+        "calls": nc,
+        "tottime_ms": tt * 1000,
+        "cumtime_ms": ct * 1000,
+    } for func, (cc, nc, tt, ct, callers) in rows]
+
+
+# --- ХРАНЕНИЕ ---
+
+def new_profile_id() -> str:
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{secrets.token_hex(3)}"
+
+
+def save_profile(profile_id: str, profiler: cProfile.Profile, meta: Dict[str, Any]) -> None:
+    """Пишет HTML-отчет, speedscope JSON и метаданные; старые профили сверх лимита удаляются."""
+    from app.core.templating import templates
+
+    stats = pstats.Stats(profiler)
+    tree = build_call_tree(stats)
+    title = f"{meta['method']} {meta['path']}"
+
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    rects = flatten_for_icicle(tree)
+    html = templates.get_template("admin/profile_report.html").render(
+        meta=meta,
+        rects=rects,
+        max_depth=max(r["depth"] for r in rects),
+        by_tottime=top_functions(stats, "tottime"),
+        by_cumtime=top_functions(stats, "cumtime"),
+    )
+    (directory / f"{profile_id}.html").write_text(html, encoding="utf-8")
+    (directory / f"{profile_id}.speedscope.json").write_text(
+        json.dumps(to_speedscope(tree, title), ensure_ascii=False), encoding="utf-8"
+    )
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    for old in list_profiles()[settings.PROFILE_KEEP:]:
+        for suffix in (".html", ".speedscope.json", ".json"):
+            (directory / f"{old['id']}{suffix}").unlink(missing_ok=True)
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Метаданные сохраненных профилей, новые первыми."""
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    profiles = []
+    for path in directory.glob("*.json"):
+        if path.name.endswith(".speedscope.json"):
+            continue
+        try:
+            profiles.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda p: p["id"], reverse=True)
+
+
+def profile_file(profile_id: str, suffix: str) -> Optional[Path]:
+    """Путь к файлу профиля; id проверяется по шаблону, чтобы не выйти из каталога."""
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}{suffix}"
+    return path if path.exists() else None
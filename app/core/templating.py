@@ -0,0 +1,76 @@
+import logging
+import os
+import time
+from typing import Optional
+
+import jinja2
+from fastapi.templating import Jinja2Templates
+
+from app.core.config import settings
+from app.core.metrics import template_render_duration
+
+logger = logging.getLogger("app.templates")
+
+TEMPLATES_DIR = "app/templates"
+
+
+class InstrumentedTemplates(Jinja2Templates):
+    """Jinja2Templates, которые замеряют время рендера каждого шаблона для /metrics."""
+
+    def TemplateResponse(self, *args, **kwargs):
+        # Поддерживаем обе сигнатуры Starlette: (request, name, ...) и (name, context, ...)
+        name = kwargs.get("name") or next((arg for arg in args if isinstance(arg, str)), "")
+        started = time.perf_counter()
+        try:
+            return super().TemplateResponse(*args, **kwargs)
+        finally:
+            template_render_duration.observe(time.perf_counter() - started, template=name)
+
+
+def _bytecode_cache() -> Optional[jinja2.BytecodeCache]:
+    """
+    Кэш скомпилированных шаблонов на диске: новый процесс (воркер, рестарт)
+    не парсит и не компилирует шаблоны заново. Если каталог недоступен
+    на запись, работаем без него.
+    """
+    if not settings.TEMPLATE_CACHE_DIR:
+        return None
+    try:
+        os.makedirs(settings.TEMPLATE_CACHE_DIR, exist_ok=True)
+    except OSError as e:
+        logger.warning("Кэш шаблонов отключен: %s", e)
+        return None
+    return jinja2.FileSystemBytecodeCache(settings.TEMPLATE_CACHE_DIR)
+
+
+def build_environment() -> jinja2.Environment:
+    """
+    Одно окружение Jinja на процесс. auto_reload=False убирает stat() файла
+    шаблона на каждый рендер (в production шаблоны не меняются без рестарта);
+    cache_size=-1 — все шаблоны остаются в памяти, их немного.
+    """
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+        autoescape=jinja2.select_autoescape(),
+        auto_reload=settings.TEMPLATES_AUTO_RELOAD,
+        bytecode_cache=_bytecode_cache(),
+        cache_size=-1,
+    )
+
+
+# Общий экземпляр для всех роутеров и обработчиков ошибок
+templates = InstrumentedTemplates(env=build_environment())
+
+
+def precompile_templates() -> int:
+    """
+    Загружает и компилирует все шаблоны при старте, чтобы первый запрос
+    к каждой странице не платил за компиляцию. Синтаксическая ошибка
+    в шаблоне роняет старт приложения, а не запрос пользователя.
+    """
+    started = time.perf_counter()
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    logger.info("Шаблонов скомпилировано: %d за %.0f мс", len(names), (time.perf_counter() - started) * 1000)
+    return len(names)
@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core.config import settings
+from app.core.database import engine, async_session_maker
+from app.core.templating import precompile_templates
+
+logger = logging.getLogger("app.warmup")
+
+WARMUP_RETRY_SECONDS = 2.0
+
+
+class WarmupState:
+    """Состояние прогрева процесса для /ready: шаги с временем выполнения или ошибкой."""
+
+    def __init__(self):
+        self.ready = False
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self):
+        self.ready = False
+        self.steps = {}
+
+
+warmup_state = WarmupState()
+
+
+async def warm_pool(db_engine: AsyncEngine) -> int:
+    """
+    Открывает pool_size соединений одновременно и возвращает их в пул:
+    первые запросы после старта не ждут TCP/TLS-рукопожатия и аутентификации.
+    """
+    size = db_engine.pool.size()
+
+    async def checkout(stack: contextlib.AsyncExitStack):
+        conn = await stack.enter_async_context(db_engine.connect())
+        await conn.execute(text("SELECT 1"))
+
+    # Соединения держатся до выхода из стека, иначе пул отдал бы одно и то же повторно.
+    # TaskGroup при ошибке отменяет остальные подключения до закрытия стека
+    async with contextlib.AsyncExitStack() as stack:
+        async with asyncio.TaskGroup() as group:
+            for _ in range(size):
+                group.create_task(checkout(stack))
+    return size
+
+
+async def top_active_surveys(session: AsyncSession, limit: int) -> List[int]:
+    """Опубликованные опросы с наибольшим числом прохождений за последнюю неделю."""
+    res = await session.execute(text("""
+        SELECT s.survey_id
+        FROM surveys s
+        JOIN survey_responses sr ON sr.survey_id = s.survey_id
+        WHERE s.status <> 'draft' AND sr.started_at >= now() - interval '7 days'
+        GROUP BY s.survey_id
+        ORDER BY COUNT(*) DESC, s.survey_id
+        LIMIT :limit
+    """), {"limit": limit})
+    return list(res.scalars().all())
+
+
+async def warm_caches(session: AsyncSession, limit: int) -> int:
+    """Заполняет in-process кэши: справочник стран и результаты самых активных опросов."""
+    from app.services.survey import SurveyService
+    from app.services.user import UserService
+
+    session.info["route_class"] = "analytics"
+    await UserService(session).get_countries()
+    survey_ids = await top_active_surveys(session, limit)
+    service = SurveyService(session)
+    for survey_id in survey_ids:
+        await service.get_survey_results(survey_id)
+    return len(survey_ids)
+
+
+async def _step(name: str, coro) -> Optional[Any]:
+    started = time.perf_counter()
+    try:
+        result = await coro
+    except Exception as e:
+        # Холодный кэш не ломает приложение: шаг отмечается и прогрев продолжается.
+        # Текст ошибки (хосты, SQL) только в логе: /ready доступен без авторизации
+        warmup_state.steps[name] = {"ok": False}
+        logger.warning("Прогрев %s не удался: %s", name, e)
+        return None
+    ms = round((time.perf_counter() - started) * 1000, 1)
+    warmup_state.steps[name] = {"ok": True, "ms": ms, "result": result}
+    logger.info("Прогрев %s: %s за %.0f мс", name, result, ms)
+    return result
+
+
+async def run_warmup() -> None:
+    """Все шаги прогрева по порядку; после них процесс считается готовым (ошибки кэшей не блокируют)."""
+    from app.services.schema_registry import schema_registry
+
+    # Без БД процесс не готов: ждем, пока пул сможет открыть соединения
+    while await _step("pool", warm_pool(engine)) is None:
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    await _step("schema", schema_registry.load(force=False))
+    async with async_session_maker() as session:
+        await _step("caches", warm_caches(session, settings.WARMUP_TOP_SURVEYS))
+    warmup_state.ready = True
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Шаблоны компилируются до приема запросов (ошибка в шаблоне роняет старт).
+    Прогрев БД и кэшей идет в фоне: процесс уже отвечает (liveness),
+    а /ready возвращает 503, пока прогрев не закончится.
+    """
+    warmup_state.reset()
+    started = time.perf_counter()
+    count = precompile_templates()
+    warmup_state.steps["templates"] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1), "result": count}
+
+    task = asyncio.create_task(run_warmup())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        await engine.dispose()
@@ -2,7 +2,9 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.gzip import GZipMiddleware
 from app.routers import general, admin, auth, users, surveys
-from app.core.middleware import refresh_token_middleware, CsrfMiddleware
+from app.core.middleware import refresh_token_middleware, CsrfMiddleware, DisconnectCancelMiddleware, QueryStatsMiddleware, MetricsMiddleware, ProfilingMiddleware
+from app.core.config import settings
+from app.core.warmup import lifespan
 from app.core.exceptions import not_found_handler, forbidden_handler, server_error_handler, unauthorized_handler
 
 def create_app() -> FastAPI:
@@ -15,7 +17,9 @@ def create_app() -> FastAPI:
     app_instance = FastAPI(
         title="Опрос",
         description="A course project for analyzing survey data.",
-        version="1.0.0"
+        version="1.0.0",
+        # Компиляция шаблонов, прогрев пула, метаданных схемы и кэшей (см. /ready)
+        lifespan=lifespan
     )
 
     # Mount static files (if you have CSS/JS files locally)
@@ -25,6 +29,15 @@ def create_app() -> FastAPI:
     app_instance.add_middleware(CsrfMiddleware)
     app_instance.middleware("http")(refresh_token_middleware)
     app_instance.add_middleware(GZipMiddleware, minimum_size=1000)
+    # cProfile по флагу ?_profile=1 для админа; внутри QueryStats, чтобы видеть статистику SQL
+    if settings.PROFILING_ENABLED:
+        app_instance.add_middleware(ProfilingMiddleware)
+    # Число и время SQL запроса: заголовок Server-Timing и строка в логе
+    app_instance.add_middleware(QueryStatsMiddleware)
+    # Латентность по маршрутам и запросы в обработке для /metrics
+    app_instance.add_middleware(MetricsMiddleware)
+    # Внешний слой: отмена обработки (и SQL) при отключении клиента
+    app_instance.add_middleware(DisconnectCancelMiddleware)
 
     app_instance.add_exception_handler(404, not_found_handler)
     app_instance.add_exception_handler(403, forbidden_handler)
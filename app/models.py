@@ -3,12 +3,14 @@ from datetime import date, datetime, timedelta, timezone
 from typing import List, Optional
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     CheckConstraint,
     Column,
     Computed,
     Date,
     DateTime,
+    Double,
     Enum,
     ForeignKey,
     Integer,
@@ -67,6 +69,10 @@ class Country(Base):
         name (str): Unique name of the country.
     """
     __tablename__ = "countries"
+    __table_args__ = (
+        # Поиск подстроки в админке (ILIKE '%q%'), требует расширения pg_trgm
+        Index('idx_countries_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     country_id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
@@ -99,6 +105,9 @@ class User(Base):
             'email', 
             postgresql_include=['password_hash', 'user_id', 'role']
         ),
+        # Триграммные индексы для поиска подстроки в админке
+        Index('idx_users_full_name_trgm', 'full_name', postgresql_using='gin', postgresql_ops={'full_name': 'gin_trgm_ops'}),
+        Index('idx_users_email_trgm', 'email', postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}),
     )
 
     user_id: Mapped[int] = mapped_column(primary_key=True)
@@ -132,6 +141,9 @@ class Tag(Base):
         name (str): Unique tag name.
     """
     __tablename__ = "tags"
+    __table_args__ = (
+        Index('idx_tags_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     tag_id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
@@ -155,6 +167,7 @@ class Survey(Base):
         created_at (datetime): Creation timestamp.
         start_date (datetime): When the survey becomes active.
         end_date (datetime): When the survey closes.
+        data_version (int): Bumped on every submission/admin edit; keys the results cache.
     """
     __tablename__ = "surveys"
     __table_args__ = (
@@ -164,6 +177,9 @@ class Survey(Base):
             'created_at', 
             postgresql_where=text("status = 'active'")
         ),
+        # Keyset-пагинация "Мои опросы" в профиле
+        Index('idx_surveys_author_created', 'author_id', 'created_at', 'survey_id'),
+        Index('idx_surveys_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
     )
 
     survey_id: Mapped[int] = mapped_column(primary_key=True)
@@ -181,6 +197,9 @@ class Survey(Base):
     )
     start_date: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
     end_date: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    data_version: Mapped[int] = mapped_column(
+        Integer, default=1, server_default=text("1"), nullable=False
+    )
 
     # Relationships
     author: Mapped[Optional["User"]] = relationship(back_populates="created_surveys")
@@ -208,6 +227,9 @@ class Question(Base):
         is_required (bool): Whether an answer is mandatory.
     """
     __tablename__ = "questions"
+    __table_args__ = (
+        Index('idx_questions_text_trgm', 'question_text', postgresql_using='gin', postgresql_ops={'question_text': 'gin_trgm_ops'}),
+    )
 
     question_id: Mapped[int] = mapped_column(primary_key=True)
     survey_id: Mapped[int] = mapped_column(
@@ -242,6 +264,9 @@ class Option(Base):
         is_correct (bool): Used for quizzes/tests (optional).
     """
     __tablename__ = "options"
+    __table_args__ = (
+        Index('idx_options_text_trgm', 'option_text', postgresql_using='gin', postgresql_ops={'option_text': 'gin_trgm_ops'}),
+    )
 
     option_id: Mapped[int] = mapped_column(primary_key=True)
     question_id: Mapped[int] = mapped_column(
@@ -273,6 +298,15 @@ class SurveyResponse(Base):
     __table_args__ = (
         CheckConstraint("completed_at >= started_at", name="check_completion_time"),
         UniqueConstraint("survey_id", "user_id", name="unique_user_survey_attempt"),
+        # Keyset-пагинация истории прохождений в профиле
+        Index('idx_responses_user_history', 'user_id', 'started_at', 'response_id'),
+        # Прохождения пишутся в порядке времени: BRIN по started_at крошечный и отсекает диапазоны
+        Index('idx_responses_started_brin', 'started_at', postgresql_using='brin'),
+        # Аномально быстрые прохождения опроса — диапазон по длительности
+        Index(
+            'idx_responses_survey_duration', 'survey_id', 'duration',
+            postgresql_where=text('completed_at IS NOT NULL')
+        ),
     )
 
     response_id: Mapped[int] = mapped_column(primary_key=True)
@@ -338,6 +372,7 @@ class UserAnswer(Base):
             unique=True,
             postgresql_where=text("selected_option_id IS NOT NULL")
         ),
+        Index('idx_answers_text_trgm', 'text_answer', postgresql_using='gin', postgresql_ops={'text_answer': 'gin_trgm_ops'}),
     )
 
     answer_id: Mapped[int] = mapped_column(primary_key=True)
@@ -356,3 +391,112 @@ class UserAnswer(Base):
     response: Mapped["SurveyResponse"] = relationship(back_populates="answers")
     question: Mapped["Question"] = relationship(back_populates="answers")
     selected_option: Mapped[Optional["Option"]] = relationship("Option")
+
+
+class ActivityHourly(Base):
+    """
+    Hourly activity rollup per survey, maintained on write by ActivityRollupService.
+
+    Attributes:
+        hour_bucket (datetime): Start of the hour the responses were started in.
+        survey_id (int): The survey.
+        starts (int): Responses started within the hour.
+        completions (int): Of those, responses that were completed.
+    """
+    __tablename__ = "activity_hourly"
+
+    hour_bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    survey_id: Mapped[int] = mapped_column(
+        ForeignKey("surveys.survey_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    starts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    completions: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+
+
+class CohortSize(Base):
+    """
+    Number of users registered per month, maintained by CohortRollupService.
+
+    Attributes:
+        cohort_month (date): First day of the registration month.
+        users (int): Users registered in that month.
+    """
+    __tablename__ = "cohort_sizes"
+
+    cohort_month: Mapped[date] = mapped_column(Date, primary_key=True)
+    users: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+
+
+class CohortActivity(Base):
+    """
+    Active users of a registration cohort per month of survey completion.
+
+    Attributes:
+        cohort_month (date): First day of the registration month.
+        activity_month (date): First day of the month with completed surveys.
+        active_users (int): Distinct cohort users who completed a survey that month.
+    """
+    __tablename__ = "cohort_activity"
+
+    cohort_month: Mapped[date] = mapped_column(Date, primary_key=True)
+    activity_month: Mapped[date] = mapped_column(Date, primary_key=True)
+    active_users: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+
+
+class SurveyDurationStats(Base):
+    """
+    Running duration statistics of completed responses per survey (Welford),
+    maintained by DurationStatsService.
+
+    Attributes:
+        survey_id (int): The survey.
+        n (int): Number of completed responses.
+        mean (float): Mean duration in seconds.
+        m2 (float): Sum of squared deviations from the mean (variance = m2 / (n - 1)).
+    """
+    __tablename__ = "survey_duration_stats"
+
+    survey_id: Mapped[int] = mapped_column(
+        ForeignKey("surveys.survey_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    n: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    mean: Mapped[float] = mapped_column(Double, default=0, server_default="0", nullable=False)
+    m2: Mapped[float] = mapped_column(Double, default=0, server_default="0", nullable=False)
+
+
+class ResponseFlag(Base):
+    """
+    Response flagged by the batch fraud detector (scripts/detect_fraud.py).
+    Signal columns are NULL when the signal did not fire.
+
+    Attributes:
+        response_id (int): The flagged response.
+        survey_id (int): Its survey (denormalized for the admin filter).
+        score (float): Combined score, roughly the number of fired signals weighted by strength.
+        straightline (float): Share of answers on the same option position.
+        ip_burst (int): Responses from the same IP within the window.
+        completion_burst (int): Completions of the survey within the window.
+        duplicate_text (int): Responses sharing an identical text answer.
+        detected_at (datetime): When the detector wrote the flag.
+    """
+    __tablename__ = "response_flags"
+    __table_args__ = (
+        Index('idx_response_flags_score', 'score'),
+        Index('idx_response_flags_survey_score', 'survey_id', 'score'),
+    )
+
+    response_id: Mapped[int] = mapped_column(
+        ForeignKey("survey_responses.response_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    survey_id: Mapped[int] = mapped_column(ForeignKey("surveys.survey_id", ondelete="CASCADE"))
+    score: Mapped[float] = mapped_column(Double, nullable=False)
+    straightline: Mapped[Optional[float]] = mapped_column(Double)
+    ip_burst: Mapped[Optional[int]] = mapped_column(Integer)
+    completion_burst: Mapped[Optional[int]] = mapped_column(Integer)
+    duplicate_text: Mapped[Optional[int]] = mapped_column(Integer)
+    detected_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=text("now()"), nullable=False
+    )
@@ -3,20 +3,22 @@ import csv
 import io
 from typing import Optional, Union
 from datetime import datetime, date
-from fastapi import APIRouter, Request, Depends, HTTPException, Body
-from fastapi.responses import HTMLResponse, StreamingResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Request, Depends, HTTPException, Body, File, UploadFile
+from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse
+from app.core.templating import templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc, case, text, extract, inspect
+from sqlalchemy import select, func, desc, case, text, extract
 
-from app.core.database import get_db, engine
+from app.core.database import get_db, route_class
 from app.core.deps import get_current_user
 from app.models import User, Survey, SurveyResponse, Tag, survey_tags, UserRole
 from app.core.security import get_password_hash
-from app.services.admin import AdminService
+from app.services.admin import AdminService, BULK_ROW_LIMIT
+from app.services.table_import import TableImportService
+from app.services.query_inspector import QueryInspectorService, QUERY_REGISTRY
+from app.core.profiling import list_profiles, profile_file
 
 router = APIRouter(prefix="/admin", tags=["admin"])
-templates = Jinja2Templates(directory="app/templates")
 
 # Зависимость для получения сервиса
 def get_admin_service(db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)) -> AdminService:
@@ -24,7 +26,7 @@ def get_admin_service(db: AsyncSession = Depends(get_db), user: User = Depends(g
         raise HTTPException(status_code=403, detail="Доступ запрещен")
     return AdminService(db)
 
-@router.get("/analytics", response_class=HTMLResponse)
+@router.get("/analytics", response_class=HTMLResponse, dependencies=[Depends(route_class("analytics"))])
 async def analytics_dashboard(
     request: Request,
     survey_id: Union[int, str, None] = None, 
@@ -40,6 +42,7 @@ async def analytics_dashboard(
     # Получаем данные через сервис
     data = await service.get_dashboard_stats()
     anomalies = await service.get_anomalies(survey_id)
+    flags = await service.get_response_flags(survey_id)
     all_surveys = await service.get_all_surveys()
     cohort_data = await service.get_cohort_stats()
 
@@ -56,12 +59,13 @@ async def analytics_dashboard(
             "demographics": data.get('demographics', {'labels': [], 'counts': []}),
             "cohort_data": cohort_data,
             "anomalies": anomalies,
+            "flags": flags,
             "all_surveys": all_surveys,
             "selected_survey_id": survey_id
         }
     )
 
-@router.get("/analytics/anomalies", response_class=HTMLResponse)
+@router.get("/analytics/anomalies", response_class=HTMLResponse, dependencies=[Depends(route_class("analytics"))])
 async def get_anomalies_partial(
     request: Request,
     survey_id: Union[int, str, None] = None,
@@ -72,11 +76,13 @@ async def get_anomalies_partial(
     if survey_id: survey_id = int(survey_id)
     
     anomalies = await service.get_anomalies(survey_id)
+    flags = await service.get_response_flags(survey_id)
     return templates.TemplateResponse(
         request=request,
         name="admin/partials/anomalies_table.html",
         context={
-            "anomalies": anomalies
+            "anomalies": anomalies,
+            "flags": flags
         }
     )
 
@@ -103,13 +109,19 @@ async def get_table_data(
     page: int = 1,
     limit: int = 100,
     q: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    exact: bool = False,
     service: AdminService = Depends(get_admin_service)
 ):
     if not await service.check_table_exists(table_name):
         return HTMLResponse("Таблица не найдена")
 
     try:
-        data = await service.get_paginated_table_data(table_name, page, limit, q)
+        data = await service.get_paginated_table_data(
+            table_name, page, limit, q,
+            after=after, before=before, exact_count=exact
+        )
     except Exception as e:
         return HTMLResponse(f"Error: {e}")
 
@@ -121,7 +133,10 @@ async def get_table_data(
             **data, 
             "page": page,
             "limit": limit,
-            "q": q if q else ""
+            "q": q if q else "",
+            "exact": exact,
+            # Текущий запрос — для перезагрузки той же страницы после правок
+            "current_query": request.url.query
         }
     )
 
@@ -131,14 +146,10 @@ async def get_create_form(
     table_name: str,
     service: AdminService = Depends(get_admin_service)
 ):
-    def _get_cols(c): 
-        insp = inspect(c)
-        return insp.get_columns(table_name), insp.get_pk_constraint(table_name)['constrained_columns'][0]
-    
-    async with engine.connect() as conn:
-        columns, pk_col = await conn.run_sync(_get_cols)
+    meta = await service.get_table_meta(table_name)
+    columns, pk_col = meta['columns'], meta['pk_col']
     
-    options = await service.get_form_options(table_name, columns)
+    options, typeahead = await service.get_form_options(table_name, columns)
     
     return templates.TemplateResponse(
         request=request,
@@ -147,7 +158,8 @@ async def get_create_form(
             "table_name": table_name,
             "columns": columns,
             "pk_col": pk_col,
-            "options_map": options
+            "options_map": options,
+            "typeahead_map": typeahead
         }
     )
 
@@ -171,12 +183,8 @@ async def get_edit_form(
     pk_val: str,
     service: AdminService = Depends(get_admin_service)
 ):
-    def _get_info(c): 
-        insp = inspect(c)
-        return insp.get_columns(table_name), insp.get_pk_constraint(table_name)['constrained_columns'][0]
-
-    async with engine.connect() as conn:
-        columns, pk_col = await conn.run_sync(_get_info)
+    meta = await service.get_table_meta(table_name)
+    columns, pk_col = meta['columns'], meta['pk_col']
 
     pk_val = int(pk_val) if pk_val.isdigit() else pk_val
     
@@ -185,7 +193,7 @@ async def get_edit_form(
     
     if not row: return HTMLResponse("Запись не найдена")
 
-    options = await service.get_form_options(table_name, columns)
+    options, typeahead = await service.get_form_options(table_name, columns, row)
 
     return templates.TemplateResponse(
         request=request,
@@ -196,10 +204,33 @@ async def get_edit_form(
             "columns": columns,
             "pk_col": pk_col,
             "pk_val": pk_val,
-            "options_map": options
+            "options_map": options,
+            "typeahead_map": typeahead
         }
     )
 
+@router.get("/tables/fk-options/{table_name}/{col_name}", response_class=HTMLResponse)
+async def get_fk_options(
+    request: Request,
+    table_name: str,
+    col_name: str,
+    q: Optional[str] = None,
+    service: AdminService = Depends(get_admin_service)
+):
+    """Варианты для поля поиска FK в модалке (HTMX typeahead)."""
+    if not await service.check_table_exists(table_name):
+        raise HTTPException(status_code=404, detail="Таблица не найдена")
+    try:
+        options = await service.search_fk_options(table_name, col_name, q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return templates.TemplateResponse(
+        request=request,
+        name="admin/partials/fk_options.html",
+        context={"options": options}
+    )
+
 @router.post("/tables/update-row/{table_name}/{pk_val}")
 async def update_table_row_modal(
     request: Request,
@@ -230,7 +261,52 @@ async def delete_table_row(
     except Exception as e:
         return HTMLResponse(status_code=200, headers={"HX-Trigger": json.dumps({"showToast": f"Ошибка: {e}"})})
 
-@router.get("/tables/export/{table_name}")
+@router.post("/tables/bulk/{table_name}", response_class=HTMLResponse, dependencies=[Depends(route_class("export"))])
+async def bulk_table_action(
+    request: Request,
+    table_name: str,
+    service: AdminService = Depends(get_admin_service)
+):
+    """
+    Массовое удаление / изменение колонки: по отмеченным строкам (ids) или по текущему поиску (q).
+    Сначала dry_run — показываем, сколько строк будет затронуто, затем подтверждение.
+    """
+    if not await service.check_table_exists(table_name):
+        raise HTTPException(status_code=404, detail="Таблица не найдена")
+
+    form = await request.form()
+    action = form.get("action", "delete")
+    scope = form.get("scope", "selected")
+    dry_run = form.get("dry_run", "true") == "true"
+    ids = form.getlist("ids") if scope == "selected" else None
+    q = form.get("q") if scope == "filter" else None
+
+    try:
+        if action == "update":
+            values = {form.get("set_col"): form.get("set_val", "")}
+            count = await service.bulk_update(table_name, values, ids=ids, q=q, dry_run=dry_run)
+        else:
+            count = await service.bulk_delete(table_name, ids=ids, q=q, dry_run=dry_run)
+    except Exception as e:
+        await service.db.rollback()
+        return HTMLResponse(f"<div class='bg-red-100 text-red-700 p-3 rounded text-sm'>Ошибка: {e}</div>", status_code=200)
+
+    if dry_run:
+        return templates.TemplateResponse(
+            request=request,
+            name="admin/partials/bulk_confirm.html",
+            context={
+                "table_name": table_name,
+                "action": action,
+                "count": count,
+                "limit": BULK_ROW_LIMIT
+            }
+        )
+
+    verb = "Изменено" if action == "update" else "Удалено"
+    return HTMLResponse("", headers={"HX-Trigger": json.dumps({"tableUpdated": True, "showToast": f"{verb} строк: {count}"})})
+
+@router.get("/tables/export/{table_name}", dependencies=[Depends(route_class("export"))])
 async def export_table_csv(
     table_name: str,
     q: Optional[str] = None,
@@ -272,7 +348,52 @@ async def export_table_csv(
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
-@router.get("/analytics/heatmap", response_class=HTMLResponse)
+@router.get("/tables/import-form/{table_name}", response_class=HTMLResponse)
+async def get_import_form(
+    request: Request,
+    table_name: str,
+    service: AdminService = Depends(get_admin_service)
+):
+    if not await service.check_table_exists(table_name):
+        raise HTTPException(status_code=404, detail="Таблица не найдена")
+    meta = await service.get_table_meta(table_name)
+    return templates.TemplateResponse(
+        request=request,
+        name="admin/partials/import_modal.html",
+        context={
+            "table_name": table_name,
+            "columns": meta['column_names']
+        }
+    )
+
+@router.post("/tables/import/{table_name}", response_class=HTMLResponse, dependencies=[Depends(route_class("export"))])
+async def import_table_csv(
+    request: Request,
+    table_name: str,
+    file: UploadFile = File(...),
+    service: AdminService = Depends(get_admin_service)
+):
+    """Массовая загрузка CSV: COPY во временную таблицу, проверка и перенос одним запросом."""
+    if not await service.check_table_exists(table_name):
+        raise HTTPException(status_code=404, detail="Таблица не найдена")
+
+    try:
+        report = await TableImportService(service.db).import_csv(table_name, file)
+        await service.invalidate_caches(table_name)
+        await service.db.commit()
+    except Exception as e:
+        await service.db.rollback()
+        return HTMLResponse(f"<div class='bg-red-100 text-red-700 p-4 rounded mb-4'>Ошибка импорта: {e}</div>", status_code=200)
+
+    return templates.TemplateResponse(
+        request=request,
+        name="admin/partials/import_result.html",
+        context={"report": report},
+        # Таблицу обновляем при закрытии модалки, иначе перерисовка скроет отчет
+        headers={"HX-Trigger": json.dumps({"showToast": f"Импортировано строк: {report['inserted']}"})}
+    )
+
+@router.get("/analytics/heatmap", response_class=HTMLResponse, dependencies=[Depends(route_class("analytics"))])
 async def get_heatmap_partial(
     request: Request,
     period: str = "all",
@@ -288,7 +409,7 @@ async def get_heatmap_partial(
         }
     )
 
-@router.get("/analytics/activity", response_class=HTMLResponse)
+@router.get("/analytics/activity", response_class=HTMLResponse, dependencies=[Depends(route_class("analytics"))])
 async def get_activity_chart(
     request: Request,
     start_date: Optional[str] = None, # Приходит как строка "YYYY-MM-DD" или ""
@@ -314,3 +435,75 @@ async def get_activity_chart(
         }
     )
 
+@router.get("/explain", response_class=HTMLResponse)
+async def explain_dashboard(
+    request: Request,
+    service: AdminService = Depends(get_admin_service),
+    user: User = Depends(get_current_user)
+):
+    """Инспектор планов: список зарегистрированных запросов сервисов."""
+    return templates.TemplateResponse(
+        request=request,
+        name="admin/explain.html",
+        context={
+            "user": user,
+            "queries": QUERY_REGISTRY
+        }
+    )
+
+@router.post("/explain/run", response_class=HTMLResponse, dependencies=[Depends(route_class("analytics"))])
+async def explain_run(
+    request: Request,
+    service: AdminService = Depends(get_admin_service)
+):
+    """EXPLAIN (ANALYZE, BUFFERS) для SQL выбранного метода сервиса; изменения откатываются."""
+    form = await request.form()
+    try:
+        result = await QueryInspectorService(service.db).inspect(form.get("query", ""), dict(form))
+    except Exception as e:
+        await service.db.rollback()
+        return HTMLResponse(f"<div class='bg-red-100 text-red-700 p-4 rounded'>Ошибка: {e}</div>", status_code=200)
+
+    return templates.TemplateResponse(
+        request=request,
+        name="admin/partials/explain_result.html",
+        context={"result": result}
+    )
+
+@router.get("/profiles", response_class=HTMLResponse)
+async def profiles_list(
+    request: Request,
+    service: AdminService = Depends(get_admin_service),
+    user: User = Depends(get_current_user)
+):
+    """Сохраненные профили запросов (?_profile=1), новые первыми."""
+    return templates.TemplateResponse(
+        request=request,
+        name="admin/profiles.html",
+        context={
+            "user": user,
+            "profiles": list_profiles()
+        }
+    )
+
+@router.get("/profiles/{profile_id}")
+async def profile_report(
+    profile_id: str,
+    service: AdminService = Depends(get_admin_service)
+):
+    """HTML-отчет профиля: icicle-график и топ функций."""
+    path = profile_file(profile_id, ".html")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, media_type="text/html")
+
+@router.get("/profiles/{profile_id}/speedscope")
+async def profile_speedscope(
+    profile_id: str,
+    service: AdminService = Depends(get_admin_service)
+):
+    """Профиль в формате speedscope для загрузки на speedscope.app."""
+    path = profile_file(profile_id, ".speedscope.json")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, media_type="application/json", filename=f"{profile_id}.speedscope.json")
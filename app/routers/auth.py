@@ -3,7 +3,7 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, Form, Request, status
 from fastapi.responses import HTMLResponse, RedirectResponse, Response
-from fastapi.templating import Jinja2Templates
+from app.core.templating import templates
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
@@ -14,9 +14,9 @@ from app.core.database import get_db
 from app.core.security import create_access_token, get_password_hash, verify_password, create_refresh_token
 from app.models import User
 from app.core.deps import check_csrf
+from app.services.rollups import CohortRollupService
 
 router = APIRouter(tags=["auth"])
-templates = Jinja2Templates(directory="app/templates")
 
 def create_login_response(user_email: str) -> RedirectResponse:
     """Создает ответ с ДВУМЯ токенами"""
@@ -98,6 +98,8 @@ async def register_user(
     
     db.add(new_user)
     try:
+        await db.flush()
+        await CohortRollupService(db).record_registration(new_user.registration_date)
         await db.commit()
     except IntegrityError:
         await db.rollback()
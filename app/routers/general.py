@@ -1,17 +1,20 @@
+import secrets
 from typing import Optional
 from pathlib import Path
 from fastapi import APIRouter, Depends, Request, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, Response
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, Response, PlainTextResponse, JSONResponse
+from app.core.templating import templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.deps import get_optional_user, get_current_user
+from app.core.metrics import render_metrics
+from app.core.warmup import warmup_state
 from app.models import User, SurveyStatus
 from app.services.survey import SurveyService, User
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 def get_survey_service(db: AsyncSession = Depends(get_db)) -> SurveyService:
     return SurveyService(db)
@@ -102,4 +105,28 @@ async def favicon():
     if not favicon_path.exists():
         return Response(status_code=404)
         
-    return FileResponse(favicon_path)
\ No newline at end of file
+    return FileResponse(favicon_path)
+
+_LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+def metrics_allowed(request: Request) -> bool:
+    """/metrics раскрывает маршруты и нагрузку: по токену, а без него — только с localhost."""
+    if settings.METRICS_TOKEN:
+        auth = request.headers.get("authorization", "")
+        return secrets.compare_digest(auth.encode(), f"Bearer {settings.METRICS_TOKEN}".encode())
+    return request.client is not None and request.client.host in _LOCAL_HOSTS
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Метрики процесса в текстовом формате Prometheus (без обращения к БД)."""
+    if not metrics_allowed(request):
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/ready", include_in_schema=False)
+async def ready():
+    """Готовность к трафику: 503, пока не закончился прогрев пула, метаданных и кэшей."""
+    return JSONResponse(
+        {"ready": warmup_state.ready, "steps": warmup_state.steps},
+        status_code=200 if warmup_state.ready else 503
+    )
@@ -4,19 +4,19 @@ import csv
 from typing import Optional
 from fastapi import APIRouter, Depends, Request, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
-from fastapi.templating import Jinja2Templates
+from app.core.templating import templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import ValidationError
 
-from app.core.database import get_db
+from app.core.database import get_db, route_class
 from app.core.deps import get_current_user
 from app.models import User
 from app.schemas import SurveyCreateForm
 from app.core.utils import parse_form_data
 from app.services.survey import SurveyService, UserRole
+from app.services.user import UserService
 
 router = APIRouter(prefix="/surveys", tags=["surveys"])
-templates = Jinja2Templates(directory="app/templates")
 
 # Зависимость сервиса
 def get_survey_service(db: AsyncSession = Depends(get_db)) -> SurveyService:
@@ -84,29 +84,20 @@ async def delete_survey(
     # Логика удаления
     await service.delete_survey(user, survey_id)
 
-    # Получение обновленных данных для HTMX (также через сервис)
-    created_count, taken_responses = await service.get_user_stats(user.user_id)
-    taken_count = len(taken_responses)
+    # Получение обновленных данных для HTMX: счетчики через COUNT и первая страница истории
+    user_service = UserService(service.db)
+    created_count, taken_count = await user_service.get_user_stats(user.user_id)
+    history, history_cursor = await user_service.get_history_page(user.user_id)
 
     # Формирование HTML (Оставляем в роутере, так как это представление)
     content = ""
     content += f'<p id="created-count" hx-swap-oob="true" class="text-3xl font-bold text-green-600 mt-2">{created_count}</p>'
     content += f'<p id="taken-count" hx-swap-oob="true" class="text-3xl font-bold text-blue-600 mt-2">{taken_count}</p>'
     
-    history_items = ""
-    if taken_responses:
-        for resp in taken_responses:
-            status = "Завершен" if resp.completed_at else "Начат"
-            status_color = "bg-green-100 text-green-700" if resp.completed_at else "bg-yellow-100 text-yellow-700"
-            history_items += f"""
-            <a href="/surveys/{resp.survey.survey_id}" class="flex justify-between items-center p-3 rounded-lg hover:bg-blue-50 transition border border-transparent hover:border-blue-100 group/item">
-                <div>
-                    <p class="font-medium text-gray-800 group-hover/item:text-blue-700">{resp.survey.title}</p>
-                    <p class="text-xs text-gray-500">{resp.started_at.strftime('%d.%m.%Y')}</p>
-                </div>
-                <span class="text-xs font-semibold px-2 py-1 rounded {status_color}">{status}</span>
-            </a>
-            """
+    if history:
+        history_items = templates.get_template("users/partials/history_items.html").render(
+            history=history, history_cursor=history_cursor
+        )
         history_html = f'<div id="history-list" hx-swap-oob="true"><div class="space-y-3">{history_items}</div></div>'
     else:
         history_html = '<div id="history-list" hx-swap-oob="true"><p class="text-gray-500 text-sm text-center py-4">Вы пока не проходили опросы.</p></div>'
@@ -114,19 +105,17 @@ async def delete_survey(
     content += history_html
     return HTMLResponse(content=content, status_code=200, headers={"HX-Trigger": json.dumps({"showToast": "Опрос удален"})})
 
-@router.get("/{survey_id}/results", response_class=HTMLResponse)
+@router.get("/{survey_id}/results", response_class=HTMLResponse, dependencies=[Depends(route_class("analytics"))])
 async def view_survey_results(
     survey_id: int,
     request: Request,
     user: User = Depends(get_current_user),
     service: SurveyService = Depends(get_survey_service)
 ):
-    data = await service.get_survey_analytics(survey_id)
+    # Аналитика + бенчмарки (кэшируются по версии данных опроса)
+    data = await service.get_survey_results(survey_id)
     if not data:
         raise HTTPException(status_code=404, detail="Опрос не найден")
-        
-    # ПОЛУЧАЕМ БЕНЧМАРКИ
-    benchmarks = await service.get_survey_benchmark_data(survey_id)
     
     return templates.TemplateResponse(
         request=request,
@@ -135,13 +124,14 @@ async def view_survey_results(
             "user": user,
             "survey": data['survey'],
             "questions_stats": data['questions'],
-            "benchmarks": benchmarks # Передаем в шаблон
+            "benchmarks": data['benchmarks']
         }
     )
 
-@router.get("/{survey_id}/export")
+@router.get("/{survey_id}/export", dependencies=[Depends(route_class("export"))])
 async def export_survey_results(
     survey_id: int,
+    layout: str = "long",
     user: User = Depends(get_current_user),
     service: SurveyService = Depends(get_survey_service)
 ):
@@ -150,6 +140,9 @@ async def export_survey_results(
     if not survey_data[0] or (survey_data[0].author_id != user.user_id and user.role != UserRole.admin):
         raise HTTPException(status_code=403, detail="Нет доступа к экспорту")
 
+    if layout == "wide":
+        return await export_survey_results_wide(survey_id, service)
+
     # 2. Получаем данные
     db_result = await service.get_survey_export_data(survey_id)
     
@@ -172,4 +165,31 @@ async def export_survey_results(
     )
     filename = f"results_survey_{survey_id}.csv"
     response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-    return response
\ No newline at end of file
+    return response
+
+async def export_survey_results_wide(survey_id: int, service: SurveyService) -> StreamingResponse:
+    """Потоковый CSV: одна строка на респондента, одна колонка на вопрос."""
+    header, rows = await service.get_survey_export_wide(survey_id)
+
+    async def iter_csv():
+        output = io.StringIO()
+        writer = csv.writer(output)
+
+        writer.writerow(header)
+        # Только первый чанк кодируем с BOM (utf-8-sig) для Excel
+        yield output.getvalue().encode("utf-8-sig")
+        output.seek(0)
+        output.truncate(0)
+
+        async for row in rows:
+            writer.writerow(row)
+            yield output.getvalue().encode("utf-8")
+            output.seek(0)
+            output.truncate(0)
+
+    filename = f"results_survey_{survey_id}_wide.csv"
+    return StreamingResponse(
+        iter_csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
@@ -1,49 +1,37 @@
+from typing import Optional
 from fastapi import APIRouter, Depends, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from app.core.templating import templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
 
 from app.core.deps import get_current_user
 from app.core.database import get_db
 from app.core.security import verify_password, get_password_hash
-from app.models import User, Survey, SurveyResponse, Country
+from app.models import User
 from app.schemas import UserProfileUpdate
+from app.services.user import UserService
 
 router = APIRouter(prefix="/users", tags=["users"])
-templates = Jinja2Templates(directory="app/templates")
+
+def get_user_service(db: AsyncSession = Depends(get_db)) -> UserService:
+    return UserService(db)
 
 @router.get("/me", response_class=HTMLResponse)
 async def read_users_me(
     request: Request,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    service: UserService = Depends(get_user_service)
 ):
     """Profile page with stats."""
     
-    # 1. Загружаем созданные опросы (сортируем по дате)
-    created_surveys_query = (
-        select(Survey)
-        .where(Survey.author_id == current_user.user_id)
-        .order_by(Survey.created_at.desc())
-    )
-    created_surveys = (await db.execute(created_surveys_query)).scalars().all()
-    created_count = len(created_surveys)
-
-    # 2. Загружаем пройденные опросы (уникальные по survey_id)
-    # Нам нужно название опроса, поэтому делаем join или подгружаем связь
-    # Важно: берем только completed_at IS NOT NULL, если считаем только завершенные
-    taken_surveys_query = (
-        select(SurveyResponse)
-        .where(SurveyResponse.user_id == current_user.user_id)
-        .options(selectinload(SurveyResponse.survey)) # Грузим сам опрос
-        .order_by(SurveyResponse.started_at.desc())
-    )
-    taken_responses = (await db.execute(taken_surveys_query)).scalars().all()
-    taken_count = len(taken_responses)
+    # 1. Счетчики через COUNT (без загрузки всех строк)
+    created_count, taken_count = await service.get_user_stats(current_user.user_id)
+
+    # 2. Первые страницы списков, остальное догружается через HTMX (keyset-курсоры)
+    created_surveys, created_cursor = await service.get_created_surveys_page(current_user.user_id)
+    history, history_cursor = await service.get_history_page(current_user.user_id)
 
-    countries = (await db.execute(select(Country).order_by(Country.name))).scalars().all()
+    countries = await service.get_countries()
 
     return templates.TemplateResponse(
         request=request,
@@ -51,13 +39,51 @@ async def read_users_me(
         context={
             "user": current_user,
             "created_surveys": created_surveys,
+            "created_cursor": created_cursor,
             "created_count": created_count,
-            "taken_responses": taken_responses,
+            "history": history,
+            "history_cursor": history_cursor,
             "taken_count": taken_count,
             "countries": countries
         }
     )
 
+@router.get("/me/history", response_class=HTMLResponse)
+async def read_history_page(
+    request: Request,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    service: UserService = Depends(get_user_service)
+):
+    """Следующая страница истории прохождений (HTMX фрагмент)."""
+    history, history_cursor = await service.get_history_page(current_user.user_id, cursor)
+    return templates.TemplateResponse(
+        request=request,
+        name="users/partials/history_items.html",
+        context={
+            "history": history,
+            "history_cursor": history_cursor
+        }
+    )
+
+@router.get("/me/surveys", response_class=HTMLResponse)
+async def read_created_surveys_page(
+    request: Request,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    service: UserService = Depends(get_user_service)
+):
+    """Следующая страница созданных опросов (HTMX фрагмент)."""
+    created_surveys, created_cursor = await service.get_created_surveys_page(current_user.user_id, cursor)
+    return templates.TemplateResponse(
+        request=request,
+        name="users/partials/created_items.html",
+        context={
+            "created_surveys": created_surveys,
+            "created_cursor": created_cursor
+        }
+    )
+
 
 # --- Смена пароля ---
 
@@ -1,13 +1,83 @@
+import base64
+import binascii
+import json
 from datetime import datetime, date
 from typing import Optional, Dict, List, Any, Tuple
+import numpy as np
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import (
-    text, inspect, select, func, desc, extract, case,
-    cast, Date, Numeric, column, table, insert
+    text, select, func, desc, case,
+    column, table, insert
 )
-from app.core.database import engine
 from app.core.security import get_password_hash
 from app.models import User, Survey, SurveyResponse, Tag, survey_tags
+from app.services.rollups import ActivityRollupService, CohortRollupService, DurationStatsService, DURATION_MIN_SAMPLES
+from app.services.schema_registry import schema_registry
+from app.services.table_search import build_search_condition, classify_column, int_fits_column
+from app.services.user import countries_cache
+
+# Таблицы, правка которых влияет на страницу результатов опросов
+RESULTS_TABLES = {
+    "surveys", "questions", "options", "survey_responses",
+    "user_answers", "users", "tags", "survey_tags"
+}
+
+# Ниже этой оценки считаем строки точно: COUNT(*) по маленькой выборке дешевый
+EXACT_COUNT_THRESHOLD = 10_000
+
+# Справочники больше этой оценки не грузим в форму целиком, а ищем по мере ввода
+FK_PRELOAD_LIMIT = 200
+FK_SEARCH_LIMIT = 20
+# С какой длины ввода ищем вхождение (%q%), а не только начало строки
+FK_CONTAINS_MIN_CHARS = 3
+
+# Защита от случайной массовой операции по всей большой таблице
+BULK_ROW_LIMIT = 10_000
+
+# Поля строки, от которых зависят rollup-таблицы: снимок до и после правки одной строки
+# позволяет пересчитать только затронутые ячейки, а не всю таблицу
+ROLLUP_SNAPSHOT_SQL = {
+    "survey_responses": """
+        SELECT sr.response_id, sr.survey_id, sr.user_id, sr.started_at, sr.completed_at, u.registration_date
+        FROM survey_responses sr
+        LEFT JOIN users u ON u.user_id = sr.user_id
+        WHERE sr.response_id = :pk
+    """,
+    "users": """
+        SELECT
+            u.user_id,
+            u.registration_date,
+            ARRAY(
+                SELECT DISTINCT CAST(date_trunc('month', sr.completed_at) AS date)
+                FROM survey_responses sr
+                WHERE sr.user_id = u.user_id AND sr.completed_at IS NOT NULL
+            ) AS activity_months
+        FROM users u
+        WHERE u.user_id = :pk
+    """,
+}
+
+# Прохождение быстрее этой доли от среднего времени опроса считается аномальным
+ANOMALY_SPEED_RATIO = 0.3
+
+# Шаг графика активности по длине периода (дней): до ~90 точек по дням, ~104 по неделям,
+# дальше по месяцам — размер данных для Plotly не растет с глубиной истории
+ACTIVITY_DAY_MAX_SPAN = 92
+ACTIVITY_WEEK_MAX_SPAN = 730
+
+
+def choose_activity_bucket(start_date: Optional[date], end_date: Optional[date]) -> str:
+    """Единица date_trunc для графика активности: day, week или month."""
+    if start_date is None or end_date is None:
+        return "day"
+    span = (end_date - start_date).days
+    if span <= ACTIVITY_DAY_MAX_SPAN:
+        return "day"
+    if span <= ACTIVITY_WEEK_MAX_SPAN:
+        return "week"
+    return "month"
+
 
 class AdminService:
     def __init__(self, db: AsyncSession):
@@ -18,15 +88,8 @@ class AdminService:
         summary_res = await self.db.execute(text("SELECT * FROM v_admin_summary"))
         stats = summary_res.mappings().one()
         
-        # 3. Активность по дням
-        activity_res = await self.db.execute(
-            select(
-                func.date(SurveyResponse.started_at).label("date"),
-                func.count(SurveyResponse.response_id).label("cnt")
-            ).group_by(func.date(SurveyResponse.started_at))
-             .order_by(func.date(SurveyResponse.started_at))
-        )
-        activity_rows = activity_res.all()
+        # 3. Активность за все время (шаг графика подбирается по длине периода)
+        time_series = await self.get_activity_stats()
 
         # 4. Популярные теги
         tags_res = await self.db.execute(
@@ -43,13 +106,11 @@ class AdminService:
         tags_rows = tags_res.all()
 
         # 5. Тепловая карта
-        heatmap_res = await self.db.execute(
-            select(
-                extract('isodow', SurveyResponse.started_at).label("dow"),
-                extract('hour', SurveyResponse.started_at).label("hour"),
-                func.count(SurveyResponse.response_id).label("cnt")
-            ).group_by("dow", "hour")
-        )
+        heatmap_res = await self.db.execute(text("""
+            SELECT EXTRACT(ISODOW FROM hour_bucket) AS dow, EXTRACT(HOUR FROM hour_bucket) AS hour, SUM(starts) AS cnt
+            FROM activity_hourly
+            GROUP BY 1, 2
+        """))
         heatmap_rows = heatmap_res.all()
 
         # Демография (теперь через простую View)
@@ -90,10 +151,7 @@ class AdminService:
                     int(stats['unique_users_completed'])
                 ]
             },
-            "time_series": {
-                "dates": [str(row.date) for row in activity_rows],
-                "counts": [int(row.cnt) for row in activity_rows]
-            },
+            "time_series": time_series,
             "tags": {
                 "labels": [str(row.name) for row in tags_rows],
                 "counts": [int(row.popularity) for row in tags_rows]
@@ -114,25 +172,29 @@ class AdminService:
         Получает данные для тепловой карты с учетом фильтра по времени.
         period: '7d', '30d', 'year'
         """
+        # Почасовой rollup: стоимость зависит от длины периода, а не от числа прохождений
         sql = """
-            SELECT day_of_week, hour_of_day, COUNT(*) as cnt
-            FROM v_activity_time_slots
+            SELECT EXTRACT(ISODOW FROM hour_bucket)::INT AS day_of_week,
+                   EXTRACT(HOUR FROM hour_bucket)::INT AS hour_of_day,
+                   SUM(starts) AS cnt
+            FROM activity_hourly
         """
         
         conditions = []
 
+        # Условия по самой колонке hour_bucket — используется индекс PK
         if period == '7d':
-            conditions.append("full_timestamp >= NOW() - INTERVAL '7 days'")
+            conditions.append("hour_bucket >= date_trunc('hour', NOW() - INTERVAL '7 days')")
         elif period == '30d':
-            conditions.append("full_timestamp >= NOW() - INTERVAL '30 days'")
+            conditions.append("hour_bucket >= date_trunc('hour', NOW() - INTERVAL '30 days')")
         elif period == 'year':
             # Текущий календарный год (с 1 января)
-            conditions.append("EXTRACT(YEAR FROM full_timestamp) = EXTRACT(YEAR FROM NOW())")
+            conditions.append("hour_bucket >= date_trunc('year', NOW())")
             
         if conditions:
             sql += " WHERE " + " AND ".join(conditions)
         
-        sql += " GROUP BY day_of_week, hour_of_day"
+        sql += " GROUP BY 1, 2"
     
         res = await self.db.execute(text(sql))
         rows = res.all()
@@ -153,17 +215,41 @@ class AdminService:
         }
 
     async def get_anomalies(self, survey_id: Optional[int] = None):
-        """Поиск аномально быстрых прохождений."""
-        sql = "SELECT * FROM v_anomaly_candidates WHERE speed_ratio < 0.3"
-
-        params = {}
+        """
+        Поиск аномально быстрых прохождений: длительность сравнивается с текущим
+        средним опроса из survey_duration_stats. Для каждого опроса — диапазон по индексу
+        (survey_id, duration) до порога, без агрегатов по survey_responses.
+        """
+        where = "ds.n >= :min_samples AND ds.mean > 0"
+        params = {"min_samples": DURATION_MIN_SAMPLES, "ratio": ANOMALY_SPEED_RATIO}
         if survey_id:
-            sql += " AND survey_id = :sid"
+            where += " AND ds.survey_id = :sid"
             params["sid"] = survey_id
-            
-        sql += " ORDER BY speed_ratio ASC LIMIT 50"
-        
-        res = await self.db.execute(text(sql), params)
+
+        res = await self.db.execute(text(f"""
+            SELECT
+                u.full_name AS user_name,
+                u.email AS user_email,
+                s.title AS survey_title,
+                a.user_duration_sec,
+                ds.mean AS survey_avg_sec,
+                CASE WHEN ds.m2 > 0
+                    THEN (a.user_duration_sec - ds.mean) / sqrt(ds.m2 / (ds.n - 1)) END AS duration_zscore
+            FROM survey_duration_stats ds
+            CROSS JOIN LATERAL (
+                SELECT sr.user_id, EXTRACT(EPOCH FROM sr.duration) AS user_duration_sec
+                FROM survey_responses sr
+                WHERE sr.survey_id = ds.survey_id AND sr.completed_at IS NOT NULL
+                  AND sr.duration < make_interval(secs => ds.mean * :ratio)
+                ORDER BY sr.duration
+                LIMIT 50
+            ) a
+            JOIN surveys s ON s.survey_id = ds.survey_id
+            LEFT JOIN users u ON u.user_id = a.user_id
+            WHERE {where}
+            ORDER BY a.user_duration_sec / ds.mean ASC
+            LIMIT 50
+        """), params)
 
         anomalies = []
         for r in res.mappings().all():
@@ -172,149 +258,281 @@ class AdminService:
                 "email": r["user_email"],
                 "title": r["survey_title"],
                 "user_sec": r["user_duration_sec"],
-                "avg_sec": r["survey_avg_sec"]
+                "avg_sec": r["survey_avg_sec"],
+                "zscore": r["duration_zscore"]
             })
         return anomalies
 
+    async def get_response_flags(self, survey_id: Optional[int] = None):
+        """Прохождения, помеченные пакетным детектором (scripts/detect_fraud.py), по убыванию оценки."""
+        where = "WHERE survey_id = :sid" if survey_id else ""
+        params = {"sid": survey_id} if survey_id else {}
+
+        res = await self.db.execute(text(f"""
+            SELECT
+                u.full_name AS user_name,
+                u.email AS user_email,
+                s.title AS survey_title,
+                host(sr.ip_address) AS ip,
+                f.score, f.straightline, f.ip_burst, f.completion_burst, f.duplicate_text
+            FROM (
+                SELECT * FROM response_flags
+                {where}
+                ORDER BY score DESC
+                LIMIT 50
+            ) f
+            JOIN survey_responses sr ON sr.response_id = f.response_id
+            JOIN surveys s ON s.survey_id = f.survey_id
+            LEFT JOIN users u ON u.user_id = sr.user_id
+            ORDER BY f.score DESC
+        """), params)
+
+        flags = []
+        for r in res.mappings().all():
+            signals = []
+            if r["straightline"] is not None:
+                signals.append(f"одна позиция ответа ({r['straightline']:.0%})")
+            if r["ip_burst"] is not None:
+                signals.append(f"IP: {r['ip_burst']} прохождений подряд")
+            if r["completion_burst"] is not None:
+                signals.append(f"всплеск завершений ({r['completion_burst']}/мин)")
+            if r["duplicate_text"] is not None:
+                signals.append(f"одинаковый текст у {r['duplicate_text']}")
+            flags.append({
+                "full_name": r["user_name"],
+                "email": r["user_email"],
+                "title": r["survey_title"],
+                "ip": r["ip"],
+                "score": r["score"],
+                "signals": signals
+            })
+        return flags
+
     async def get_all_surveys(self):
         return (await self.db.execute(select(Survey).order_by(Survey.title))).scalars().all()
 
     async def get_table_names(self):
-        def _inspect(conn):
-            return inspect(conn).get_table_names()
-        async with engine.connect() as conn:
-            names = await conn.run_sync(_inspect)
-        names.sort()
-        return names
+        return await schema_registry.get_table_names()
 
     async def check_table_exists(self, table_name: str) -> bool:
-        def _check(conn):
-            return inspect(conn).has_table(table_name)
-        async with engine.connect() as conn:
-            return await conn.run_sync(_check)
+        return await schema_registry.has_table(table_name)
 
-    async def get_paginated_table_data(self, table_name: str, page: int, limit: int, q: Optional[str]):
-        """Основная логика получения данных таблицы с поиском и пагинацией."""
-        
-        # 1. Интроспекция (Колонки и FK)
-        def _get_meta(conn):
-            inspector = inspect(conn)
-            pk_constraint = inspector.get_pk_constraint(table_name)
-            pk_cols = pk_constraint['constrained_columns']
-            columns_data = inspector.get_columns(table_name)
-            fks = inspector.get_foreign_keys(table_name)
-            return columns_data, pk_cols, fks
-
-        async with engine.connect() as conn:
-            columns_data, pk_cols, fks = await conn.run_sync(_get_meta)
-
-        columns = [c['name'] for c in columns_data]
-        pk_col = pk_cols[0] if pk_cols else None
-        pk_col_idx = columns.index(pk_col) if pk_col and pk_col in columns else 0
+    async def get_table_meta(self, table_name: str) -> Dict[str, Any]:
+        """Метаданные таблицы из кэша (колонки, PK, FK, колонка отображения)."""
+        return await schema_registry.require_table(table_name)
 
-        # 2. Построение запроса (Поиск)
-        where_clause = ""
-        params = {}
-        
-        if q and q.strip():
-            params["search_q"] = f"%{q.strip()}%"
-            search_filters = []
+    async def build_search_clause(self, meta: Dict[str, Any], q: Optional[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Условие поиска по таблице (без WHERE) и параметры к нему.
+        Возвращает (None, {}), если поиск не задан. Правила см. в build_search_condition.
+        """
+        return await build_search_condition(meta, q, schema_registry.get_table)
 
-            # А. Поиск по колонкам текущей таблицы
-            for col in columns_data:
-                search_filters.append(f'"{col["name"]}"::text ILIKE :search_q')
-            
-            # Б. Поиск по связанным таблицам (Foreign Keys) - НОВАЯ ЛОГИКА
-            # Мы генерируем подзапросы: 
-            # OR local_id IN (SELECT id FROM remote_table WHERE name ILIKE '%q%')
-            if fks:
-                async with engine.connect() as conn:
-                    for fk in fks:
-                        local_col = fk['constrained_columns'][0]
-                        remote_table = fk['referred_table']
-                        remote_pk = fk['referred_columns'][0]
-
-                        # Инспектируем удаленную таблицу, чтобы найти текстовое поле
-                        def _get_remote_cols(c): return inspect(c).get_columns(remote_table)
-                        remote_cols = await conn.run_sync(_get_remote_cols)
-                        
-                        display_col = None
-                        # Пытаемся найти колонку с названием
-                        for rc in remote_cols:
-                            if rc['name'] in ['name', 'title', 'full_name', 'email', 'label', 'question_text', 'option_text', 'text']:
-                                display_col = rc['name']
-                                break
-                        
-                        # Если нашли подходящую колонку в связанной таблице, добавляем поиск по ней
-                        if display_col:
-                            subquery = f'"{local_col}" IN (SELECT "{remote_pk}" FROM "{remote_table}" WHERE "{display_col}"::text ILIKE :search_q)'
-                            search_filters.append(subquery)
-
-            if search_filters:
-                where_clause = "WHERE " + " OR ".join(search_filters)
-
-        # 3. Выполнение запросов (Count + Select)
-        offset = (page - 1) * limit
-        order_col = pk_col if pk_col else columns[0] # Fallback сортировка
+    async def estimate_count(self, table_name: str, condition: Optional[str], params: Dict[str, Any]) -> Optional[int]:
+        """
+        Оценка числа строк без сканирования таблицы:
+        без фильтра — pg_class.reltuples, с фильтром — оценка планировщика из EXPLAIN.
+        None, если оценки нет (таблица ни разу не анализировалась).
+        """
+        if not condition:
+            res = await self.db.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"),
+                {"t": f'"{table_name}"'}
+            )
+            estimate = res.scalar()
+            return int(estimate) if estimate is not None and estimate >= 0 else None
 
-        try:
-            count_sql = text(f'SELECT COUNT(*) FROM "{table_name}" {where_clause}')
-            total_rows = (await self.db.execute(count_sql, params)).scalar()
+        res = await self.db.execute(
+            text(f'EXPLAIN (FORMAT JSON) SELECT 1 FROM "{table_name}" WHERE {condition}'), params
+        )
+        plan = res.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
 
-            data_sql = text(f'SELECT * FROM "{table_name}" {where_clause} ORDER BY "{order_col}" LIMIT {limit} OFFSET {offset}')
-            rows = (await self.db.execute(data_sql, params)).all()
-        except Exception as e:
-            raise e
+    async def count_rows(self, table_name: str, condition: Optional[str], params: Dict[str, Any], exact: bool = False) -> Tuple[int, bool]:
+        """
+        Число строк для пагинации: (количество, это_оценка).
+        Точный COUNT(*) выполняется по запросу или когда оценка мала и COUNT дешевый.
+        """
+        if not exact:
+            estimate = await self.estimate_count(table_name, condition, params)
+            if estimate is not None and estimate > EXACT_COUNT_THRESHOLD:
+                return estimate, True
+
+        where_clause = f"WHERE {condition}" if condition else ""
+        count_sql = text(f'SELECT COUNT(*) FROM "{table_name}" {where_clause}')
+        return (await self.db.execute(count_sql, params)).scalar(), False
+
+    @staticmethod
+    def encode_pk_cursor(values: List[Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+    @staticmethod
+    def decode_pk_cursor(cursor: str, meta: Dict[str, Any]) -> List[Any]:
+        """Декодирует курсор и приводит значения к типам колонок PK (asyncpg строг к типам)."""
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(meta['pk_cols']):
+            raise ValueError("Некорректный курсор")
+        typed = []
+        for col, val in zip(meta['pk_cols'], values):
+            col_type = str(meta['col_types'].get(col, '')).upper()
+            typed.append(int(val) if 'INT' in col_type else val)
+        return typed
+
+    async def build_fk_display_joins(self, fks: List[Dict[str, Any]]) -> Tuple[str, str, List[str]]:
+        """
+        Части запроса для подписей внешних ключей по кэшу метаданных:
+        (доп. колонки SELECT, LEFT JOIN-ы к связанным таблицам, локальные колонки FK по порядку).
+        Ожидает, что основная выборка доступна под алиасом page.
+        """
+        select_parts, join_parts, fk_cols = [], [], []
+        for i, fk in enumerate(fks):
+            local_col = fk['constrained_columns'][0]
+            remote_table = fk['referred_table']
+            remote_col = fk['referred_columns'][0]
+
+            remote_meta = await schema_registry.get_table(remote_table)
+            display_col = (remote_meta and remote_meta['display_col']) or remote_col
+
+            select_parts.append(f', fk{i}."{display_col}"')
+            join_parts.append(f' LEFT JOIN "{remote_table}" AS fk{i} ON fk{i}."{remote_col}" = page."{local_col}"')
+            fk_cols.append(local_col)
+        return "".join(select_parts), "".join(join_parts), fk_cols
+
+    async def get_paginated_table_data(
+        self,
+        table_name: str,
+        page: int,
+        limit: int,
+        q: Optional[str],
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        exact_count: bool = False
+    ):
+        """
+        Основная логика получения данных таблицы с поиском и пагинацией.
+
+        При наличии PK используется keyset-пагинация (курсоры after/before —
+        значения PK крайних строк), поэтому глубокие страницы не сканируют
+        пропущенные строки. Прямой переход на номер страницы и таблицы без PK
+        работают через OFFSET. Общее количество по умолчанию оценочное.
+        """
+        
+        # 1. Метаданные (Колонки и FK) из кэша
+        meta = await self.get_table_meta(table_name)
+        fks = meta['fks']
+
+        columns = meta['column_names']
+        pk_col = meta['pk_col']
+        pk_col_idx = columns.index(pk_col) if pk_col and pk_col in columns else 0
+        pk_cols = meta['pk_cols']
 
-        # 4. Резолвинг внешних ключей (Красивые имена вместо ID) - Оставляем как есть
+        # 2. Построение запроса (Поиск)
+        search_condition, search_params = await self.build_search_clause(meta, q)
+        conditions = [search_condition] if search_condition else []
+        params = dict(search_params)
+
+        # 3. Keyset / OFFSET
+        order_cols = pk_cols or [columns[0]] # Fallback сортировка
+        order_expr = ", ".join(f'"{c}"' for c in order_cols)
+        descending = False
+        offset = 0
+
+        cursor = before or after
+        if pk_cols and cursor:
+            key_values = self.decode_pk_cursor(cursor, meta)
+            placeholders = []
+            for i, val in enumerate(key_values):
+                params[f"k{i}"] = val
+                placeholders.append(f":k{i}")
+            op = "<" if before else ">"
+            conditions.append(f"({order_expr}) {op} ({', '.join(placeholders)})")
+            descending = bool(before)
+        elif page > 1:
+            offset = (page - 1) * limit
+
+        where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+        direction = " DESC" if descending else ""
+        order_by = ", ".join(f'"{c}"{direction}' for c in order_cols)
+
+        # Берем на одну строку больше, чтобы понять, есть ли следующая страница.
+        # Подписи для FK (имя вместо ID) подтягиваем тем же запросом: страница
+        # выбирается во вложенном запросе, а к ней LEFT JOIN-ятся связанные таблицы
+        page_sql = f'SELECT * FROM "{table_name}" {where_clause} ORDER BY {order_by} LIMIT {limit + 1} OFFSET {offset}'
+        fk_select, fk_joins, fk_cols = await self.build_fk_display_joins(fks)
+        outer_order = ", ".join(f'page."{c}"{direction}' for c in order_cols)
+        data_sql = text(
+            f'SELECT page.*{fk_select} FROM ({page_sql}) AS page{fk_joins} ORDER BY {outer_order}'
+        )
+        result_rows = (await self.db.execute(data_sql, params)).all()
+
+        n_cols = len(columns)
+        rows = [tuple(r[:n_cols]) for r in result_rows]
         resolved_data = {}
-        if rows and fks:
-            async with engine.connect() as conn:
-                for fk in fks:
-                    local_col = fk['constrained_columns'][0]
-                    col_idx = columns.index(local_col)
-                    
-                    ids_to_fetch = {row[col_idx] for row in rows if row[col_idx] is not None}
-                    
-                    if not ids_to_fetch: continue
-
-                    remote_table = fk['referred_table']
-                    remote_col = fk['referred_columns'][0]
-                    
-                    def _get_ref_cols(c): return inspect(c).get_columns(remote_table)
-                    ref_cols = await conn.run_sync(_get_ref_cols)
-                    display_col = remote_col
-                    for rc in ref_cols:
-                        if rc['name'] in ['full_name', 'title', 'name', 'label', 'email', 'question_text', 'option_text', 'text']:
-                            display_col = rc['name']
-                            break
-                    
-                    try:
-                        ids_list = list(ids_to_fetch)
-                        q_resolve = text(f'SELECT "{remote_col}", "{display_col}" FROM "{remote_table}" WHERE "{remote_col}" = ANY(:ids)')
-                        res = await conn.execute(q_resolve, {"ids": ids_list})
-                        resolved_data[local_col] = {r[0]: str(r[1]) for r in res.all()}
-                    except Exception:
-                        pass 
+        for i, local_col in enumerate(fk_cols):
+            col_idx = columns.index(local_col)
+            labels = {
+                r[col_idx]: str(r[n_cols + i])
+                for r in result_rows[:limit] if r[col_idx] is not None and r[n_cols + i] is not None
+            }
+            if labels:
+                resolved_data[local_col] = labels
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if descending:
+            rows.reverse()
+            has_prev, has_next = has_more, True
+        else:
+            has_prev, has_next = bool(after) or page > 1, has_more
+
+        total_rows, total_is_estimate = await self.count_rows(table_name, search_condition, search_params, exact_count)
+
+        next_cursor = prev_cursor = None
+        row_keys: List[Any] = []
+        if pk_cols and rows:
+            pk_indexes = [columns.index(c) for c in pk_cols]
+            # Ключ строки для массовых операций: составной PK кодируется так же, как курсор
+            if len(pk_cols) > 1:
+                row_keys = [self.encode_pk_cursor([row[i] for i in pk_indexes]) for row in rows]
+            else:
+                row_keys = [row[pk_indexes[0]] for row in rows]
+            if has_next:
+                next_cursor = self.encode_pk_cursor([rows[-1][i] for i in pk_indexes])
+            if has_prev:
+                prev_cursor = self.encode_pk_cursor([rows[0][i] for i in pk_indexes])
 
         return {
             "columns": columns,
             "rows": rows,
             "pk_col": pk_col,
             "pk_col_idx": pk_col_idx,
-            "total_pages": (total_rows + limit - 1) // limit,
+            "pk_cols": pk_cols,
+            "row_keys": row_keys,
+            "total_rows": total_rows,
+            "total_is_estimate": total_is_estimate,
+            "total_pages": max((total_rows + limit - 1) // limit, 1),
+            "has_next": has_next,
+            "has_prev": has_prev,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
             "resolved_data": resolved_data
         }
 
-    async def get_form_options(self, table_name: str, columns_info=None):
-        """Собирает опции для выпадающих списков."""
+    async def get_form_options(self, table_name: str, columns_info=None, row=None):
+        """
+        Собирает опции для выпадающих списков.
+        Возвращает (options_map, typeahead_map): во втором — FK-колонки на большие таблицы
+        с подписью текущего значения (row — редактируемая строка).
+        """
         options_map = {}
         
-        # Если columns_info не переданы, получаем их
+        meta = await self.get_table_meta(table_name)
+
+        # Если columns_info не переданы, берем из кэша метаданных
         if not columns_info:
-             def _get_cols(c): return inspect(c).get_columns(table_name)
-             async with engine.connect() as conn:
-                 columns_info = await conn.run_sync(_get_cols)
+            columns_info = meta['columns']
 
         # 1. Хардкод значений (для Enum)
         for col in columns_info:
@@ -333,42 +551,102 @@ class AdminService:
                     options_map[col_name] = [v.strip().strip("'") for v in content.split(",")]
                 except: pass
 
-        # 2. Foreign Keys
-        def _get_fks(c): return inspect(c).get_foreign_keys(table_name)
-        async with engine.connect() as conn:
-            try:
-                fks = await conn.run_sync(_get_fks)
-                for fk in fks:
-                    col_name = fk['constrained_columns'][0]
-                    ref_table = fk['referred_table']
-                    ref_col = fk['referred_columns'][0]
-                    
-                    # Ищем display column
-                    def _get_ref(c): return inspect(c).get_columns(ref_table)
-                    ref_cols = await conn.run_sync(_get_ref)
-                    display_col = ref_col
-                    for c in ref_cols:
-                        if c['name'] in ['name', 'title', 'full_name', 'email', 'label']:
-                            display_col = c['name']
-                            break
-                    
-                    query = text(f'SELECT "{ref_col}", "{display_col}" FROM "{ref_table}" LIMIT 100')
-                    res = await conn.execute(query)
-                    options_map[col_name] = res.all()
-            except Exception as e:
-                print(f"FK Load Error: {e}")
-
-        return options_map
+        # 2. Foreign Keys: маленькие справочники грузим целиком,
+        # для больших таблиц форма использует поиск (search_fk_options)
+        typeahead_map = {}
+        try:
+            for fk in meta['fks']:
+                col_name = fk['constrained_columns'][0]
+                ref_table = fk['referred_table']
+                ref_col = fk['referred_columns'][0]
+                
+                # Display column из кэша метаданных
+                ref_meta = await schema_registry.get_table(ref_table)
+                display_col = (ref_meta and ref_meta['display_col']) or ref_col
+
+                estimate = await self.estimate_count(ref_table, None, {})
+                if estimate is not None and estimate > FK_PRELOAD_LIMIT:
+                    current = row.get(col_name) if row else None
+                    typeahead_map[col_name] = await self.get_fk_label(ref_table, ref_col, display_col, current)
+                    continue
+
+                query = text(
+                    f'SELECT "{ref_col}", "{display_col}" FROM "{ref_table}" '
+                    f'ORDER BY "{display_col}" LIMIT {FK_PRELOAD_LIMIT}'
+                )
+                res = await self.db.execute(query)
+                options_map[col_name] = res.all()
+        except Exception as e:
+            print(f"FK Load Error: {e}")
+
+        return options_map, typeahead_map
+
+    async def get_fk_label(self, ref_table: str, ref_col: str, display_col: str, value: Any) -> str:
+        """Подпись текущего значения FK для поля поиска в форме редактирования."""
+        if value is None:
+            return ""
+        res = await self.db.execute(
+            text(f'SELECT "{display_col}" FROM "{ref_table}" WHERE "{ref_col}" = :v'), {"v": value}
+        )
+        label = res.scalar()
+        return str(label) if label is not None else str(value)
+
+    async def search_fk_options(self, table_name: str, col_name: str, q: Optional[str], limit: int = FK_SEARCH_LIMIT) -> List[Any]:
+        """
+        Поиск значений для FK-поля формы по колонке отображения связанной таблицы.
+        Совпадения с начала строки идут первыми; ILIKE обслуживается триграммным индексом.
+        """
+        meta = await self.get_table_meta(table_name)
+        fk = next((fk for fk in meta['fks'] if fk['constrained_columns'][0] == col_name), None)
+        if fk is None:
+            raise ValueError(f"Колонка {col_name} не является внешним ключом")
+
+        ref_table, ref_col = fk['referred_table'], fk['referred_columns'][0]
+        ref_meta = await schema_registry.get_table(ref_table)
+        display_col = (ref_meta and ref_meta['display_col']) or ref_col
+        col_types = ref_meta['col_types'] if ref_meta else {}
+
+        q = (q or "").strip()
+        if not q:
+            sql = f'SELECT "{ref_col}", "{display_col}" FROM "{ref_table}" ORDER BY "{ref_col}" LIMIT :limit'
+            return (await self.db.execute(text(sql), {"limit": limit})).all()
+
+        # ILIKE только по текстовой колонке отображения (у survey_responses ее нет — ищем по id)
+        text_display = classify_column(col_types.get(display_col)) == "text"
+        params: Dict[str, Any] = {"prefix": f"{q}%", "limit": limit}
+        conditions = []
+        if text_display:
+            # Триграммы не помогают при 1-2 символах: короткий ввод ищем только с начала строки
+            if len(q) >= FK_CONTAINS_MIN_CHARS:
+                conditions.append(f'"{display_col}" ILIKE :contains')
+                params["contains"] = f"%{q}%"
+            else:
+                conditions.append(f'"{display_col}" ILIKE :prefix')
+
+        ref_type = col_types.get(ref_col)
+        if q.isdigit() and classify_column(ref_type) == "int" and int_fits_column(ref_type, int(q)):
+            conditions.append(f'"{ref_col}" = :id')
+            params["id"] = int(q)
+
+        if not conditions:
+            return []
+
+        order = f'("{display_col}" ILIKE :prefix) DESC, "{display_col}"' if text_display else f'"{ref_col}"'
+        if not text_display:
+            params.pop("prefix")
+        sql = (
+            f'SELECT "{ref_col}", "{display_col}" FROM "{ref_table}" '
+            f'WHERE {" OR ".join(conditions)} '
+            f'ORDER BY {order} LIMIT :limit'
+        )
+        return (await self.db.execute(text(sql), params)).all()
 
     async def create_row(self, table_name: str, form_data: dict):
         pk_col_name = form_data.pop("pk_col_name", None)
         form_data.pop("csrf_token", None)
 
-        def _get_types(c):
-            return {col['name']: col['type'] for col in inspect(c).get_columns(table_name)}
-        
-        async with engine.connect() as conn:
-            col_types = await conn.run_sync(_get_types)
+        meta = await self.get_table_meta(table_name)
+        col_types = meta['col_types']
         
         params = {}
         for col, val in form_data.items():
@@ -400,19 +678,36 @@ class AdminService:
             dynamic_table = table(table_name, *columns)
             
             stmt = insert(dynamic_table).values(params)
-            
-            await self.db.execute(stmt)
+            pk_col = meta['pk_col']
+            if pk_col:
+                stmt = stmt.returning(column(pk_col))
+
+            res = await self.db.execute(stmt)
+            if pk_col:
+                after = await self.snapshot_rollup_row(table_name, res.scalar())
+                await self.apply_row_change(table_name, None, after)
+            await self.invalidate_caches(table_name, rebuild_rollups=not pk_col)
             await self.db.commit()
 
-    async def update_row(self, table_name: str, pk_val: int, form_data: dict):
-        def _get_meta(c): 
-            insp = inspect(c)
-            pk = insp.get_pk_constraint(table_name)['constrained_columns'][0]
-            types = {col['name']: col['type'] for col in insp.get_columns(table_name)}
-            return pk, types
+    @staticmethod
+    def coerce_value(col: str, val: Any, col_types: Dict[str, Any]) -> Any:
+        """Приводит значение из формы к типу колонки (как при редактировании строки)."""
+        if val == "" or val == "NULL":
+            return None
+        col_type = str(col_types.get(col, '')).upper()
+        try:
+            if 'INT' in col_type: return int(val)
+            elif 'BOOL' in col_type: return (val.lower() == 'true')
+            elif 'DATE' in col_type: return datetime.strptime(val, '%Y-%m-%d').date()
+            # Добавьте хеширование пароля при обновлении, если он не пустой
+            elif ('password' in col or 'hash' in col): return get_password_hash(val)
+            else: return val
+        except:
+            return val
 
-        async with engine.connect() as conn:
-            pk_col, col_types = await conn.run_sync(_get_meta)
+    async def update_row(self, table_name: str, pk_val: int, form_data: dict):
+        meta = await self.get_table_meta(table_name)
+        pk_col, col_types = meta['pk_col'], meta['col_types']
 
         set_clauses = []
         params = {"pk": pk_val}
@@ -421,58 +716,197 @@ class AdminService:
             if col == pk_col: continue
             
             set_clauses.append(f'"{col}" = :{col}')
-            col_type = str(col_types.get(col, '')).upper()
-            
-            if val == "" or val == "NULL":
-                params[col] = None
-            else:
-                try:
-                     if 'INT' in col_type: params[col] = int(val)
-                     elif 'BOOL' in col_type: params[col] = (val.lower() == 'true')
-                     elif 'DATE' in col_type: params[col] = datetime.strptime(val, '%Y-%m-%d').date()
-                     # Добавьте хеширование пароля при обновлении, если он не пустой
-                     elif ('password' in col or 'hash' in col):
-                         params[col] = get_password_hash(val)
-                     else: params[col] = val
-                except:
-                    params[col] = val
+            params[col] = self.coerce_value(col, val, col_types)
         
         if set_clauses:
             sql = text(f'UPDATE "{table_name}" SET {", ".join(set_clauses)} WHERE "{pk_col}" = :pk')
+            before = await self.snapshot_rollup_row(table_name, pk_val)
             await self.db.execute(sql, params)
+            after = await self.snapshot_rollup_row(table_name, pk_val)
+            await self.apply_row_change(table_name, before, after)
+            await self.invalidate_caches(table_name, pk_val, rebuild_rollups=False)
             await self.db.commit()
 
     async def delete_row(self, table_name: str, pk_val: int):
-        def _get_pk(c): return inspect(c).get_pk_constraint(table_name)['constrained_columns'][0]
-        async with engine.connect() as conn:
-            pk_col = await conn.run_sync(_get_pk)
+        pk_col = (await self.get_table_meta(table_name))['pk_col']
         
         sql = text(f'DELETE FROM "{table_name}" WHERE "{pk_col}" = :pk')
+        before = await self.snapshot_rollup_row(table_name, pk_val)
+        if table_name == "surveys":
+            # Прохождения удалятся каскадом, а когортные счетчики нужно уменьшить заранее
+            await CohortRollupService(self.db).remove_surveys([pk_val])
         await self.db.execute(sql, {"pk": pk_val})
+        await self.apply_row_change(table_name, before, None)
+        await self.invalidate_caches(table_name, rebuild_rollups=False)
+        await self.db.commit()
+
+    async def build_bulk_condition(self, meta: Dict[str, Any], ids: Optional[List[str]], q: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Условие для массовой операции: отмеченные строки (pk = ANY(:ids))
+        или все строки текущего поиска. Без того и другого — отказ, а не вся таблица.
+        Для составного PK ids — закодированные ключи строк (как курсор), сравниваются кортежем.
+        """
+        if ids:
+            pk_cols = meta['pk_cols']
+            if not pk_cols:
+                raise ValueError("У таблицы нет первичного ключа")
+            if len(pk_cols) == 1:
+                pk_col = pk_cols[0]
+                is_int = 'INT' in str(meta['col_types'].get(pk_col, '')).upper()
+                typed_ids = [int(i) if is_int else i for i in ids]
+                return f'"{pk_col}" = ANY(:bulk_ids)', {"bulk_ids": typed_ids}
+
+            try:
+                keys = [self.decode_pk_cursor(i, meta) for i in ids]
+            except (ValueError, TypeError, binascii.Error):
+                raise ValueError("Некорректный ключ строки")
+            params, arrays = {}, []
+            for n, col in enumerate(pk_cols):
+                sql_type = meta['col_types'][col].compile(dialect=postgresql.dialect())
+                params[f"bulk_key_{n}"] = [key[n] for key in keys]
+                arrays.append(f"CAST(:bulk_key_{n} AS {sql_type}[])")
+            cols = ", ".join(f'"{c}"' for c in pk_cols)
+            return f'({cols}) IN (SELECT * FROM unnest({", ".join(arrays)}))', params
+
+        condition, params = await self.build_search_clause(meta, q)
+        if not condition:
+            raise ValueError("Не выбраны строки и не задан фильтр")
+        return condition, params
+
+    async def bulk_delete(
+        self,
+        table_name: str,
+        ids: Optional[List[str]] = None,
+        q: Optional[str] = None,
+        dry_run: bool = False,
+        limit: int = BULK_ROW_LIMIT
+    ) -> int:
+        """
+        Удаляет выбранные строки одним DELETE в одной транзакции.
+        dry_run — только посчитать; больше limit строк не трогаем.
+        """
+        meta = await self.get_table_meta(table_name)
+        condition, params = await self.build_bulk_condition(meta, ids, q)
+
+        count = (await self.db.execute(text(f'SELECT COUNT(*) FROM "{table_name}" WHERE {condition}'), params)).scalar()
+        if dry_run:
+            return count
+        if count > limit:
+            raise ValueError(f"Затронуто {count} строк, лимит массовой операции — {limit}")
+
+        res = await self.db.execute(text(f'DELETE FROM "{table_name}" WHERE {condition}'), params)
+        await self.invalidate_caches(table_name)
         await self.db.commit()
+        return res.rowcount
+
+    async def bulk_update(
+        self,
+        table_name: str,
+        values: Dict[str, Any],
+        ids: Optional[List[str]] = None,
+        q: Optional[str] = None,
+        dry_run: bool = False,
+        limit: int = BULK_ROW_LIMIT
+    ) -> int:
+        """Выставляет значения колонок у выбранных строк одним UPDATE (правила те же, что в update_row)."""
+        meta = await self.get_table_meta(table_name)
+        condition, params = await self.build_bulk_condition(meta, ids, q)
+
+        set_clauses = []
+        for i, (col, val) in enumerate(values.items()):
+            if col not in meta['column_names'] or col in meta['pk_cols']:
+                raise ValueError(f"Колонку {col} нельзя изменить массово")
+            set_clauses.append(f'"{col}" = :set_{i}')
+            params[f"set_{i}"] = self.coerce_value(col, val, meta['col_types'])
+        if not set_clauses:
+            raise ValueError("Не выбрана колонка для изменения")
+
+        count = (await self.db.execute(text(f'SELECT COUNT(*) FROM "{table_name}" WHERE {condition}'), params)).scalar()
+        if dry_run:
+            return count
+        if count > limit:
+            raise ValueError(f"Затронуто {count} строк, лимит массовой операции — {limit}")
+
+        res = await self.db.execute(
+            text(f'UPDATE "{table_name}" SET {", ".join(set_clauses)} WHERE {condition}'), params
+        )
+        await self.invalidate_caches(table_name)
+        await self.db.commit()
+        return res.rowcount
+
+    async def invalidate_caches(self, table_name: str, pk_val=None, rebuild_rollups: bool = True):
+        """
+        Сбрасывает кэши приложения, зависящие от измененной таблицы.
+        rebuild_rollups=False — rollup-таблицы уже обновлены точечно (apply_row_change).
+        """
+        if table_name == "countries":
+            countries_cache.clear()
+        if rebuild_rollups:
+            await self.rebuild_rollups(table_name)
+        await self.touch_survey_versions(table_name, pk_val)
+
+    async def rebuild_rollups(self, table_name: str):
+        """
+        Полный пересчет rollup-таблиц после массовой операции или импорта, когда
+        прежние значения строк неизвестны (эти маршруты работают без statement_timeout).
+        """
+        if table_name == "survey_responses":
+            await ActivityRollupService(self.db).rebuild()
+            await DurationStatsService(self.db).rebuild()
+        if table_name in ("survey_responses", "users", "surveys"):
+            await CohortRollupService(self.db).rebuild()
+
+    async def snapshot_rollup_row(self, table_name: str, pk_val) -> Optional[Dict[str, Any]]:
+        """Значения полей строки, от которых зависят rollup-таблицы (None — строки нет или таблица не влияет)."""
+        sql = ROLLUP_SNAPSHOT_SQL.get(table_name)
+        if sql is None or pk_val is None:
+            return None
+        row = (await self.db.execute(text(sql), {"pk": pk_val})).mappings().one_or_none()
+        return dict(row) if row else None
+
+    async def apply_row_change(self, table_name: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """
+        Точечно обновляет rollup-таблицы после правки одной строки по ее значениям
+        до и после (None — строки не было / больше нет). Стоимость не зависит от
+        размера таблиц, поэтому укладывается в таймаут интерактивного запроса.
+        """
+        if table_name == "survey_responses":
+            rows = [row for row in (before, after) if row]
+            for survey_id, started_at in {(row["survey_id"], row["started_at"]) for row in rows}:
+                await ActivityRollupService(self.db).recount(survey_id, started_at)
+            for survey_id in {row["survey_id"] for row in rows}:
+                await DurationStatsService(self.db).rebuild(survey_id)
+            await CohortRollupService(self.db).apply_response_change(before, after)
+        if table_name == "users":
+            await CohortRollupService(self.db).apply_user_change(before, after)
+
+    async def touch_survey_versions(self, table_name: str, survey_id: Optional[int] = None):
+        """
+        Инвалидирует кэш результатов после ручной правки данных.
+        Для строки опроса увеличиваем версию только его, для остальных таблиц —
+        версию всех опросов (правки в админке редкие, опросов немного).
+        """
+        if table_name not in RESULTS_TABLES:
+            return
+
+        sql = "UPDATE surveys SET data_version = data_version + 1"
+        params = {}
+        if table_name == "surveys" and survey_id is not None:
+            sql += " WHERE survey_id = :sid"
+            params["sid"] = survey_id
+        await self.db.execute(text(sql), params)
     
     async def get_data_for_export(self, table_name: str, q: Optional[str]):
         """Получает итератор данных для экспорта (без пагинации)."""
         
-        # 1. Интроспекция (нужны имена колонок для заголовка CSV и фильтрации)
-        def _get_meta(conn):
-            insp = inspect(conn)
-            return insp.get_columns(table_name), insp.get_pk_constraint(table_name)['constrained_columns']
-
-        async with engine.connect() as conn:
-            columns_data, pk_cols = await conn.run_sync(_get_meta)
+        # 1. Метаданные (нужны имена колонок для заголовка CSV и фильтрации)
+        meta = await self.get_table_meta(table_name)
+        columns = meta['column_names']
+        pk_col = meta['pk_col'] or columns[0]
 
-        columns = [c['name'] for c in columns_data]
-        pk_col = pk_cols[0] if pk_cols else columns[0]
-
-        # 2. Фильтрация (Копия логики из get_paginated_table_data)
-        where_clause = ""
-        params = {}
-        if q and q.strip():
-            search_filters = [f'"{col["name"]}"::text ILIKE :search_q' for col in columns_data]
-            if search_filters:
-                where_clause = "WHERE " + " OR ".join(search_filters)
-                params["search_q"] = f"%{q.strip()}%"
+        # 2. Фильтрация (тот же планировщик, что и в просмотре таблицы)
+        search_condition, params = await self.build_search_clause(meta, q)
+        where_clause = f"WHERE {search_condition}" if search_condition else ""
 
         # 3. Запрос (Без LIMIT/OFFSET)
         # Используем stream() для эффективного чтения больших таблиц
@@ -483,134 +917,82 @@ class AdminService:
         return columns, result
     
     async def get_activity_stats(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict[str, Any]:
-        """Получает статистику активности с фильтрацией по датам."""
-        
-        query = (
-            select(
-                func.date(SurveyResponse.started_at).label("date"),
-                func.count(SurveyResponse.response_id).label("cnt")
-            )
-            .group_by(func.date(SurveyResponse.started_at))
-            .order_by(func.date(SurveyResponse.started_at))
-        )
+        """
+        Получает статистику активности с фильтрацией по датам. Шаг (день / неделя / месяц)
+        выбирается по длине периода, чтобы число точек графика оставалось ограниченным.
+        """
+        if start_date is None or end_date is None:
+            # min/max по ведущей колонке PK — два коротких прохода по индексу
+            bounds = (await self.db.execute(text(
+                "SELECT date(MIN(hour_bucket)) AS first, date(MAX(hour_bucket)) AS last FROM activity_hourly"
+            ))).one()
+            start_date = start_date or bounds.first
+            end_date = end_date or bounds.last
+
+        bucket = choose_activity_bucket(start_date, end_date)
+        sql = f"SELECT date(date_trunc('{bucket}', hour_bucket)) AS date, SUM(starts) AS cnt FROM activity_hourly"
+        conditions = []
+        params = {}
 
-        # Фильтры
+        # Фильтры: полуоткрытый интервал по hour_bucket [start, end + 1 день)
         if start_date:
-            query = query.where(func.date(SurveyResponse.started_at) >= start_date)
+            conditions.append("hour_bucket >= CAST(:start AS date)")
+            params["start"] = start_date
         if end_date:
-            query = query.where(func.date(SurveyResponse.started_at) <= end_date)
+            conditions.append("hour_bucket < CAST(:end AS date) + 1")
+            params["end"] = end_date
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " GROUP BY 1 ORDER BY 1"
 
-        activity_res = await self.db.execute(query)
+        activity_res = await self.db.execute(text(sql), params)
         activity_rows = activity_res.all()
 
         return {
             "dates": [str(row.date) for row in activity_rows],
-            "counts": [int(row.cnt) for row in activity_rows]
+            "counts": [int(row.cnt) for row in activity_rows],
+            "bucket": bucket
         }
     
     async def get_cohort_stats(self) -> Dict[str, Any]:
         """
-        Строит данные для когортного анализа (Retention Rate) с использованием SQLAlchemy Core.
+        Матрица удержания (Retention Rate) из когортных счетчиков cohort_activity
+        и cohort_sizes: строк O(когорты x месяцы), независимо от объема истории.
         """
-        
-        # 1. CTE: Когорты пользователей (User Cohorts)
-        # Получаем месяц регистрации для каждого пользователя
-        uc_cte = (
-            select(
-                User.user_id,
-                cast(func.date_trunc('month', User.registration_date), Date).label('cohort_month')
-            )
-            .cte('user_cohorts')
-        )
+        # Месяцы как целые (год * 12 + номер месяца с нуля) — лаг считается вычитанием
+        res = await self.db.execute(text("""
+            SELECT
+                CAST(EXTRACT(YEAR FROM ca.cohort_month) * 12 + EXTRACT(MONTH FROM ca.cohort_month) - 1 AS int) AS cohort_key,
+                CAST(EXTRACT(YEAR FROM ca.activity_month) * 12 + EXTRACT(MONTH FROM ca.activity_month) - 1 AS int) AS activity_key,
+                ca.active_users,
+                COALESCE(cs.users, 0) AS cohort_users
+            FROM cohort_activity ca
+            LEFT JOIN cohort_sizes cs ON cs.cohort_month = ca.cohort_month
+            WHERE ca.active_users > 0
+        """))
+        rows = res.all()
 
-        # 2. CTE: Размер когорты (Cohort Size)
-        # Считаем сколько людей зарегистрировалось в каждом месяце
-        cs_cte = (
-            select(
-                uc_cte.c.cohort_month,
-                func.count().label('total_users')
-            )
-            .group_by(uc_cte.c.cohort_month)
-            .cte('cohort_size')
-        )
+        if not rows:
+            return {"z": [], "x": [], "y": [], "text": []}
 
-        # 3. CTE: Активность пользователей (User Activities)
-        # Группируем ответы по пользователям и месяцам
-        ua_cte = (
-            select(
-                SurveyResponse.user_id,
-                cast(func.date_trunc('month', SurveyResponse.completed_at), Date).label('activity_month')
-            )
-            .where(SurveyResponse.completed_at.is_not(None))
-            .group_by(SurveyResponse.user_id, text("2")) # Группировка по user_id и месяцу
-            .cte('user_activities')
-        )
+        cohort_key, activity_key, active, size = (np.array(col) for col in zip(*rows))
 
-        # 4. Вычисление Month Lag (разница в месяцах)
-        # Формула: (Год активности - Год когорты)*12 + (Месяц активности - Месяц когорты)
-        # Используем func.age (Postgres specific)
-        age_expression = func.age(ua_cte.c.activity_month, uc_cte.c.cohort_month)
-        month_lag_col = cast(
-            extract('year', age_expression) * 12 + extract('month', age_expression), 
-            Numeric
-        ).label('month_lag')
-
-        # 5. Вычисление Retention %
-        # (Активные / Всего) * 100
-        active_count = func.count(func.distinct(uc_cte.c.user_id))
-        retention_pct = func.round(
-            cast(active_count, Numeric) / cs_cte.c.total_users * 100, 
-            1
-        ).label('retention_pct')
-
-        # 6. Финальный запрос
-        stmt = (
-            select(
-                func.to_char(uc_cte.c.cohort_month, 'YYYY-MM').label('cohort'),
-                cs_cte.c.total_users,
-                month_lag_col,
-                retention_pct
-            )
-            .select_from(uc_cte)
-            .join(cs_cte, uc_cte.c.cohort_month == cs_cte.c.cohort_month)
-            .join(ua_cte, uc_cte.c.user_id == ua_cte.c.user_id)
-            .where(ua_cte.c.activity_month >= uc_cte.c.cohort_month) # Активность после регистрации
-            .group_by(uc_cte.c.cohort_month, cs_cte.c.total_users, month_lag_col)
-            .order_by(uc_cte.c.cohort_month, month_lag_col)
-        )
+        # 1. Оси: когорты по возрастанию, лаги от M+0 до максимального
+        cohorts = np.unique(cohort_key)
+        lags = activity_key - cohort_key
+        row_idx = np.searchsorted(cohorts, cohort_key)
 
-        # Выполнение
-        result = (await self.db.execute(stmt)).all()
-        
-        # --- ДАЛЕЕ ЛОГИКА ФОРМАТИРОВАНИЯ (ОСТАЕТСЯ ПРЕЖНЕЙ) ---
-        if not result:
-            return {"z": [], "x": [], "y": [], "text": []}
+        # 2. Матрица одним присваиванием по индексам; пустые ячейки — NaN
+        z = np.full((len(cohorts), int(lags.max()) + 1), np.nan)
+        z[row_idx, lags] = np.round(np.divide(active * 100.0, size, out=np.zeros(len(size)), where=size > 0), 1)
 
-        # 1. Оси
-        cohorts = sorted(list(set(row.cohort for row in result)))
-        # Преобразуем lag в int, так как из базы может прийти decimal
-        lags_values = [int(row.month_lag) for row in result]
-        max_lag = max(lags_values) if lags_values else 0
-        lags = list(range(max_lag + 1))
-        
-        # 2. Матрицы
-        z = [[None for _ in lags] for _ in cohorts]
-        annotation_text = [["" for _ in lags] for _ in cohorts]
-        
-        cohort_idx = {c: i for i, c in enumerate(cohorts)}
-        
-        for row in result:
-            r_idx = cohort_idx[row.cohort]
-            c_idx = int(row.month_lag)
-            
-            if c_idx < len(lags):
-                val = float(row.retention_pct)
-                z[r_idx][c_idx] = val
-                annotation_text[r_idx][c_idx] = f"{val}%"
+        empty = np.isnan(z)
+        annotation_text = np.where(empty, "", np.char.add(z.astype(str), "%"))
 
         return {
-            "y": cohorts,
-            "x": [f"M+{i}" for i in lags],
-            "z": z,
-            "text": annotation_text
+            "y": [f"{key // 12}-{key % 12 + 1:02d}" for key in cohorts.tolist()],
+            "x": [f"M+{i}" for i in range(z.shape[1])],
+            "z": np.where(empty, None, z).tolist(),
+            "text": annotation_text.tolist()
         }
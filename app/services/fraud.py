@@ -0,0 +1,261 @@
+import math
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Пороги сигналов
+STRAIGHTLINE_MIN_QUESTIONS = 5      # меньше вопросов с выбором — одинаковые позиции ничего не значат
+STRAIGHTLINE_SHARE = 0.9            # доля ответов на одной и той же позиции варианта
+IP_WINDOW_SECONDS = 600             # окно для числа прохождений с одного IP
+IP_BURST_MIN = 5
+COMPLETION_WINDOW_SECONDS = 60      # окно для всплеска завершений одного опроса
+COMPLETION_BURST_MIN = 10
+COMPLETION_BURST_FACTOR = 10.0      # во сколько раз выше среднего темпа опроса в партиции
+DUPLICATE_TEXT_MIN = 3              # столько разных прохождений с одинаковым текстом
+DUPLICATE_TEXT_MIN_LENGTH = 10      # короткие "да"/"нет" совпадают естественно
+
+# Вклад сигнала в итоговую оценку ограничен, чтобы один выброс не заслонял остальные
+MAX_SIGNAL_WEIGHT = 3.0
+# Окна считаются назад от прохождения: из предыдущей партиции подгружается хвост этой длины
+LOOKBACK_SECONDS = max(IP_WINDOW_SECONDS, COMPLETION_WINDOW_SECONDS)
+
+RESPONSES_SQL = """
+    SELECT
+        response_id,
+        survey_id,
+        host(ip_address) AS ip,
+        EXTRACT(EPOCH FROM started_at) AS started,
+        EXTRACT(EPOCH FROM completed_at) AS completed
+    FROM survey_responses
+    WHERE started_at >= CAST(:lo AS timestamptz) - make_interval(secs => :lookback)
+      AND started_at < CAST(:hi AS timestamptz)
+      AND completed_at IS NOT NULL
+"""
+
+# Текст нормализуется и хешируется в БД: в память попадает 32 байта вместо ответа целиком
+ANSWERS_SQL = """
+    SELECT
+        ua.response_id,
+        ua.question_id,
+        ua.selected_option_id,
+        CASE WHEN length(ua.text_answer) >= :min_text_length
+            THEN md5(lower(regexp_replace(btrim(ua.text_answer), '\\s+', ' ', 'g'))) END AS text_hash
+    FROM user_answers ua
+    JOIN survey_responses sr ON sr.response_id = ua.response_id
+    WHERE sr.started_at >= CAST(:lo AS timestamptz) AND sr.started_at < CAST(:hi AS timestamptz)
+      AND sr.completed_at IS NOT NULL
+"""
+
+OPTION_POSITIONS_SQL = """
+    SELECT option_id, ROW_NUMBER() OVER (PARTITION BY question_id ORDER BY option_id) AS position
+    FROM options
+"""
+
+CLEAR_FLAGS_SQL = """
+    DELETE FROM response_flags f
+    USING survey_responses sr
+    WHERE sr.response_id = f.response_id
+      AND sr.started_at >= CAST(:lo AS timestamptz) AND sr.started_at < CAST(:hi AS timestamptz)
+"""
+
+# Вставка партиции одной командой: массивы колонок разворачиваются в строки
+INSERT_FLAGS_SQL = """
+    INSERT INTO response_flags
+        (response_id, survey_id, score, straightline, ip_burst, completion_burst, duplicate_text)
+    SELECT * FROM unnest(
+        CAST(:response_id AS integer[]),
+        CAST(:survey_id AS integer[]),
+        CAST(:score AS double precision[]),
+        CAST(:straightline AS double precision[]),
+        CAST(:ip_burst AS integer[]),
+        CAST(:completion_burst AS integer[]),
+        CAST(:duplicate_text AS integer[])
+    )
+"""
+
+
+def trailing_counts(keys: pd.Series, ts: np.ndarray, window: float) -> np.ndarray:
+    """
+    Для каждой строки — число строк с тем же ключом и временем в [ts - window, ts].
+    Сортировка по (ключ, время) и два searchsorted по составному ключу, без цикла по группам.
+    Строки без ключа (NULL) получают 0.
+    """
+    codes, _ = pd.factorize(keys)
+    counts = np.zeros(len(codes), dtype=np.int64)
+    valid = codes >= 0
+    if not valid.any():
+        return counts
+
+    c = codes[valid].astype(np.float64)
+    t = ts[valid] - ts[valid].min()
+    order = np.lexsort((t, c))
+    span = t.max() + window + 1
+    composite = c[order] * span + t[order]
+    left = np.searchsorted(composite, composite - window, side="left")
+    right = np.searchsorted(composite, composite, side="right")
+
+    sorted_counts = np.empty(len(order), dtype=np.int64)
+    sorted_counts[order] = right - left
+    counts[valid] = sorted_counts
+    return counts
+
+
+def straightline_share(answers: pd.DataFrame, positions: pd.Series) -> pd.Series:
+    """
+    Доля вопросов, на которые выбран вариант на самой частой для прохождения позиции
+    (все "первые", все "третьи" и т.п.). Для вопросов с несколькими вариантами
+    берется первая выбранная позиция. Прохождения с малым числом вопросов не оцениваются.
+    """
+    choice = answers.loc[answers["selected_option_id"].notna(), ["response_id", "question_id", "selected_option_id"]]
+    if choice.empty:
+        return pd.Series(dtype=np.float64)
+    choice = choice.assign(position=choice["selected_option_id"].astype(np.int64).map(positions))
+    per_question = choice.groupby(["response_id", "question_id"], sort=False)["position"].min()
+    per_response = per_question.groupby(level="response_id")
+    answered = per_response.size()
+    modal = per_question.reset_index().groupby(["response_id", "position"], sort=False).size().groupby(level="response_id").max()
+    share = (modal / answered)[answered >= STRAIGHTLINE_MIN_QUESTIONS]
+    return share[share >= STRAIGHTLINE_SHARE]
+
+
+def duplicate_text_counts(answers: pd.DataFrame) -> pd.Series:
+    """Наибольшее число разных прохождений с тем же текстом ответа на тот же вопрос."""
+    texts = answers.loc[answers["text_hash"].notna(), ["response_id", "question_id", "text_hash"]]
+    if texts.empty:
+        return pd.Series(dtype=np.int64)
+    copies = texts.groupby(["question_id", "text_hash"], sort=False)["response_id"].transform("nunique")
+    per_response = copies.groupby(texts["response_id"]).max()
+    return per_response[per_response >= DUPLICATE_TEXT_MIN]
+
+
+def detect_signals(
+    responses: pd.DataFrame,
+    answers: pd.DataFrame,
+    positions: pd.Series,
+    partition_start: float,
+    partition_seconds: float
+) -> pd.DataFrame:
+    """
+    Сигналы для прохождений партиции (started >= partition_start); строки раньше —
+    хвост предыдущей партиции, нужный только для окон. Возвращает помеченные
+    прохождения с оценками сигналов (NaN — сигнал не сработал) и итоговым score.
+    """
+    columns = ["response_id", "survey_id", "score", "straightline", "ip_burst", "completion_burst", "duplicate_text"]
+    if responses.empty:
+        return pd.DataFrame(columns=columns)
+
+    ip_count = trailing_counts(responses["ip"], responses["started"].to_numpy(np.float64), IP_WINDOW_SECONDS)
+    completed = responses["completed"].to_numpy(np.float64)
+    burst_count = trailing_counts(responses["survey_id"], completed, COMPLETION_WINDOW_SECONDS)
+
+    current = (responses["started"] >= partition_start).to_numpy()
+    df = responses.loc[current, ["response_id", "survey_id"]].reset_index(drop=True)
+    ip_count = ip_count[current]
+    burst_count = burst_count[current]
+
+    # Ожидаемое число завершений опроса в окне при его среднем темпе в партиции
+    per_survey = df.groupby("survey_id")["survey_id"].transform("size").to_numpy(np.float64)
+    expected = per_survey * COMPLETION_WINDOW_SECONDS / max(partition_seconds, COMPLETION_WINDOW_SECONDS)
+    burst_threshold = np.maximum(COMPLETION_BURST_MIN, COMPLETION_BURST_FACTOR * expected)
+
+    df["ip_burst"] = np.where(ip_count >= IP_BURST_MIN, ip_count, np.nan)
+    df["completion_burst"] = np.where(burst_count >= burst_threshold, burst_count, np.nan)
+    df["straightline"] = df["response_id"].map(straightline_share(answers, positions))
+    df["duplicate_text"] = df["response_id"].map(duplicate_text_counts(answers))
+
+    weights = pd.DataFrame({
+        "straightline": df["straightline"] / STRAIGHTLINE_SHARE,
+        "ip_burst": df["ip_burst"] / IP_BURST_MIN,
+        "completion_burst": df["completion_burst"] / burst_threshold,
+        "duplicate_text": df["duplicate_text"] / DUPLICATE_TEXT_MIN,
+    }).clip(upper=MAX_SIGNAL_WEIGHT)
+    df["score"] = weights.sum(axis=1, min_count=1)
+    return df.loc[df["score"].notna(), columns].reset_index(drop=True)
+
+
+def _column(values: pd.Series, cast: Callable) -> list:
+    return [None if isinstance(v, float) and math.isnan(v) else cast(v) for v in values.tolist()]
+
+
+class FraudDetectionService:
+    """
+    Пакетный детектор подозрительных прохождений. Данные читаются партициями
+    по started_at (BRIN-индекс), сигналы считаются векторно в pandas/NumPy,
+    помеченные прохождения пишутся в response_flags. Память ограничена одной
+    партицией, поэтому объем истории на время работы не влияет, только на время.
+    Каждая партиция коммитится отдельно: повторный запуск переписывает ее флаги.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _frame(self, sql: str, params: Dict[str, Any]) -> pd.DataFrame:
+        res = await self.db.execute(text(sql), params)
+        return pd.DataFrame(res.all(), columns=list(res.keys()))
+
+    async def load_option_positions(self) -> pd.Series:
+        frame = await self._frame(OPTION_POSITIONS_SQL, {})
+        return frame.set_index("option_id")["position"]
+
+    async def get_bounds(self) -> Optional[tuple]:
+        row = (await self.db.execute(text(
+            "SELECT MIN(started_at), MAX(started_at) FROM survey_responses"
+        ))).one()
+        return None if row[0] is None else (row[0], row[1])
+
+    async def process_partition(self, lo: datetime, hi: datetime, positions: pd.Series) -> Dict[str, int]:
+        """Пересчитывает флаги прохождений, начатых в [lo, hi)."""
+        responses = await self._frame(RESPONSES_SQL, {"lo": lo, "hi": hi, "lookback": LOOKBACK_SECONDS})
+        answers = await self._frame(ANSWERS_SQL, {"lo": lo, "hi": hi, "min_text_length": DUPLICATE_TEXT_MIN_LENGTH})
+        # EXTRACT возвращает numeric (Decimal)
+        responses[["started", "completed"]] = responses[["started", "completed"]].astype(np.float64)
+
+        flags = detect_signals(responses, answers, positions, lo.timestamp(), (hi - lo).total_seconds())
+
+        await self.db.execute(text(CLEAR_FLAGS_SQL), {"lo": lo, "hi": hi})
+        if not flags.empty:
+            await self.db.execute(text(INSERT_FLAGS_SQL), {
+                "response_id": _column(flags["response_id"], int),
+                "survey_id": _column(flags["survey_id"], int),
+                "score": _column(flags["score"], float),
+                "straightline": _column(flags["straightline"], float),
+                "ip_burst": _column(flags["ip_burst"], int),
+                "completion_burst": _column(flags["completion_burst"], int),
+                "duplicate_text": _column(flags["duplicate_text"], int),
+            })
+        await self.db.commit()
+        return {
+            "responses": int((responses["started"] >= lo.timestamp()).sum()) if not responses.empty else 0,
+            "answers": len(answers),
+            "flagged": len(flags),
+        }
+
+    async def run(
+        self,
+        since: Optional[datetime] = None,
+        partition: timedelta = timedelta(days=1),
+        on_partition: Optional[Callable[[datetime, datetime, Dict[str, int]], None]] = None
+    ) -> Dict[str, int]:
+        """Проходит историю (или ее часть с since) партициями по started_at."""
+        bounds = await self.get_bounds()
+        totals = {"responses": 0, "answers": 0, "flagged": 0, "partitions": 0}
+        if bounds is None:
+            return totals
+
+        positions = await self.load_option_positions()
+        lo = max(bounds[0], since) if since else bounds[0]
+        end = bounds[1] + timedelta(microseconds=1)
+        while lo < end:
+            hi = min(lo + partition, end)
+            stats = await self.process_partition(lo, hi, positions)
+            for key, value in stats.items():
+                totals[key] += value
+            totals["partitions"] += 1
+            if on_partition:
+                on_partition(lo, hi, stats)
+            lo = hi
+        return totals
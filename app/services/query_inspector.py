@@ -0,0 +1,222 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Seq Scan по таблице больше этой оценки подсвечиваем как подозрительный
+SEQ_SCAN_WARN_ROWS = 10_000
+# Сколько разных SQL одного вызова разбираем (остальные только считаем)
+MAX_STATEMENTS = 15
+
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+
+@dataclass
+class RegisteredQuery:
+    """Метод сервиса, доступный в инспекторе, и его параметры: (имя, тип, значение по умолчанию)."""
+    title: str
+    run: Callable[[AsyncSession, Dict[str, Any]], Awaitable[Any]]
+    params: List[Tuple[str, type, Any]] = field(default_factory=list)
+
+
+def _admin(db):
+    from app.services.admin import AdminService
+    return AdminService(db)
+
+
+def _survey(db):
+    from app.services.survey import SurveyService
+    return SurveyService(db)
+
+
+def _user(db):
+    from app.services.user import UserService
+    return UserService(db)
+
+
+# Реальные методы сервисов: инспектор выполняет их и перехватывает все SQL,
+# поэтому планы соответствуют тому, что приложение действительно отправляет в базу
+QUERY_REGISTRY: Dict[str, RegisteredQuery] = {
+    "dashboard": RegisteredQuery(
+        "Аналитика: сводка (v_admin_summary, активность, теги, демография)",
+        lambda db, p: _admin(db).get_dashboard_stats()
+    ),
+    "anomalies": RegisteredQuery(
+        "Аналитика: аномально быстрые прохождения (индекс по длительности)",
+        lambda db, p: _admin(db).get_anomalies(p["survey_id"]),
+        [("survey_id", int, None)]
+    ),
+    "response_flags": RegisteredQuery(
+        "Аналитика: прохождения, помеченные детектором (response_flags)",
+        lambda db, p: _admin(db).get_response_flags(p["survey_id"]),
+        [("survey_id", int, None)]
+    ),
+    "heatmap": RegisteredQuery(
+        "Аналитика: тепловая карта (activity_hourly)",
+        lambda db, p: _admin(db).get_heatmap_stats(p["period"]),
+        [("period", str, "all")]
+    ),
+    "cohorts": RegisteredQuery(
+        "Аналитика: когорты",
+        lambda db, p: _admin(db).get_cohort_stats()
+    ),
+    "activity": RegisteredQuery(
+        "Аналитика: активность по дням",
+        lambda db, p: _admin(db).get_activity_stats()
+    ),
+    "survey_analytics": RegisteredQuery(
+        "Результаты опроса: статистика по вопросам (v_survey_responses_flat)",
+        lambda db, p: _survey(db).get_survey_analytics(p["survey_id"]),
+        [("survey_id", int, 1)]
+    ),
+    "survey_benchmark": RegisteredQuery(
+        "Результаты опроса: бенчмарки (get_survey_benchmark)",
+        lambda db, p: _survey(db).get_survey_benchmark_data(p["survey_id"]),
+        [("survey_id", int, 1)]
+    ),
+    "search_surveys": RegisteredQuery(
+        "Главная: поиск опросов (search_surveys_ranked)",
+        lambda db, p: _survey(db).search_surveys(p["q"]),
+        [("q", str, "опрос")]
+    ),
+    "user_history": RegisteredQuery(
+        "Профиль: история прохождений",
+        lambda db, p: _user(db).get_history_page(p["user_id"]),
+        [("user_id", int, 1)]
+    ),
+    "table_page": RegisteredQuery(
+        "Админка: страница таблицы с поиском",
+        lambda db, p: _admin(db).get_paginated_table_data(p["table"], 1, 100, p["q"] or None),
+        [("table", str, "survey_responses"), ("q", str, "")]
+    ),
+}
+
+
+def parse_params(query: RegisteredQuery, raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Приводит значения из формы к типам параметров; пустое значение — значение по умолчанию."""
+    params = {}
+    for name, type_, default in query.params:
+        value = raw.get(name)
+        if value in (None, ""):
+            params[name] = default
+        else:
+            try:
+                params[name] = type_(value)
+            except ValueError:
+                raise ValueError(f"Параметр {name}: ожидается {type_.__name__}")
+    return params
+
+
+def flatten_plan(node: Dict[str, Any], large_tables: Dict[str, int], depth: int = 0) -> List[Dict[str, Any]]:
+    """Разворачивает дерево плана в список строк для таблицы (с отступом по глубине)."""
+    loops = node.get("Actual Loops", 1) or 1
+    total_ms = node.get("Actual Total Time", 0) * loops
+    children = node.get("Plans", [])
+    children_ms = sum(c.get("Actual Total Time", 0) * (c.get("Actual Loops", 1) or 1) for c in children)
+
+    relation = node.get("Relation Name")
+    is_seq_scan = node["Node Type"] == "Seq Scan"
+    rows = [{
+        "depth": depth,
+        "node_type": node["Node Type"],
+        "relation": relation,
+        "index": node.get("Index Name"),
+        "total_ms": round(total_ms, 3),
+        "self_ms": round(max(total_ms - children_ms, 0), 3),
+        "actual_rows": node.get("Actual Rows", 0) * loops,
+        "plan_rows": node.get("Plan Rows", 0),
+        "loops": loops,
+        "shared_hit": node.get("Shared Hit Blocks", 0),
+        "shared_read": node.get("Shared Read Blocks", 0),
+        "condition": node.get("Filter") or node.get("Index Cond") or node.get("Hash Cond") or node.get("Join Filter"),
+        "warn": is_seq_scan and relation in large_tables,
+        "table_rows": large_tables.get(relation) if is_seq_scan else None,
+    }]
+    for child in children:
+        rows.extend(flatten_plan(child, large_tables, depth + 1))
+    return rows
+
+
+def _relations(node: Dict[str, Any]) -> set:
+    names = {node["Relation Name"]} if node.get("Relation Name") else set()
+    for child in node.get("Plans", []):
+        names |= _relations(child)
+    return names
+
+
+class QueryInspectorService:
+    """
+    Выполняет зарегистрированный метод сервиса внутри SAVEPOINT, перехватывает
+    его SELECT-запросы и прогоняет каждый через EXPLAIN (ANALYZE, BUFFERS) с теми
+    же параметрами. Затем откатывает savepoint — данные не меняются.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _large_tables(self, relations: set) -> Dict[str, int]:
+        if not relations:
+            return {}
+        res = await self.db.execute(text("""
+            SELECT relname, reltuples::bigint
+            FROM pg_class
+            WHERE relname = ANY(:names) AND relkind IN ('r', 'm', 'p') AND reltuples > :threshold
+        """), {"names": list(relations), "threshold": SEQ_SCAN_WARN_ROWS})
+        return {r[0]: int(r[1]) for r in res.all()}
+
+    async def inspect(self, name: str, raw_params: Dict[str, Any]) -> Dict[str, Any]:
+        query = QUERY_REGISTRY.get(name)
+        if query is None:
+            raise ValueError(f"Запрос {name} не зарегистрирован")
+        params = parse_params(query, raw_params)
+
+        conn = await self.db.connection()
+        captured: List[Tuple[str, Any]] = []
+
+        def capture(connection, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                captured.append((statement, parameters))
+
+        savepoint = await self.db.begin_nested()
+        try:
+            event.listen(conn.sync_connection, "before_cursor_execute", capture)
+            try:
+                await query.run(self.db, params)
+            finally:
+                event.remove(conn.sync_connection, "before_cursor_execute", capture)
+
+            # Одинаковый SQL (например, запрос в цикле по вопросам) разбираем один раз
+            statements: Dict[str, Dict[str, Any]] = {}
+            for sql, sql_params in captured:
+                entry = statements.setdefault(sql, {"sql": sql, "params": sql_params, "calls": 0})
+                entry["calls"] += 1
+
+            plans = []
+            for entry in list(statements.values())[:MAX_STATEMENTS]:
+                res = await conn.exec_driver_sql(EXPLAIN_PREFIX + entry["sql"], entry["params"])
+                raw_plan = res.scalar()
+                if isinstance(raw_plan, str):
+                    raw_plan = json.loads(raw_plan)
+                plans.append({**entry, "raw": raw_plan[0]})
+        finally:
+            await savepoint.rollback()
+
+        relations = set().union(*(_relations(p["raw"]["Plan"]) for p in plans)) if plans else set()
+        large_tables = await self._large_tables(relations)
+
+        for plan in plans:
+            plan["nodes"] = flatten_plan(plan["raw"]["Plan"], large_tables)
+            plan["planning_ms"] = plan["raw"].get("Planning Time")
+            plan["execution_ms"] = plan["raw"].get("Execution Time")
+            plan["warnings"] = sum(1 for n in plan["nodes"] if n["warn"])
+
+        return {
+            "name": name,
+            "title": query.title,
+            "params": params,
+            "plans": plans,
+            "total_statements": len(captured),
+            "distinct_statements": len(statements),
+        }
@@ -0,0 +1,323 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Час считается по started_at: и начатые, и завершенные прохождения попадают
+# в час начала, как в прежних графиках активности по survey_responses
+UPSERT_SQL = """
+    INSERT INTO activity_hourly (hour_bucket, survey_id, starts, completions)
+    VALUES (date_trunc('hour', CAST(:started_at AS timestamptz)), :survey_id, :starts, :completions)
+    ON CONFLICT (hour_bucket, survey_id) DO UPDATE SET
+        starts = activity_hourly.starts + EXCLUDED.starts,
+        completions = activity_hourly.completions + EXCLUDED.completions
+"""
+
+REBUILD_SQL = """
+    INSERT INTO activity_hourly (hour_bucket, survey_id, starts, completions)
+    SELECT date_trunc('hour', started_at), survey_id, COUNT(*), COUNT(completed_at)
+    FROM survey_responses
+    {where}
+    GROUP BY 1, 2
+"""
+
+RECOUNT_SQL = """
+    INSERT INTO activity_hourly (hour_bucket, survey_id, starts, completions)
+    SELECT date_trunc('hour', CAST(:started_at AS timestamptz)), CAST(:survey_id AS integer), COUNT(*), COUNT(completed_at)
+    FROM survey_responses
+    WHERE survey_id = :survey_id
+      AND started_at >= date_trunc('hour', CAST(:started_at AS timestamptz))
+      AND started_at < date_trunc('hour', CAST(:started_at AS timestamptz)) + interval '1 hour'
+    HAVING COUNT(*) > 0
+"""
+
+
+class ActivityRollupService:
+    """
+    Почасовой rollup активности (activity_hourly): графики и тепловая карта читают
+    его вместо survey_responses, поэтому их стоимость зависит от длины периода,
+    а не от числа прохождений. Коммит остается за вызывающим кодом.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record(self, survey_id: int, started_at: datetime, starts: int = 0, completions: int = 0):
+        """Инкремент счетчиков часа при записи прохождения (в той же транзакции)."""
+        await self.db.execute(text(UPSERT_SQL), {
+            "survey_id": survey_id,
+            "started_at": started_at,
+            "starts": starts,
+            "completions": completions,
+        })
+
+    async def rebuild(self, since: Optional[datetime] = None) -> int:
+        """
+        Пересчитывает rollup из survey_responses целиком или начиная с часа since.
+        Нужен после массовой загрузки и ручных правок прохождений в админке.
+        """
+        params = {}
+        where = ""
+        if since is not None:
+            params["since"] = since
+            where = "WHERE started_at >= date_trunc('hour', CAST(:since AS timestamptz))"
+            await self.db.execute(text(
+                "DELETE FROM activity_hourly WHERE hour_bucket >= date_trunc('hour', CAST(:since AS timestamptz))"
+            ), params)
+        else:
+            await self.db.execute(text("DELETE FROM activity_hourly"))
+
+        res = await self.db.execute(text(REBUILD_SQL.format(where=where)), params)
+        return res.rowcount
+
+    async def recount(self, survey_id: int, started_at: datetime):
+        """
+        Пересчитывает одну ячейку (час started_at, опрос) — после правки одной строки
+        в админке, когда прежние и новые значения известны.
+        """
+        params = {"survey_id": survey_id, "started_at": started_at}
+        await self.db.execute(text("""
+            DELETE FROM activity_hourly
+            WHERE survey_id = :survey_id AND hour_bucket = date_trunc('hour', CAST(:started_at AS timestamptz))
+        """), params)
+        await self.db.execute(text(RECOUNT_SQL), params)
+
+
+# Месяц активности засчитывается пользователю один раз: инкремент, только если
+# у него нет другого завершенного прохождения в этом месяце
+COHORT_ADJUST_SQL = """
+    INSERT INTO cohort_activity (cohort_month, activity_month, active_users)
+    SELECT CAST(date_trunc('month', CAST(:registered AS timestamptz)) AS date), m.month, CAST(:delta AS integer)
+    FROM (SELECT CAST(date_trunc('month', CAST(:completed AS timestamptz)) AS date) AS month) m
+    WHERE m.month >= date_trunc('month', CAST(:registered AS timestamptz))
+      AND NOT EXISTS (
+        SELECT 1 FROM survey_responses
+        WHERE user_id = :user_id AND response_id <> :response_id
+          AND completed_at >= m.month AND completed_at < m.month + interval '1 month'
+      )
+    ON CONFLICT (cohort_month, activity_month) DO UPDATE SET
+        active_users = cohort_activity.active_users + EXCLUDED.active_users
+"""
+
+COHORT_REBUILD_SQL = """
+    INSERT INTO cohort_activity (cohort_month, activity_month, active_users)
+    SELECT c.cohort_month, a.activity_month, COUNT(*)
+    FROM (
+        SELECT DISTINCT user_id, CAST(date_trunc('month', completed_at) AS date) AS activity_month
+        FROM survey_responses
+        WHERE completed_at IS NOT NULL
+    ) a
+    JOIN (
+        SELECT user_id, CAST(date_trunc('month', registration_date) AS date) AS cohort_month
+        FROM users
+    ) c ON c.user_id = a.user_id
+    WHERE a.activity_month >= c.cohort_month
+    GROUP BY 1, 2
+"""
+
+COHORT_SIZES_REBUILD_SQL = """
+    INSERT INTO cohort_sizes (cohort_month, users)
+    SELECT CAST(date_trunc('month', registration_date) AS date), COUNT(*)
+    FROM users
+    GROUP BY 1
+"""
+
+# Вклад одного пользователя (регистрация и месяцы активности) со знаком delta —
+# для переноса между когортами при правке registration_date или удалении пользователя
+COHORT_USER_SIZE_SQL = """
+    INSERT INTO cohort_sizes (cohort_month, users)
+    VALUES (CAST(date_trunc('month', CAST(:registered AS timestamptz)) AS date), CAST(:delta AS integer))
+    ON CONFLICT (cohort_month) DO UPDATE SET users = cohort_sizes.users + EXCLUDED.users
+"""
+
+COHORT_USER_ACTIVITY_SQL = """
+    INSERT INTO cohort_activity (cohort_month, activity_month, active_users)
+    SELECT CAST(date_trunc('month', CAST(:registered AS timestamptz)) AS date), m.month, CAST(:delta AS integer)
+    FROM unnest(CAST(:months AS date[])) AS m(month)
+    WHERE m.month >= date_trunc('month', CAST(:registered AS timestamptz))
+    ON CONFLICT (cohort_month, activity_month) DO UPDATE SET
+        active_users = cohort_activity.active_users + EXCLUDED.active_users
+"""
+
+# Перед удалением опросов: пара (пользователь, месяц) теряет активность, если в этом
+# месяце у пользователя нет завершений в других опросах. Одним запросом для всех пар
+COHORT_REMOVE_SURVEYS_SQL = """
+    INSERT INTO cohort_activity (cohort_month, activity_month, active_users)
+    SELECT cohort_month, activity_month, -COUNT(*)
+    FROM (
+        SELECT DISTINCT
+            sr.user_id,
+            CAST(date_trunc('month', u.registration_date) AS date) AS cohort_month,
+            CAST(date_trunc('month', sr.completed_at) AS date) AS activity_month
+        FROM survey_responses sr
+        JOIN users u ON u.user_id = sr.user_id
+        WHERE sr.survey_id = ANY(CAST(:survey_ids AS integer[])) AND sr.completed_at IS NOT NULL
+    ) a
+    WHERE activity_month >= cohort_month
+      AND NOT EXISTS (
+        SELECT 1 FROM survey_responses o
+        WHERE o.user_id = a.user_id
+          AND o.survey_id <> ALL(CAST(:survey_ids AS integer[]))
+          AND o.completed_at >= a.activity_month AND o.completed_at < a.activity_month + interval '1 month'
+      )
+    GROUP BY cohort_month, activity_month
+    ON CONFLICT (cohort_month, activity_month) DO UPDATE SET
+        active_users = cohort_activity.active_users + EXCLUDED.active_users
+"""
+
+
+class CohortRollupService:
+    """
+    Когортные счетчики: cohort_sizes (регистрации по месяцам) и cohort_activity
+    (активные пользователи когорты по месяцам завершения опросов). Матрица удержания
+    строится из них за O(когорты x месяцы), без прохода по users и survey_responses.
+
+    Инкременты ведутся в транзакции записи; одновременные первые прохождения одного
+    пользователя в одном месяце могут засчитаться дважды — rebuild() это исправляет.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record_registration(self, registered_at: datetime):
+        await self.db.execute(text("""
+            INSERT INTO cohort_sizes (cohort_month, users)
+            VALUES (CAST(date_trunc('month', CAST(:registered AS timestamptz)) AS date), 1)
+            ON CONFLICT (cohort_month) DO UPDATE SET users = cohort_sizes.users + 1
+        """), {"registered": registered_at})
+
+    async def record_completion(
+        self,
+        user_id: int,
+        registered_at: datetime,
+        response_id: int,
+        completed_at: datetime,
+        previous_completed_at: Optional[datetime] = None
+    ):
+        """
+        Учитывает завершение прохождения response_id (сама строка в проверке не участвует).
+        При повторной отправке старое время завершения передается в previous_completed_at:
+        если месяц сменился, активность переносится из старого месяца в новый.
+        """
+        params = {"user_id": user_id, "registered": registered_at, "response_id": response_id}
+        if previous_completed_at is not None:
+            # В том же месяце -1 и +1 дают ноль: месяцы сравнивает сам PostgreSQL в часовом поясе сессии
+            await self.db.execute(text(COHORT_ADJUST_SQL), {**params, "completed": previous_completed_at, "delta": -1})
+        await self.db.execute(text(COHORT_ADJUST_SQL), {**params, "completed": completed_at, "delta": 1})
+
+    async def apply_response_change(self, before: Optional[dict], after: Optional[dict]):
+        """
+        Правка одной строки survey_responses (значения до и после, уже после записи в БД):
+        прежний месяц снимается, если больше ничем не подтвержден, новый — добавляется.
+        """
+        for row, delta in ((before, -1), (after, 1)):
+            if not row or row["user_id"] is None or row["completed_at"] is None:
+                continue
+            await self.db.execute(text(COHORT_ADJUST_SQL), {
+                "user_id": row["user_id"],
+                "registered": row["registration_date"],
+                "response_id": row["response_id"],
+                "completed": row["completed_at"],
+                "delta": delta,
+            })
+
+    async def apply_user_change(self, before: Optional[dict], after: Optional[dict]):
+        """
+        Правка одной строки users: вклад пользователя (когорта и месяцы активности
+        из снимка) переносится из прежней когорты в новую.
+        """
+        if before and after and before["registration_date"] == after["registration_date"]:
+            return
+        for row, delta in ((before, -1), (after, 1)):
+            if not row:
+                continue
+            params = {"registered": row["registration_date"], "delta": delta}
+            await self.db.execute(text(COHORT_USER_SIZE_SQL), params)
+            if row["activity_months"]:
+                await self.db.execute(text(COHORT_USER_ACTIVITY_SQL), {**params, "months": row["activity_months"]})
+
+    async def remove_surveys(self, survey_ids: List[int]):
+        """Вызывается до удаления опросов: прохождения удалятся каскадом, а cohort_activity — нет."""
+        await self.db.execute(text(COHORT_REMOVE_SURVEYS_SQL), {"survey_ids": survey_ids})
+
+    async def rebuild(self):
+        """Пересчитывает обе таблицы из users и survey_responses."""
+        await self.db.execute(text("DELETE FROM cohort_activity"))
+        await self.db.execute(text("DELETE FROM cohort_sizes"))
+        await self.db.execute(text(COHORT_SIZES_REBUILD_SQL))
+        await self.db.execute(text(COHORT_REBUILD_SQL))
+
+
+# Минимум завершенных прохождений опроса, после которого доля от среднего и z-score имеют смысл
+DURATION_MIN_SAMPLES = 5
+
+# Шаг Уэлфорда одной командой: в SET справа старые значения строки, EXCLUDED.mean — новое x
+WELFORD_ADD_SQL = """
+    INSERT INTO survey_duration_stats (survey_id, n, mean, m2)
+    VALUES (:survey_id, 1, CAST(:x AS double precision), 0)
+    ON CONFLICT (survey_id) DO UPDATE SET
+        n = survey_duration_stats.n + 1,
+        mean = survey_duration_stats.mean
+            + (EXCLUDED.mean - survey_duration_stats.mean) / (survey_duration_stats.n + 1),
+        m2 = survey_duration_stats.m2
+            + (EXCLUDED.mean - survey_duration_stats.mean)
+            * (EXCLUDED.mean - survey_duration_stats.mean
+               - (EXCLUDED.mean - survey_duration_stats.mean) / (survey_duration_stats.n + 1))
+"""
+
+# Обратный шаг (повторная отправка заменяет прежнюю длительность)
+WELFORD_REMOVE_SQL = """
+    UPDATE survey_duration_stats SET
+        n = n - 1,
+        mean = CASE WHEN n > 1 THEN (n * mean - CAST(:x AS double precision)) / (n - 1) ELSE 0 END,
+        m2 = CASE WHEN n > 1 THEN GREATEST(
+            m2 - (CAST(:x AS double precision) - mean)
+               * (CAST(:x AS double precision) - (n * mean - CAST(:x AS double precision)) / (n - 1)),
+            0) ELSE 0 END
+    WHERE survey_id = :survey_id
+"""
+
+DURATION_STATS_REBUILD_SQL = """
+    INSERT INTO survey_duration_stats (survey_id, n, mean, m2)
+    SELECT survey_id, COUNT(*), AVG(x), COALESCE(VAR_SAMP(x) * (COUNT(*) - 1), 0)
+    FROM (
+        SELECT survey_id, EXTRACT(EPOCH FROM duration) AS x
+        FROM survey_responses
+        WHERE completed_at IS NOT NULL {where}
+    ) d
+    GROUP BY survey_id
+"""
+
+
+class DurationStatsService:
+    """
+    Онлайн-статистика длительности прохождений по опросам (алгоритм Уэлфорда:
+    n, среднее и сумма квадратов отклонений m2) в survey_duration_stats.
+    Оценки прохождений (доля от среднего, z-score) считаются при чтении против
+    текущей статистики: сохраненная оценка устаревала бы с каждым новым прохождением.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record(self, survey_id: int, duration_sec: float, previous_sec: Optional[float] = None):
+        """Добавляет длительность в статистику опроса (при повторной отправке заменяет previous_sec)."""
+        if previous_sec is not None:
+            await self.db.execute(text(WELFORD_REMOVE_SQL), {"survey_id": survey_id, "x": previous_sec})
+        await self.db.execute(text(WELFORD_ADD_SQL), {"survey_id": survey_id, "x": duration_sec})
+
+    async def rebuild(self, survey_id: Optional[int] = None):
+        """
+        Пересчитывает статистику из survey_responses целиком или только опроса survey_id
+        (правка одной строки в админке — агрегат по индексу (survey_id, duration)).
+        """
+        params = {}
+        where = ""
+        if survey_id is not None:
+            params["survey_id"] = survey_id
+            where = "AND survey_id = :survey_id"
+            await self.db.execute(text("DELETE FROM survey_duration_stats WHERE survey_id = :survey_id"), params)
+        else:
+            await self.db.execute(text("DELETE FROM survey_duration_stats"))
+        await self.db.execute(text(DURATION_STATS_REBUILD_SQL.format(where=where)), params)
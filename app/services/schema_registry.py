@@ -0,0 +1,113 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+
+from app.core.database import engine
+
+# Колонки, которые показываем вместо ID при ссылке на строку таблицы (в порядке приоритета)
+DISPLAY_COLUMN_CANDIDATES = ['full_name', 'title', 'name', 'label', 'email', 'question_text', 'option_text', 'text']
+
+
+def _reflect_all(conn) -> Dict[str, Dict[str, Any]]:
+    """
+    Читает метаданные всех таблиц схемы за один проход инспектора
+    (get_multi_* делает по одному запросу к каталогу на вид объекта, а не на таблицу).
+    """
+    insp = inspect(conn)
+    columns = insp.get_multi_columns()
+    pks = insp.get_multi_pk_constraint()
+    fks = insp.get_multi_foreign_keys()
+
+    tables = {}
+    for key, cols in columns.items():
+        _, table_name = key
+        pk_cols = (pks.get(key) or {}).get('constrained_columns') or []
+        col_names = [c['name'] for c in cols]
+        display_col = next((c for c in DISPLAY_COLUMN_CANDIDATES if c in col_names), None)
+
+        tables[table_name] = {
+            "name": table_name,
+            "columns": cols,
+            "column_names": col_names,
+            "col_types": {c['name']: c['type'] for c in cols},
+            "pk_cols": pk_cols,
+            "pk_col": pk_cols[0] if pk_cols else None,
+            "fks": [fk for fk in fks.get(key, []) if fk['constrained_columns'] and fk['referred_columns']],
+            "display_col": display_col
+        }
+    return tables
+
+
+class SchemaRegistry:
+    """
+    Кэш отраженных метаданных таблиц (колонки, типы, PK, FK, колонка для отображения)
+    на уровне процесса. Строится один раз при первом обращении.
+
+    Сбрасывается явно через invalidate() или автоматически, если изменилась
+    ревизия миграций в alembic_version (проверяется не чаще раза в check_interval сек).
+    """
+
+    def __init__(self, check_interval: float = 30.0):
+        self.check_interval = check_interval
+        self._tables: Optional[Dict[str, Dict[str, Any]]] = None
+        self._catalog_version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    async def _get_catalog_version(conn) -> str:
+        try:
+            res = await conn.execute(text("SELECT string_agg(version_num, ',') FROM alembic_version"))
+            return res.scalar() or ""
+        except Exception:
+            # База без alembic (например, тестовая схема) — ориентируемся только на invalidate()
+            await conn.rollback()
+            return ""
+
+    async def load(self, force: bool = True):
+        """Перечитывает метаданные из каталога (force=False — только если кэш пуст)."""
+        async with self._lock:
+            if not force and self._tables is not None:
+                return
+            async with engine.connect() as conn:
+                version = await self._get_catalog_version(conn)
+                tables = await conn.run_sync(_reflect_all)
+            self._tables = tables
+            self._catalog_version = version
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Сбрасывает кэш (например, после применения миграций в этом процессе)."""
+        self._tables = None
+        self._catalog_version = None
+
+    async def _ensure_fresh(self) -> Dict[str, Dict[str, Any]]:
+        if self._tables is None:
+            await self.load(force=False)
+        elif time.monotonic() - self._checked_at > self.check_interval:
+            self._checked_at = time.monotonic()
+            async with engine.connect() as conn:
+                version = await self._get_catalog_version(conn)
+            if version != self._catalog_version:
+                await self.load()
+        return self._tables
+
+    async def get_table_names(self) -> List[str]:
+        return sorted(await self._ensure_fresh())
+
+    async def has_table(self, table_name: str) -> bool:
+        return table_name in await self._ensure_fresh()
+
+    async def get_table(self, table_name: str) -> Optional[Dict[str, Any]]:
+        return (await self._ensure_fresh()).get(table_name)
+
+    async def require_table(self, table_name: str) -> Dict[str, Any]:
+        meta = await self.get_table(table_name)
+        if meta is None:
+            raise ValueError(f"Таблица {table_name} не найдена")
+        return meta
+
+
+schema_registry = SchemaRegistry()
@@ -2,15 +2,23 @@ from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Dict, Any, Union
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, func, extract, desc, text
+from sqlalchemy import select, delete, update, func, extract, desc, text
 from sqlalchemy.orm import selectinload
 
+from app.core.cache import LRUCache
+
 from app.models import (
     User, Survey, Question, Option, Tag, 
     SurveyResponse, UserAnswer, SurveyStatus, QuestionType, UserRole,
     survey_tags
 )
 from app.schemas import SurveyCreateForm
+from app.services.rollups import ActivityRollupService, CohortRollupService, DurationStatsService
+
+# Кэш страницы результатов: survey_id -> (data_version, payload).
+# Актуальность проверяется по surveys.data_version, TTL ограничивает устаревание
+# бенчмарков, которые зависят от ответов на другие опросы категории.
+results_cache = LRUCache("survey_results", max_size=256, ttl=300)
 
 
 class SurveyService:
@@ -152,22 +160,10 @@ class SurveyService:
         if survey.author_id != user.user_id and user.role != UserRole.admin:
             raise HTTPException(status_code=403, detail="Нет прав на удаление")
         
+        await CohortRollupService(self.db).remove_surveys([survey_id])
         await self.db.delete(survey)
         await self.db.commit()
-
-    async def get_user_stats(self, user_id: int):
-        """Возвращает статистику для обновления UI после удаления."""
-        created_count = await self.db.scalar(
-            select(func.count()).select_from(Survey).where(Survey.author_id == user_id)
-        )
-        taken_query = (
-            select(SurveyResponse)
-            .where(SurveyResponse.user_id == user_id)
-            .options(selectinload(SurveyResponse.survey))
-            .order_by(SurveyResponse.started_at.desc())
-        )
-        taken_responses = (await self.db.execute(taken_query)).scalars().all()
-        return created_count, taken_responses
+        results_cache.pop(survey_id)
 
     async def process_survey_submission(self, user: User, survey_id: int, form_data: Any, client_host: str):
         """Валидирует ответы и сохраняет их в БД."""
@@ -239,12 +235,27 @@ class SurveyService:
             )
             self.db.add(response_obj)
             await self.db.flush()
+            await ActivityRollupService(self.db).record(survey_id, response_obj.started_at, starts=1, completions=1)
         else:
             await self.db.execute(
                 delete(UserAnswer).where(UserAnswer.response_id == response_obj.response_id)
             )
+            if response_obj.completed_at is None:
+                await ActivityRollupService(self.db).record(survey_id, response_obj.started_at, completions=1)
         
+        previous_completed_at = response_obj.completed_at
         response_obj.completed_at = datetime.now(timezone.utc)
+        await CohortRollupService(self.db).record_completion(
+            user.user_id, user.registration_date, response_obj.response_id,
+            response_obj.completed_at, previous_completed_at
+        )
+        previous_sec = (
+            (previous_completed_at - response_obj.started_at).total_seconds()
+            if previous_completed_at is not None else None
+        )
+        await DurationStatsService(self.db).record(
+            survey_id, (response_obj.completed_at - response_obj.started_at).total_seconds(), previous_sec
+        )
 
         for q_id, info in cleaned_data.items():
             for val in info["values"]:
@@ -255,7 +266,22 @@ class SurveyService:
                     new_ans.selected_option_id = val
                 self.db.add(new_ans)
 
+        await self.bump_survey_version(survey_id)
         await self.db.commit()
+
+    async def get_survey_version(self, survey_id: int) -> Optional[int]:
+        """Текущая версия данных опроса (None, если опроса нет)."""
+        return await self.db.scalar(
+            select(Survey.data_version).where(Survey.survey_id == survey_id)
+        )
+
+    async def bump_survey_version(self, survey_id: int):
+        """Увеличивает версию данных опроса (коммит остается за вызывающим кодом)."""
+        await self.db.execute(
+            update(Survey)
+            .where(Survey.survey_id == survey_id)
+            .values(data_version=Survey.data_version + 1)
+        )
     
     async def get_recommendations(self, user_id: int, limit: int = 3) -> List[Survey]:
         """
@@ -359,6 +385,32 @@ class SurveyService:
             
         return {"survey": survey, "questions": analytics}
     
+    async def get_survey_results(self, survey_id: int):
+        """
+        Аналитика и бенчмарки для страницы результатов с кэшированием.
+        Пересчет происходит только если с момента последнего расчета изменилась
+        версия данных опроса (новый ответ или правка в админке).
+        """
+        version = await self.get_survey_version(survey_id)
+        if version is None:
+            return None
+
+        cached = results_cache.get(survey_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        data = await self.get_survey_analytics(survey_id)
+        if not data:
+            return None
+
+        payload = {
+            "survey": data["survey"],
+            "questions": data["questions"],
+            "benchmarks": await self.get_survey_benchmark_data(survey_id)
+        }
+        results_cache.set(survey_id, (version, payload))
+        return payload
+
     async def search_surveys(self, query_str: str) -> List[Survey]:
         """Умный поиск через SQL функцию."""
         if not query_str.strip():
@@ -416,3 +468,65 @@ class SurveyService:
         """)
         result = await self.db.execute(query, {"id": survey_id})
         return result
+
+    async def get_survey_export_wide(self, survey_id: int):
+        """
+        Экспорт в "широком" формате: одна строка на прохождение, одна колонка на вопрос.
+
+        Ответы читаются одним потоком, упорядоченным по response_id, и собираются
+        в строку по мере чтения, поэтому в памяти находится только текущее
+        прохождение (а не весь опрос). Несколько вариантов multiple_choice
+        склеиваются через "; ".
+        Возвращает: заголовок (list) и асинхронный генератор строк.
+        """
+        q_query = (
+            select(Question.question_id, Question.question_text)
+            .where(Question.survey_id == survey_id)
+            .order_by(Question.position, Question.question_id)
+        )
+        questions = (await self.db.execute(q_query)).all()
+        q_index = {q.question_id: i for i, q in enumerate(questions)}
+
+        header = ["ID ответа", "Имя респондента", "Возраст", "Дата завершения"]
+        header += [q.question_text for q in questions]
+
+        query = text("""
+            SELECT
+                sr.response_id,
+                u.full_name AS respondent_name,
+                EXTRACT(YEAR FROM AGE(u.birth_date)) AS respondent_age,
+                sr.completed_at,
+                ua.question_id,
+                COALESCE(o.option_text, ua.text_answer) AS answer_content
+            FROM survey_responses sr
+            JOIN user_answers ua ON ua.response_id = sr.response_id
+            LEFT JOIN options o ON o.option_id = ua.selected_option_id
+            LEFT JOIN users u ON u.user_id = sr.user_id
+            WHERE sr.survey_id = :id AND sr.completed_at IS NOT NULL
+            ORDER BY sr.response_id, ua.question_id, ua.answer_id
+        """)
+        result = await self.db.stream(query, {"id": survey_id})
+
+        def build_row(first, answers):
+            cells = ["; ".join(a) if a else "" for a in answers]
+            age = int(first.respondent_age) if first.respondent_age is not None else ""
+            return [first.response_id, first.respondent_name or "", age, first.completed_at, *cells]
+
+        async def iter_rows():
+            current = None
+            answers = []
+            async for row in result:
+                if current is None or row.response_id != current.response_id:
+                    if current is not None:
+                        yield build_row(current, answers)
+                    current = row
+                    answers = [[] for _ in questions]
+
+                idx = q_index.get(row.question_id)
+                if idx is not None and row.answer_content is not None:
+                    answers[idx].append(row.answer_content)
+
+            if current is not None:
+                yield build_row(current, answers)
+
+        return header, iter_rows()
@@ -0,0 +1,342 @@
+import asyncio
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import UploadFile
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.security import get_password_hash
+from app.services.schema_registry import schema_registry
+
+STAGE_TABLE = "_import_stage"
+HASH_TABLE = "_import_hashes"
+CHUNK_SIZE = 1 << 16
+HASH_BATCH_SIZE = 256
+# Сколько отклоненных строк показываем в отчете (всего считаем все)
+REJECTED_PREVIEW = 50
+
+# Хеширование паролей (argon2) — CPU-bound, отпускает GIL, поэтому пул потоков
+_hash_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="import-hash")
+
+_INT_TYPES = {"smallint": (-32768, 32767), "integer": (-2147483648, 2147483647),
+              "bigint": (-9223372036854775808, 9223372036854775807)}
+
+# Строгие форматы, которые почти всегда приходят в CSV (в том числе из нашего экспорта).
+# Значения в таком формате проверяются одним приведением всей колонки; построчная
+# проверка через функцию нужна только для остальных значений
+_FORMAT_RE = {
+    "date": r"^\s*\d{4}-\d{1,2}-\d{1,2}\s*$",
+    "timestamp without time zone":
+        r"^\s*\d{4}-\d{1,2}-\d{1,2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d{1,6})?)?)?\s*$",
+    "timestamp with time zone":
+        r"^\s*\d{4}-\d{1,2}-\d{1,2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d{1,6})?)?)?\s*([+-]\d{2}(:?\d{2})?|Z)?\s*$",
+    "inet": r"^\s*(\d{1,3}\.){3}\d{1,3}(/\d{1,2})?\s*$",
+}
+
+# Построчная проверка значения произвольного типа без падения всего запроса
+# (в PG15 нет pg_input_is_valid): подтранзакция на значение, поэтому только как запасной путь
+_VALUE_OK_FUNC = """
+    CREATE OR REPLACE FUNCTION pg_temp.import_value_ok(v text, t text) RETURNS boolean
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        EXECUTE format('SELECT %L::%s', v, t);
+        RETURN true;
+    EXCEPTION WHEN others THEN
+        RETURN false;
+    END $$
+"""
+
+
+def _is_secret_column(col: str) -> bool:
+    """То же правило, что в create_row: такие колонки хешируются."""
+    return 'password' in col or 'hash' in col
+
+
+def _hash_batch(values: List[str]) -> List[tuple]:
+    return [(v, get_password_hash(v)) for v in values]
+
+
+class TableImportService:
+    """
+    Массовый импорт CSV в таблицу админки.
+
+    Файл потоком заливается через COPY во временную таблицу из text-колонок,
+    затем типы, длины, NOT NULL и внешние ключи проверяются запросами по всей
+    пачке (без запроса на строку), и валидные строки переносятся в целевую
+    таблицу одним INSERT ... SELECT.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _get_target_columns(self, table_name: str) -> Dict[str, Dict[str, Any]]:
+        """Точные типы колонок из каталога (format_type), а также NOT NULL / DEFAULT / генерируемость."""
+        res = await self.db.execute(text("""
+            SELECT a.attname AS name,
+                   format_type(a.atttypid, a.atttypmod) AS sql_type,
+                   a.atttypmod - 4 AS char_len,
+                   t.typtype = 'e' AS is_enum,
+                   a.attnotnull AS not_null,
+                   a.atthasdef OR a.attidentity <> '' AS has_default,
+                   a.attgenerated <> '' OR a.attidentity = 'a' AS read_only
+            FROM pg_attribute a
+            JOIN pg_type t ON t.oid = a.atttypid
+            WHERE a.attrelid = to_regclass(:t) AND a.attnum > 0 AND NOT a.attisdropped
+            ORDER BY a.attnum
+        """), {"t": f'"{table_name}"'})
+        return {r.name: dict(r._mapping) for r in res.all()}
+
+    @staticmethod
+    async def _read_header(file: UploadFile) -> tuple:
+        """Читает первую строку CSV (заголовок), возвращает (колонки, разделитель, остаток первого чанка)."""
+        head = await file.read(CHUNK_SIZE)
+        while b"\n" not in head:
+            more = await file.read(CHUNK_SIZE)
+            if not more:
+                break
+            head += more
+
+        if head.startswith(b"\xef\xbb\xbf"):  # BOM из нашего же экспорта / Excel
+            head = head[3:]
+        header_line, _, rest = head.partition(b"\n")
+        header_text = header_line.decode("utf-8").rstrip("\r")
+
+        delimiter = ";" if header_text.count(";") > header_text.count(",") else ","
+        columns = [c.strip() for c in next(csv.reader([header_text], delimiter=delimiter))]
+        return columns, delimiter, rest
+
+    @staticmethod
+    async def _iter_body(first_chunk: bytes, file: UploadFile) -> AsyncIterator[bytes]:
+        if first_chunk:
+            yield first_chunk
+        while chunk := await file.read(CHUNK_SIZE):
+            yield chunk
+
+    @staticmethod
+    def _is_text(sql_type: str) -> bool:
+        return sql_type == "text" or sql_type.startswith("character")
+
+    @staticmethod
+    def _needs_cast_check(info: Dict[str, Any]) -> bool:
+        """Типы без собственной проверки в _error_checks (даты, inet и т.п.)."""
+        sql_type = info["sql_type"]
+        return not (
+            sql_type in _INT_TYPES or sql_type.startswith("numeric") or sql_type in ("real", "double precision", "boolean")
+            or TableImportService._is_text(sql_type) or info["is_enum"]
+        )
+
+    def _error_checks(self, columns: List[str], target: Dict[str, Dict[str, Any]]) -> List[str]:
+        """WHEN-ветки CASE: первая сработавшая проверка становится причиной отказа строки."""
+        checks = []
+        for col in columns:
+            info = target[col]
+            sql_type = info["sql_type"]
+            ref = f'"{col}"'
+            # Пустое значение — как в итоговом приведении: для не-текстовых типов пробелы тоже пусто
+            blank = f"{ref} = ''" if self._is_text(sql_type) else f"trim({ref}) = ''"
+
+            if info["not_null"] and not info["has_default"]:
+                checks.append(f"WHEN {ref} IS NULL OR {blank} THEN '{col}: обязательное поле'")
+
+            value = f"{ref} IS NOT NULL AND NOT ({blank})"
+            if sql_type in _INT_TYPES:
+                low, high = _INT_TYPES[sql_type]
+                checks.append(f"WHEN {value} AND {ref} !~ '^\\s*[-+]?\\d{{1,19}}\\s*$' THEN '{col}: ожидается целое число'")
+                checks.append(f"WHEN {value} AND {ref}::numeric NOT BETWEEN {low} AND {high} THEN '{col}: число вне диапазона'")
+            elif sql_type.startswith("numeric") or sql_type in ("real", "double precision"):
+                checks.append(
+                    f"WHEN {value} AND {ref} !~ '^\\s*[-+]?(\\d+\\.?\\d*|\\.\\d+)([eE][-+]?\\d+)?\\s*$' "
+                    f"THEN '{col}: ожидается число'"
+                )
+            elif sql_type == "boolean":
+                checks.append(
+                    f"WHEN {value} AND lower(trim({ref})) NOT IN ('true', 'false', 't', 'f', '1', '0', 'yes', 'no') "
+                    f"THEN '{col}: ожидается true/false'"
+                )
+            elif sql_type.startswith("character varying(") or sql_type.startswith("character("):
+                checks.append(f"WHEN length({ref}) > {info['char_len']} THEN '{col}: длиннее {info['char_len']} символов'")
+            elif info["is_enum"]:
+                checks.append(
+                    f"WHEN {value} AND NOT (trim({ref}) = ANY(enum_range(NULL::{sql_type})::text[])) "
+                    f"THEN '{col}: недопустимое значение'"
+                )
+        return checks
+
+    async def _check_cast(self, col: str, sql_type: str):
+        """
+        Формат даты / времени / inet и т.п. Значения строгого формата проверяются одним
+        приведением всей колонки в savepoint; построчно (подтранзакция на значение) —
+        только значения другого формата, либо все, если общее приведение упало.
+        """
+        ref = f'"{col}"'
+        present = f"_error IS NULL AND {ref} IS NOT NULL AND trim({ref}) <> ''"
+        mark = f"UPDATE {STAGE_TABLE} SET _error = '{col}: неверный формат ({sql_type})' WHERE {present}"
+        per_row = f"NOT pg_temp.import_value_ok({ref}, '{sql_type}')"
+
+        pattern = _FORMAT_RE.get(sql_type)
+        if pattern is None:
+            await self.db.execute(text(f"{mark} AND {per_row}"))
+            return
+
+        await self.db.execute(text(f"{mark} AND {ref} !~ :pattern AND {per_row}"), {"pattern": pattern})
+        try:
+            async with self.db.begin_nested():
+                await self.db.execute(text(
+                    f"SELECT COUNT(CAST(trim({ref}) AS {sql_type})) FROM {STAGE_TABLE} WHERE {present} AND {ref} ~ :pattern"
+                ), {"pattern": pattern})
+        except DBAPIError:
+            # Формат верный, значение нет (например, 2025-02-30): ищем такие строки построчно
+            await self.db.execute(text(f"{mark} AND {ref} ~ :pattern AND {per_row}"), {"pattern": pattern})
+
+    async def _check_fk(self, col: str, sql_type: str, fk: dict):
+        """Внешний ключ: один anti-join всей пачки со связанной таблицей."""
+        ref_table, ref_col = fk["referred_table"], fk["referred_columns"][0]
+        # Значение сравнивается в том же виде, в каком попадет в целевую таблицу
+        value = f'st."{col}"' if self._is_text(sql_type) else f'CAST(trim(st."{col}") AS {sql_type})'
+        await self.db.execute(text(f"""
+            UPDATE {STAGE_TABLE} s SET _error = '{col}: нет записи в {ref_table}'
+            FROM (
+                SELECT st._line
+                FROM {STAGE_TABLE} st
+                LEFT JOIN "{ref_table}" r ON r."{ref_col}" = {value}
+                WHERE st._error IS NULL AND trim(st."{col}") <> '' AND r."{ref_col}" IS NULL
+            ) missing
+            WHERE s._line = missing._line
+        """))
+
+    async def _validate(self, columns: List[str], target: Dict[str, Dict[str, Any]], fks: Dict[str, dict]):
+        """
+        Проверка всей пачки: сначала дешевые проверки одним UPDATE, затем форматы,
+        которые проверяются только приведением, и в конце внешние ключи — по строкам,
+        уже прошедшим проверку типа. У строки остается первая найденная причина.
+        """
+        checks = self._error_checks(columns, target)
+        if checks:
+            await self.db.execute(text(f"UPDATE {STAGE_TABLE} SET _error = CASE {' '.join(checks)} END"))
+
+        cast_columns = [c for c in columns if self._needs_cast_check(target[c])]
+        if cast_columns:
+            await self.db.execute(text(_VALUE_OK_FUNC))
+        for col in cast_columns:
+            await self._check_cast(col, target[col]["sql_type"])
+
+        for col, fk in fks.items():
+            await self._check_fk(col, target[col]["sql_type"], fk)
+
+    async def _hash_secrets(self, columns: List[str]):
+        """Хеширует пароли пачками в пуле потоков; одинаковые значения хешируются один раз."""
+        loop = asyncio.get_running_loop()
+        for col in filter(_is_secret_column, columns):
+            res = await self.db.execute(text(
+                f'SELECT DISTINCT "{col}" FROM {STAGE_TABLE} WHERE _error IS NULL AND "{col}" IS NOT NULL AND "{col}" <> \'\''
+            ))
+            plain = [r[0] for r in res.all()]
+            if not plain:
+                continue
+
+            batches = [plain[i:i + HASH_BATCH_SIZE] for i in range(0, len(plain), HASH_BATCH_SIZE)]
+            results = await asyncio.gather(*(loop.run_in_executor(_hash_executor, _hash_batch, b) for b in batches))
+
+            await self.db.execute(text(
+                f"CREATE TEMP TABLE IF NOT EXISTS {HASH_TABLE} (plain text, hashed text) ON COMMIT DROP"
+            ))
+            await self.db.execute(text(f"TRUNCATE {HASH_TABLE}"))
+            raw = await self._raw_connection()
+            await raw.copy_records_to_table(HASH_TABLE, records=[pair for batch in results for pair in batch])
+            await self.db.execute(text(
+                f'UPDATE {STAGE_TABLE} s SET "{col}" = h.hashed FROM {HASH_TABLE} h WHERE s."{col}" = h.plain'
+            ))
+
+    async def _raw_connection(self):
+        """asyncpg-соединение текущей сессии (та же транзакция) — для COPY."""
+        conn = await self.db.connection()
+        raw = await conn.get_raw_connection()
+        return raw.driver_connection
+
+    async def import_csv(self, table_name: str, file: UploadFile) -> Dict[str, Any]:
+        """
+        Импортирует CSV (первая строка — имена колонок) в таблицу.
+        Возвращает отчет: сколько строк прочитано, вставлено, отклонено и примеры отказов.
+        """
+        meta = await schema_registry.require_table(table_name)
+        target = await self._get_target_columns(table_name)
+
+        columns, delimiter, rest = await self._read_header(file)
+        unknown = [c for c in columns if c not in target]
+        if unknown:
+            raise ValueError(f"Неизвестные колонки: {', '.join(unknown)}")
+        read_only = [c for c in columns if target[c]["read_only"]]
+        if read_only:
+            raise ValueError(f"Колонки заполняются автоматически: {', '.join(read_only)}")
+        missing = [c for c, info in target.items()
+                   if info["not_null"] and not info["has_default"] and not info["read_only"] and c not in columns]
+        if missing:
+            raise ValueError(f"Не хватает обязательных колонок: {', '.join(missing)}")
+
+        # 1. Staging: все колонки text, чтобы COPY не падал на первом же кривом значении
+        stage_cols = ", ".join(f'"{c}" text' for c in columns)
+        await self.db.execute(text(
+            f"CREATE TEMP TABLE {STAGE_TABLE} (_line bigint GENERATED ALWAYS AS IDENTITY, {stage_cols}, _error text) "
+            f"ON COMMIT DROP"
+        ))
+
+        # 2. COPY потоком из загруженного файла
+        raw = await self._raw_connection()
+        await raw.copy_to_table(
+            STAGE_TABLE,
+            source=self._iter_body(rest, file),
+            columns=columns,
+            format="csv",
+            delimiter=delimiter
+        )
+
+        # 3. Проверка всей пачки
+        fks = {fk['constrained_columns'][0]: fk for fk in meta['fks'] if fk['constrained_columns'][0] in columns}
+        await self._validate(columns, target, fks)
+
+        # 4. Пароли
+        await self._hash_secrets(columns)
+
+        # 5. Перенос валидных строк одним запросом; дубли по уникальным ключам пропускаются
+        casts = []
+        for col in columns:
+            sql_type = target[col]["sql_type"]
+            if self._is_text(sql_type):
+                casts.append(f'"{col}"')
+            else:
+                casts.append(f"NULLIF(trim(\"{col}\"), '')::{sql_type}")
+        col_list = ", ".join(f'"{c}"' for c in columns)
+        insert_res = await self.db.execute(text(
+            f'INSERT INTO "{table_name}" ({col_list}) '
+            f'SELECT {", ".join(casts)} FROM {STAGE_TABLE} WHERE _error IS NULL ORDER BY _line '
+            f'ON CONFLICT DO NOTHING'
+        ))
+        inserted = insert_res.rowcount
+
+        # Если ID пришли из файла (например, из нашего экспорта), двигаем sequence вперед
+        pk_col = meta['pk_col']
+        if pk_col in columns and inserted:
+            await self.db.execute(text(f"""
+                SELECT setval(seq, GREATEST((SELECT MAX("{pk_col}") FROM "{table_name}"), 1))
+                FROM pg_get_serial_sequence(:t, :c) AS seq WHERE seq IS NOT NULL
+            """), {"t": f'"{table_name}"', "c": pk_col})
+
+        # 6. Отчет
+        totals = (await self.db.execute(text(
+            f"SELECT COUNT(*) AS total, COUNT(_error) AS rejected FROM {STAGE_TABLE}"
+        ))).one()
+        rejected_rows = (await self.db.execute(text(
+            f"SELECT _line + 1 AS line, _error AS error FROM {STAGE_TABLE} WHERE _error IS NOT NULL ORDER BY _line LIMIT {REJECTED_PREVIEW}"
+        ))).all()
+
+        return {
+            "total": totals.total,
+            "inserted": inserted,
+            "rejected": totals.rejected,
+            "duplicates": totals.total - totals.rejected - inserted,
+            "rejected_rows": [(r.line, r.error) for r in rejected_rows]
+        }
@@ -0,0 +1,188 @@
+import ipaddress
+import math
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import types as sqltypes
+from sqlalchemy.dialects.postgresql import INET
+
+# Минимальная длина подстроки, при которой триграммный GIN индекс может помочь
+TRGM_MIN_LENGTH = 3
+
+_INT_RE = re.compile(r"^-?\d{1,18}$")
+_COLUMN_FILTER_RE = re.compile(r"^(\w+):(.+)$")
+
+# Диапазоны целочисленных типов PostgreSQL: значение вне диапазона asyncpg не отправит
+# (DataError на всю страницу), а совпасть с такой колонкой оно и не может
+_INT_LIMITS = ((sqltypes.SmallInteger, 2 ** 15), (sqltypes.BigInteger, 2 ** 63))
+_INT_DEFAULT_LIMIT = 2 ** 31
+
+
+def classify_column(col_type) -> str:
+    """Сводит тип колонки к виду, от которого зависит стратегия поиска."""
+    if isinstance(col_type, sqltypes.Enum):  # Enum наследует String, проверяем первым
+        return "enum"
+    if isinstance(col_type, sqltypes.Boolean):
+        return "bool"
+    if isinstance(col_type, sqltypes.Integer):
+        return "int"
+    if isinstance(col_type, (sqltypes.Numeric, sqltypes.Float)):
+        return "numeric"
+    if isinstance(col_type, sqltypes.DateTime):
+        return "datetime"
+    if isinstance(col_type, sqltypes.Date):
+        return "date"
+    if isinstance(col_type, INET):
+        return "inet"
+    if isinstance(col_type, sqltypes.String):
+        return "text"
+    return "other"
+
+
+def int_fits_column(col_type, value: int) -> bool:
+    """Помещается ли значение в целочисленный тип колонки (smallint / integer / bigint)."""
+    limit = next((lim for cls, lim in _INT_LIMITS if isinstance(col_type, cls)), _INT_DEFAULT_LIMIT)
+    return -limit <= value < limit
+
+
+def parse_date_range(value: str) -> Optional[Tuple[date, date]]:
+    """
+    Распознает дату во вводе и возвращает полуоткрытый диапазон [from, to).
+    Поддерживается: 2025-03-14, 14.03.2025, 2025-03, 03.2025, 2025.
+    """
+    value = value.strip()
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            day = datetime.strptime(value, fmt).date()
+            return day, day + timedelta(days=1)
+        except ValueError:
+            pass
+    for fmt in ("%Y-%m", "%m.%Y"):
+        try:
+            month = datetime.strptime(value, fmt).date()
+            next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+            return month, next_month
+        except ValueError:
+            pass
+    if re.fullmatch(r"(19|20)\d{2}", value):
+        year = int(value)
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    return None
+
+
+class _Planner:
+    """Накопитель условий и параметров для одного поискового запроса."""
+
+    def __init__(self):
+        self.filters: List[str] = []
+        self.params: Dict[str, Any] = {}
+
+    def param(self, value: Any) -> str:
+        name = f"s{len(self.params)}"
+        self.params[name] = value
+        return f":{name}"
+
+    def add_text(self, col: str, value: str):
+        # ILIKE без приведения к ::text — такой предикат может использовать gin_trgm_ops индекс
+        self.filters.append(f'"{col}" ILIKE {self.param(f"%{value}%")}')
+
+    def add_equal(self, col: str, value: Any):
+        self.filters.append(f'"{col}" = {self.param(value)}')
+
+    def add_range(self, col: str, kind: str, start: date, end: date, tz_aware: bool):
+        if kind == "datetime":
+            tz = timezone.utc if tz_aware else None
+            start = datetime(start.year, start.month, start.day, tzinfo=tz)
+            end = datetime(end.year, end.month, end.day, tzinfo=tz)
+        self.filters.append(f'("{col}" >= {self.param(start)} AND "{col}" < {self.param(end)})')
+
+
+def _plan_column(planner: _Planner, col: str, col_type, value: str, kind: str):
+    """Добавляет индекс-дружественные условия для одной колонки, если значение ей подходит."""
+    if kind == "int":
+        if _INT_RE.match(value) and int_fits_column(col_type, int(value)):
+            planner.add_equal(col, int(value))
+    elif kind == "numeric":
+        try:
+            number = float(value.replace(",", "."))
+        except ValueError:
+            return
+        # nan/inf float() принимает, но в поиске это не числа
+        if math.isfinite(number):
+            planner.add_equal(col, number)
+    elif kind in ("date", "datetime"):
+        date_range = parse_date_range(value)
+        if date_range:
+            tz_aware = bool(getattr(col_type, "timezone", False))
+            planner.add_range(col, kind, *date_range, tz_aware=tz_aware)
+    elif kind == "enum":
+        if value in (getattr(col_type, "enums", None) or []):
+            planner.add_equal(col, value)
+    elif kind == "bool":
+        if value.lower() in ("true", "false"):
+            planner.add_equal(col, value.lower() == "true")
+    elif kind == "inet":
+        try:
+            planner.add_equal(col, ipaddress.ip_address(value))
+        except ValueError:
+            pass
+    elif kind == "text":
+        planner.add_text(col, value)
+
+
+async def build_search_condition(
+    meta: Dict[str, Any],
+    q: Optional[str],
+    get_table: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Планировщик поиска по таблице админки с учетом типов колонок.
+
+    Вместо `"col"::text ILIKE '%q%'` по всем колонкам (всегда seq scan) строит
+    предикаты, которые могут использовать индексы:
+      - число -> равенство по целочисленным колонкам (PK, FK);
+      - дата (2025-03-14, 14.03.2025, 2025-03, 2025) -> полуоткрытый диапазон по датам;
+      - текст -> ILIKE по текстовым колонкам (триграммные GIN индексы);
+      - значение enum / true/false / IP -> равенство;
+      - FK -> подзапрос по колонке отображения связанной таблицы.
+    Синтаксис `колонка:значение` ограничивает поиск одной колонкой.
+
+    Возвращает условие (без WHERE) и параметры, либо (None, {}) без поиска.
+    """
+    if not q or not q.strip():
+        return None, {}
+
+    value = q.strip()
+    columns = meta['columns']
+
+    match = _COLUMN_FILTER_RE.match(value)
+    if match and match.group(1) in meta['column_names']:
+        target, value = match.group(1), match.group(2).strip()
+        columns = [c for c in columns if c['name'] == target]
+
+    planner = _Planner()
+    fk_by_col = {fk['constrained_columns'][0]: fk for fk in meta['fks']}
+
+    for col in columns:
+        name = col['name']
+        kind = classify_column(col['type'])
+        _plan_column(planner, name, col['type'], value, kind)
+
+        # Поиск по связанным таблицам: local_id IN (SELECT id FROM remote WHERE display ILIKE ...)
+        fk = fk_by_col.get(name)
+        if fk and len(value) >= TRGM_MIN_LENGTH and not _INT_RE.match(value):
+            remote_meta = await get_table(fk['referred_table'])
+            display_col = remote_meta['display_col'] if remote_meta else None
+            if display_col:
+                pattern = planner.param(f"%{value}%")
+                planner.filters.append(
+                    f'"{name}" IN (SELECT "{fk["referred_columns"][0]}" FROM "{fk["referred_table"]}" '
+                    f'WHERE "{display_col}" ILIKE {pattern})'
+                )
+
+    if not planner.filters:
+        # Ни одна колонка не может содержать такое значение
+        return "FALSE", {}
+
+    return "(" + " OR ".join(planner.filters) + ")", planner.params
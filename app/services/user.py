@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, tuple_
+
+from app.core.cache import LRUCache
+from app.models import Survey, SurveyResponse, Country
+
+PROFILE_PAGE_SIZE = 20
+
+# Справочник стран меняется только через админку, держим его в памяти процесса
+countries_cache = LRUCache("countries", max_size=1, ttl=3600)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_PK_MAX = 2 ** 31 - 1
+
+
+def encode_cursor(ts: datetime, pk: int) -> str:
+    """Курсор keyset-пагинации: '<микросекунды с эпохи>_<id>' (без URL-экранирования)."""
+    micros = (ts - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{pk}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        micros, pk = cursor.split("_", 1)
+        ts, pk = _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    # id вне int4 asyncpg не отправит (DataError -> 500)
+    if not 1 <= pk <= _PK_MAX:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return ts, pk
+
+
+class UserService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_user_stats(self, user_id: int) -> Tuple[int, int]:
+        """Счетчики профиля: (создано опросов, пройдено опросов) через COUNT, без загрузки строк."""
+        created_count = await self.db.scalar(
+            select(func.count()).select_from(Survey).where(Survey.author_id == user_id)
+        )
+        taken_count = await self.db.scalar(
+            select(func.count()).select_from(SurveyResponse).where(SurveyResponse.user_id == user_id)
+        )
+        return created_count, taken_count
+
+    async def get_history_page(self, user_id: int, cursor: Optional[str] = None, limit: int = PROFILE_PAGE_SIZE):
+        """
+        Страница истории прохождений (новые сверху).
+        Keyset по (started_at, response_id) — стоимость не зависит от номера страницы.
+        Возвращает: список строк и курсор следующей страницы (или None).
+        """
+        query = (
+            select(
+                SurveyResponse.response_id,
+                SurveyResponse.started_at,
+                SurveyResponse.completed_at,
+                Survey.survey_id,
+                Survey.title
+            )
+            .join(Survey, SurveyResponse.survey_id == Survey.survey_id)
+            .where(SurveyResponse.user_id == user_id)
+            .order_by(SurveyResponse.started_at.desc(), SurveyResponse.response_id.desc())
+            .limit(limit + 1)
+        )
+        if cursor:
+            ts, pk = decode_cursor(cursor)
+            query = query.where(tuple_(SurveyResponse.started_at, SurveyResponse.response_id) < (ts, pk))
+
+        rows = (await self.db.execute(query)).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].started_at, rows[-1].response_id)
+        return rows, next_cursor
+
+    async def get_created_surveys_page(self, user_id: int, cursor: Optional[str] = None, limit: int = PROFILE_PAGE_SIZE):
+        """Страница созданных пользователем опросов, keyset по (created_at, survey_id)."""
+        query = (
+            select(Survey)
+            .where(Survey.author_id == user_id)
+            .order_by(Survey.created_at.desc(), Survey.survey_id.desc())
+            .limit(limit + 1)
+        )
+        if cursor:
+            ts, pk = decode_cursor(cursor)
+            query = query.where(tuple_(Survey.created_at, Survey.survey_id) < (ts, pk))
+
+        surveys = (await self.db.execute(query)).scalars().all()
+        next_cursor = None
+        if len(surveys) > limit:
+            surveys = surveys[:limit]
+            next_cursor = encode_cursor(surveys[-1].created_at, surveys[-1].survey_id)
+        return surveys, next_cursor
+
+    async def get_countries(self) -> List[Country]:
+        """Справочник стран (кэшируется на уровне процесса)."""
+        countries = countries_cache.get("all")
+        if countries is None:
+            countries = (await self.db.execute(select(Country).order_by(Country.name))).scalars().all()
+            countries_cache.set("all", countries)
+        return countries
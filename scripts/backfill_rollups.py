@@ -0,0 +1,45 @@
+import asyncio
+import argparse
+import time
+from datetime import date, datetime, timezone
+
+from rich.console import Console
+
+from app.core.database import async_session_maker, engine
+from app.services.rollups import ActivityRollupService, CohortRollupService, DurationStatsService
+
+console = Console()
+
+
+def parse_args():
+    """Парсинг аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Пересчет rollup-таблиц: activity_hourly, cohort_activity, cohort_sizes, survey_duration_stats")
+    parser.add_argument(
+        "--since", type=date.fromisoformat, default=None,
+        help="activity_hourly: только часы начиная с даты YYYY-MM-DD (когорты и длительности пересчитываются целиком)"
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    since = datetime.combine(args.since, datetime.min.time(), tzinfo=timezone.utc) if args.since else None
+
+    async with async_session_maker() as session:
+        session.info["route_class"] = "export"
+        started = time.perf_counter()
+        with console.status("[bold cyan]Пересчет activity_hourly...", spinner="dots"):
+            rows = await ActivityRollupService(session).rebuild(since)
+        with console.status("[bold cyan]Пересчет когорт...", spinner="dots"):
+            await CohortRollupService(session).rebuild()
+        with console.status("[bold cyan]Пересчет статистики длительности...", spinner="dots"):
+            await DurationStatsService(session).rebuild()
+        await session.commit()
+
+    await engine.dispose()
+    scope = f"с {args.since}" if args.since else "целиком"
+    console.print(f"[green]activity_hourly пересчитан {scope}: {rows} строк, когорты и длительности — целиком[/green] [dim]{time.perf_counter() - started:.1f}s[/dim]")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
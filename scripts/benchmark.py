@@ -0,0 +1,275 @@
+import asyncio
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import text, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from starlette.datastructures import FormData
+
+from rich.console import Console
+from rich.table import Table
+
+from app.core.cache import LRUCache
+from app.core.database import engine, async_session_maker
+from app.models import User, Question, QuestionType
+from app.services.admin import AdminService
+from app.services.survey import SurveyService
+from scripts.dataset import dataset_size, insert_dataset, truncate_dataset_tables
+
+console = Console()
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_BASELINE = Path(__file__).resolve().parent.parent / "benchmarks" / "baseline.json"
+
+
+def parse_args():
+    """Парсинг аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Бенчмарк горячих методов сервисов на детерминированном наборе данных")
+    parser.add_argument("--scale", choices=SCALES.keys(), default="10k", help="Размер набора (число прохождений)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed генератора данных (по умолчанию: 42)")
+    parser.add_argument("--no-seed", action="store_true", help="Не пересоздавать данные (набор уже загружен этим скриптом)")
+    parser.add_argument("--repeat", type=int, default=7, help="Замеров на метод (по умолчанию: 7)")
+    parser.add_argument("--warmup", type=int, default=2, help="Прогревочных вызовов на метод (по умолчанию: 2)")
+    parser.add_argument("--only", nargs="*", default=None, help="Запустить только перечисленные бенчмарки")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="JSON с эталонными результатами")
+    parser.add_argument("--update-baseline", action="store_true", help="Записать результаты как новый эталон")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25,
+        help="Допустимый рост медианы относительно эталона (0.25 = +25%%)"
+    )
+    parser.add_argument(
+        "--min-delta-ms", type=float, default=5.0,
+        help="Рост меньше этого значения в мс не считается регрессией (шум)"
+    )
+    return parser.parse_args()
+
+
+# --- ДАННЫЕ ---
+
+async def seed_dataset(session: AsyncSession, size: dict, seed: int):
+    """Очищает БД, загружает детерминированный набор и обновляет статистику планировщика."""
+    with console.status("[bold red]Очистка базы данных...", spinner="dots"):
+        await truncate_dataset_tables(session)
+
+    def report(title: str, seconds: float):
+        console.print(f"[green]{title}[/green] [dim]{seconds:.1f}s[/dim]")
+
+    await insert_dataset(session, size, seed, on_step=report)
+    await session.commit()
+
+    with console.status("[bold cyan]ANALYZE...", spinner="dots"):
+        await session.execute(text("ANALYZE"))
+        await session.commit()
+
+
+# --- БЕНЧМАРКИ ---
+
+async def _consume(rows) -> int:
+    """Дочитывает потоковый результат до конца, как это делает StreamingResponse."""
+    count = 0
+    async for _ in rows:
+        count += 1
+    return count
+
+
+def build_submission_form(questions) -> FormData:
+    """Форма прохождения: первый вариант на каждый вопрос с выбором, текст на текстовые."""
+    items = []
+    for q in questions:
+        if q.question_type == QuestionType.text_answer:
+            items.append((f"q_{q.question_id}", "Ответ из бенчмарка"))
+        elif q.options:
+            items.append((f"q_{q.question_id}", str(q.options[0].option_id)))
+    return FormData(items)
+
+
+async def load_context(session: AsyncSession) -> dict:
+    """Сущности, на которых гоняются методы: самый "тяжелый" опрос и его первый участник."""
+    survey_id = await session.scalar(text("""
+        SELECT survey_id FROM survey_responses
+        GROUP BY survey_id ORDER BY COUNT(*) DESC, survey_id LIMIT 1
+    """))
+    user_id = await session.scalar(text("""
+        SELECT user_id FROM survey_responses WHERE survey_id = :sid ORDER BY response_id LIMIT 1
+    """), {"sid": survey_id})
+    respondent = await session.get(User, user_id)
+    questions = (await session.execute(
+        select(Question).where(Question.survey_id == survey_id)
+        .order_by(Question.position).options(selectinload(Question.options))
+    )).scalars().all()
+    return {"survey_id": survey_id, "user": respondent, "form": build_submission_form(questions)}
+
+
+def build_benchmarks(ctx: dict) -> dict:
+    """Имя -> корутина-фабрика(session). Каждый вызов — одна операция, как ее делает роутер."""
+    survey_id = ctx["survey_id"]
+
+    async def export_table(session):
+        _, result = await AdminService(session).get_data_for_export("survey_responses", None)
+        return await _consume(result)
+
+    async def export_survey_wide(session):
+        _, rows = await SurveyService(session).get_survey_export_wide(survey_id)
+        return await _consume(rows)
+
+    async def export_survey_flat(session):
+        result = await SurveyService(session).get_survey_export_data(survey_id)
+        return len(result.all())
+
+    return {
+        "get_public_surveys": lambda s: SurveyService(s).get_public_surveys(),
+        "get_survey_details": lambda s: SurveyService(s).get_survey_details(survey_id, ctx["user"]),
+        "process_survey_submission": lambda s: SurveyService(s).process_survey_submission(
+            ctx["user"], survey_id, ctx["form"], "127.0.0.1"
+        ),
+        "get_survey_analytics": lambda s: SurveyService(s).get_survey_analytics(survey_id),
+        "get_dashboard_stats": lambda s: AdminService(s).get_dashboard_stats(),
+        "get_cohort_stats": lambda s: AdminService(s).get_cohort_stats(),
+        "get_paginated_table_data": lambda s: AdminService(s).get_paginated_table_data("survey_responses", 1, 100, None),
+        "get_paginated_table_data_search": lambda s: AdminService(s).get_paginated_table_data("users", 1, 100, "Респондент 1"),
+        "export_table_csv": export_table,
+        "export_survey_flat": export_survey_flat,
+        "export_survey_wide": export_survey_wide,
+    }
+
+
+async def run_one(factory, repeat: int, warmup: int) -> dict:
+    """
+    Замеры одного метода. Каждый вызов идет в своей транзакции, которая
+    откатывается (commit() внутри сервиса становится RELEASE SAVEPOINT),
+    поэтому методы с записью не меняют набор между замерами.
+    In-process кэши очищаются перед каждым вызовом — меряем работу с БД.
+    """
+    timings = []
+    for i in range(warmup + repeat):
+        for cache in LRUCache.instances:
+            cache.clear()
+        async with engine.connect() as conn:
+            trans = await conn.begin()
+            session = AsyncSession(bind=conn, expire_on_commit=False, join_transaction_mode="create_savepoint")
+            try:
+                started = time.perf_counter()
+                await factory(session)
+                elapsed = (time.perf_counter() - started) * 1000
+            finally:
+                await session.close()
+                await trans.rollback()
+        if i >= warmup:
+            timings.append(elapsed)
+
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(timings[0], 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        "mean_ms": round(statistics.fmean(timings), 2),
+        "runs": len(timings),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> dict:
+    """Статус каждого метода относительно эталона: ok / regression / faster / new."""
+    statuses = {}
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            statuses[name] = ("new", None)
+            continue
+        ratio = res["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        delta = res["median_ms"] - base["median_ms"]
+        if ratio > 1 + threshold and delta > min_delta_ms:
+            statuses[name] = ("regression", ratio)
+        elif ratio < 1 - threshold and -delta > min_delta_ms:
+            statuses[name] = ("faster", ratio)
+        else:
+            statuses[name] = ("ok", ratio)
+    return statuses
+
+
+def load_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def main():
+    args = parse_args()
+    size = dataset_size(SCALES[args.scale])
+
+    async with async_session_maker() as session:
+        server_version = await session.scalar(text("SHOW server_version"))
+        if not args.no_seed:
+            console.print(f"[bold yellow]Набор {args.scale}: БД будет очищена и заполнена заново[/bold yellow]")
+            await seed_dataset(session, size, args.seed)
+        ctx = await load_context(session)
+
+    benchmarks = build_benchmarks(ctx)
+    if args.only:
+        unknown = set(args.only) - benchmarks.keys()
+        if unknown:
+            console.print(f"[bold red]Неизвестные бенчмарки: {', '.join(sorted(unknown))}[/bold red]")
+            sys.exit(2)
+        benchmarks = {k: v for k, v in benchmarks.items() if k in args.only}
+
+    results = {}
+    for name, factory in benchmarks.items():
+        with console.status(f"[bold magenta]{name}...", spinner="dots"):
+            results[name] = await run_one(factory, args.repeat, args.warmup)
+
+    await engine.dispose()
+
+    baseline_file = load_baseline(args.baseline)
+    baseline = baseline_file.get(args.scale, {})
+    statuses = compare(results, baseline.get("results", {}), args.threshold, args.min_delta_ms)
+
+    table = Table(title=f"Бенчмарк ({args.scale}, seed={args.seed})", header_style="bold magenta")
+    table.add_column("Метод", style="cyan")
+    table.add_column("Медиана, мс", justify="right")
+    table.add_column("p95, мс", justify="right")
+    table.add_column("Эталон, мс", justify="right", style="dim")
+    table.add_column("Изменение", justify="right")
+    styles = {"regression": "bold red", "faster": "green", "ok": "white", "new": "dim"}
+    for name, res in results.items():
+        status, ratio = statuses[name]
+        base = baseline.get("results", {}).get(name)
+        change = f"{(ratio - 1) * 100:+.0f}%" if ratio is not None else "—"
+        table.add_row(
+            name, f"{res['median_ms']:.2f}", f"{res['p95_ms']:.2f}",
+            f"{base['median_ms']:.2f}" if base else "—",
+            f"[{styles[status]}]{change} {status}[/{styles[status]}]"
+        )
+    console.print(table)
+
+    if args.update_baseline:
+        baseline_file[args.scale] = {
+            "dataset": size,
+            "seed": args.seed,
+            "postgres": server_version,
+            "python": platform.python_version(),
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "results": {**baseline.get("results", {}), **results},
+        }
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline_file, f, ensure_ascii=False, indent=2, sort_keys=True)
+        console.print(f"[green]Эталон записан: {args.baseline}[/green]")
+        return
+
+    regressions = [name for name, (status, _) in statuses.items() if status == "regression"]
+    if regressions:
+        console.print(f"[bold red]Регрессия (> +{args.threshold:.0%}): {', '.join(regressions)}[/bold red]")
+        sys.exit(1)
+    if not baseline:
+        console.print("[dim]Эталона для этого масштаба нет — запустите с --update-baseline[/dim]")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
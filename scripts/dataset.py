@@ -0,0 +1,164 @@
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.security import get_password_hash
+from app.services.rollups import ActivityRollupService, CohortRollupService, DurationStatsService
+
+# Фиксированный "сейчас": даты в наборе не зависят от дня запуска
+BENCH_NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+QUESTION_TYPES = [
+    "single_choice", "multiple_choice", "rating", "text_answer",
+    "single_choice", "rating", "single_choice", "text_answer",
+]
+COUNTRIES = ['Россия', 'Беларусь', 'Казахстан', 'Узбекистан', 'Германия', 'США', 'Франция', 'Китай']
+TAGS = [
+    'IT', 'Здоровье', 'Гейминг', 'Образование', 'Работа', 'Психология',
+    'Маркетинг', 'Кино', 'Путешествия', 'Еда', 'Спорт', 'Финансы'
+]
+TABLES = [
+    "user_answers", "survey_responses", "options", "questions",
+    "survey_tags", "tags", "surveys", "users", "countries"
+]
+
+
+def dataset_size(responses: int) -> dict:
+    """Размеры таблиц для заданного числа прохождений."""
+    surveys = max(20, responses // 2000)
+    return {
+        "responses": responses,
+        "users": max(100, responses // 5),
+        "surveys": surveys,
+        "questions_per_survey": len(QUESTION_TYPES),
+    }
+
+
+async def truncate_dataset_tables(session: AsyncSession):
+    """Очистка таблиц с перезапуском последовательностей (набор рассчитывает на id с 1)."""
+    for table in TABLES:
+        await session.execute(text(f"TRUNCATE TABLE {table} RESTART IDENTITY CASCADE;"))
+
+
+async def insert_dataset(
+    session: AsyncSession,
+    size: dict,
+    seed: int,
+    on_step: Optional[Callable[[str, float], None]] = None
+):
+    """
+    Заполняет пустые таблицы целиком на стороне PostgreSQL (generate_series + random()).
+    setseed() и отключенный параллелизм делают набор одинаковым при каждом запуске:
+    те же id, те же ответы, те же распределения. Не коммитит — это делает вызывающий
+    (бенчмарк фиксирует набор, тесты планов откатывают его).
+    """
+    params = {**size, "now": BENCH_NOW, "pw": get_password_hash("123456")}
+
+    await session.execute(text("SET LOCAL max_parallel_workers_per_gather = 0"))
+    await session.execute(text("SELECT setseed(:s)"), {"s": (seed % 2000) / 1000 - 1})
+
+    steps = [
+        ("Справочники", """
+            INSERT INTO countries (name) SELECT unnest(CAST(:countries AS text[]));
+        """, {"countries": COUNTRIES}),
+        ("Теги", """
+            INSERT INTO tags (name) SELECT unnest(CAST(:tags AS text[]));
+        """, {"tags": TAGS}),
+        ("Пользователи", """
+            INSERT INTO users (full_name, email, password_hash, birth_date, city, country_id, role, registration_date)
+            SELECT
+                'Респондент ' || g,
+                CASE WHEN g = 1 THEN 'admin@main.com' ELSE 'bench' || g || '@example.com' END,
+                :pw,
+                CASE WHEN random() < 0.9 THEN DATE '1960-01-01' + (random() * 16000)::int END,
+                'Город ' || (g % 50),
+                1 + (g % 8),
+                CAST(CASE WHEN g = 1 THEN 'admin' ELSE 'user' END AS user_role_enum),
+                CAST(:now AS timestamptz) - random() * interval '365 days'
+            FROM generate_series(1, :users) g
+        """, {}),
+        ("Опросы", """
+            INSERT INTO surveys (title, description, status, author_id, created_at, start_date, end_date)
+            SELECT
+                'Опрос ' || g,
+                'Описание опроса ' || g,
+                CAST(CASE WHEN g % 10 = 0 THEN 'completed' ELSE 'active' END AS survey_status),
+                1,
+                CAST(:now AS timestamptz) - interval '400 days',
+                CAST(:now AS timestamptz) - interval '380 days',
+                CAST(:now AS timestamptz) + interval '30 days'
+            FROM generate_series(1, :surveys) g
+        """, {}),
+        ("Теги опросов", """
+            INSERT INTO survey_tags (survey_id, tag_id)
+            SELECT s, 1 + (s % 12) FROM generate_series(1, :surveys) s
+            UNION
+            SELECT s, 1 + ((s + 5) % 12) FROM generate_series(1, :surveys) s
+        """, {}),
+        ("Вопросы", """
+            INSERT INTO questions (survey_id, question_text, question_type, position, is_required)
+            SELECT s, 'Вопрос ' || p || ' опроса ' || s, CAST((CAST(:types AS text[]))[p] AS question_type_enum), p, true
+            FROM generate_series(1, :surveys) s, generate_series(1, :questions_per_survey) p
+            ORDER BY s, p
+        """, {"types": QUESTION_TYPES}),
+        ("Варианты", """
+            INSERT INTO options (question_id, option_text)
+            SELECT q.question_id, CASE WHEN q.question_type = 'rating' THEN k::text ELSE 'Вариант ' || k END
+            FROM questions q
+            CROSS JOIN LATERAL generate_series(1, CASE WHEN q.question_type = 'rating' THEN 5 ELSE 4 END) k
+            WHERE q.question_type <> 'text_answer'
+            ORDER BY q.question_id, k
+        """, {}),
+        # Пара (survey_id, user_id) уникальна: i / surveys < users при любом масштабе
+        ("Прохождения", """
+            INSERT INTO survey_responses (survey_id, user_id, started_at, completed_at, ip_address, device_type)
+            SELECT
+                1 + (i % :surveys),
+                1 + (i / :surveys),
+                st,
+                CASE WHEN random() < 0.85 THEN st + (45 + random() * 855) * interval '1 second' END,
+                CAST('10.' || (i / 65536 % 256) || '.' || (i / 256 % 256) || '.' || (i % 256) AS inet),
+                (ARRAY['Desktop', 'Mobile', 'Tablet'])[1 + (i % 3)]
+            FROM (
+                SELECT i, CAST(:now AS timestamptz) - random() * interval '365 days' AS st
+                FROM generate_series(0, :responses - 1) i
+            ) x
+        """, {}),
+        # Подзапрос с ORDER BY не разворачивается планировщиком, поэтому random()
+        # вызывается в одном и том же порядке строк
+        ("Ответы", """
+            WITH qo AS (
+                SELECT question_id, MIN(option_id) AS first_id, COUNT(*) AS cnt
+                FROM options GROUP BY question_id
+            )
+            INSERT INTO user_answers (response_id, question_id, selected_option_id, text_answer)
+            SELECT
+                response_id,
+                question_id,
+                CASE WHEN first_id IS NOT NULL THEN first_id + floor(random() * cnt)::int END,
+                CASE WHEN first_id IS NULL THEN 'Ответ респондента ' || response_id END
+            FROM (
+                SELECT r.response_id, q.question_id, qo.first_id, qo.cnt
+                FROM survey_responses r
+                JOIN questions q ON q.survey_id = r.survey_id
+                LEFT JOIN qo ON qo.question_id = q.question_id
+                WHERE r.completed_at IS NOT NULL
+                ORDER BY r.response_id, q.question_id
+            ) a
+        """, {}),
+    ]
+
+    for title, sql, extra in steps:
+        started = time.perf_counter()
+        await session.execute(text(sql), {**params, **extra})
+        if on_step:
+            on_step(title, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await ActivityRollupService(session).rebuild()
+    await CohortRollupService(session).rebuild()
+    await DurationStatsService(session).rebuild()
+    if on_step:
+        on_step("Rollup-таблицы", time.perf_counter() - started)
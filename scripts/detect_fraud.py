@@ -0,0 +1,61 @@
+import asyncio
+import argparse
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from rich.console import Console
+
+from app.core.database import async_session_maker, engine
+from app.services.fraud import FraudDetectionService
+
+console = Console()
+
+
+def parse_args():
+    """Парсинг аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Пакетный поиск подозрительных прохождений (response_flags)")
+    parser.add_argument(
+        "--since", type=date.fromisoformat, default=None,
+        help="Только прохождения, начатые с даты YYYY-MM-DD (по умолчанию вся история)"
+    )
+    parser.add_argument(
+        "--days", type=int, default=None,
+        help="Только последние N дней (для запуска по расписанию)"
+    )
+    parser.add_argument(
+        "--partition-hours", type=int, default=24,
+        help="Размер партиции по started_at; память пропорциональна числу ответов в партиции"
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    since = None
+    if args.since:
+        since = datetime.combine(args.since, datetime.min.time(), tzinfo=timezone.utc)
+    elif args.days:
+        since = datetime.now(timezone.utc) - timedelta(days=args.days)
+
+    def report(lo, hi, stats):
+        console.print(
+            f"[dim]{lo:%Y-%m-%d %H:%M} — {hi:%Y-%m-%d %H:%M}[/dim] "
+            f"прохождений: {stats['responses']}, ответов: {stats['answers']}, помечено: [bold]{stats['flagged']}[/bold]"
+        )
+
+    async with async_session_maker() as session:
+        session.info["route_class"] = "export"
+        started = time.perf_counter()
+        totals = await FraudDetectionService(session).run(
+            since, timedelta(hours=args.partition_hours), on_partition=report
+        )
+
+    await engine.dispose()
+    console.print(
+        f"[green]Партиций: {totals['partitions']}, прохождений: {totals['responses']}, "
+        f"помечено: {totals['flagged']}[/green] [dim]{time.perf_counter() - started:.1f}s[/dim]"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,401 @@
+import asyncio
+import argparse
+import json
+import math
+import random
+import re
+import secrets
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import select, text
+from sqlalchemy.orm import selectinload
+
+from rich.console import Console
+from rich.table import Table
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.models import Survey, Question, QuestionType, SurveyStatus
+
+console = Console()
+
+DEFAULT_PASSWORD = "123456"
+DEFAULT_MIX = "browse=60,take=35,admin=5"
+# Какие ряды /metrics отслеживаем для графика насыщения пула
+_METRIC_RE = re.compile(r"^(db_pool_checked_out|db_pool_size|http_requests_in_flight|db_pool_checkout_timeouts_total|"
+                        r"db_pool_checkout_wait_seconds_sum|db_pool_checkout_wait_seconds_count) ([0-9.e+-]+)$", re.M)
+
+
+def parse_args():
+    """Парсинг аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон сценариев респондента (in-process ASGI или URL)")
+    parser.add_argument("--url", default=None, help="Адрес запущенного сервера; без него приложение гоняется в процессе")
+    parser.add_argument("--concurrency", type=int, default=20, help="Число виртуальных пользователей (по умолчанию: 20)")
+    parser.add_argument("--duration", type=float, default=30, help="Длительность прогона, с (по умолчанию: 30)")
+    parser.add_argument("--ramp-up", type=float, default=5, help="За сколько секунд стартуют все пользователи")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Веса сценариев (по умолчанию: {DEFAULT_MIX})")
+    parser.add_argument("--think-ms", type=int, default=0, help="Пауза между шагами сценария, мс")
+    parser.add_argument("--timeout", type=float, default=30, help="Таймаут одного HTTP-запроса, с")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Период опроса /metrics, с")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="Пароль тестовых пользователей")
+    parser.add_argument("--admin-email", default="admin@main.com", help="Учетная запись для сценария admin")
+    parser.add_argument("--seed", type=int, default=1, help="Seed выбора сценариев и опросов")
+    parser.add_argument("--json", type=Path, default=None, help="Сохранить отчет в JSON")
+    return parser.parse_args()
+
+
+def parse_mix(raw: str) -> Dict[str, float]:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Неизвестный сценарий: {name} (есть: {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга (значения уже отсортированы)."""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values), max(1, math.ceil(pct / 100 * len(sorted_values)))) - 1
+    return sorted_values[rank]
+
+
+# --- ДАННЫЕ ДЛЯ СЦЕНАРИЕВ ---
+
+@dataclass
+class SurveyForm:
+    survey_id: int
+    fields: Dict[str, str]
+
+
+async def load_fixtures(concurrency: int) -> Tuple[List[SurveyForm], List[str]]:
+    """Активные опросы (с готовыми ответами на форму) и email респондентов из текущей БД."""
+    async with async_session_maker() as session:
+        surveys = (await session.execute(
+            select(Survey)
+            .where(Survey.status == SurveyStatus.active)
+            .options(selectinload(Survey.questions).selectinload(Question.options))
+            .order_by(Survey.survey_id)
+            .limit(50)
+        )).scalars().all()
+        emails = (await session.execute(text("""
+            SELECT email FROM users WHERE role = 'user' ORDER BY user_id LIMIT :n
+        """), {"n": concurrency})).scalars().all()
+
+    forms = []
+    for survey in surveys:
+        fields = {}
+        for q in survey.questions:
+            if q.question_type == QuestionType.text_answer:
+                fields[f"q_{q.question_id}"] = "Ответ нагрузочного теста"
+            elif q.options:
+                fields[f"q_{q.question_id}"] = str(q.options[0].option_id)
+        forms.append(SurveyForm(survey.survey_id, fields))
+    return forms, list(emails)
+
+
+# --- ЗАМЕРЫ ---
+
+@dataclass
+class Sample:
+    step: str
+    started: float
+    latency: float
+    status: int
+
+
+@dataclass
+class Recorder:
+    started: float = field(default_factory=time.perf_counter)
+    samples: List[Sample] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    async def request(self, client: httpx.AsyncClient, step: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, 0
+            self.errors[f"{step}: {type(e).__name__}"] += 1
+        self.samples.append(Sample(step, started - self.started, time.perf_counter() - started, status))
+        if 400 <= status:
+            self.errors[f"{step}: HTTP {status}"] += 1
+        return response
+
+
+# --- СЦЕНАРИИ ---
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> bool:
+    """
+    Вход через POST /login. Куки переносятся вручную: сервер ставит их с Secure,
+    а httpx не отправляет такие куки на http://.
+    """
+    csrf = secrets.token_hex(16)
+    client.cookies.set("csrf_token", csrf)
+    response = await client.post("/login", data={"email": email, "password": password, "csrf_token": csrf})
+    if response.status_code != 302:
+        return False
+    for name in ("access_token", "refresh_token"):
+        if name in response.cookies:
+            client.cookies.set(name, response.cookies[name])
+    return True
+
+
+async def scenario_browse(ctx: "VirtualUser"):
+    """Аноним: главная, затем страница случайного опроса."""
+    await ctx.step("GET /", "GET", "/", anonymous=True)
+    await ctx.step("GET /surveys/{id}", "GET", f"/surveys/{ctx.pick_survey().survey_id}", anonymous=True)
+
+
+async def scenario_take(ctx: "VirtualUser"):
+    """Респондент: главная, опрос, отправка ответов (303 на страницу опроса)."""
+    survey = ctx.pick_survey()
+    await ctx.step("GET /", "GET", "/")
+    await ctx.step("GET /surveys/{id}", "GET", f"/surveys/{survey.survey_id}")
+    await ctx.step("POST /surveys/{id}/submit", "POST", f"/surveys/{survey.survey_id}/submit", data=survey.fields)
+
+
+async def scenario_admin(ctx: "VirtualUser"):
+    """Администратор: аналитическая панель."""
+    await ctx.step("GET /admin/analytics", "GET", "/admin/analytics", admin=True)
+
+
+SCENARIOS = {
+    "browse": scenario_browse,
+    "take": scenario_take,
+    "admin": scenario_admin,
+}
+
+
+class VirtualUser:
+    """Один виртуальный пользователь: свои клиенты (куки) и свой генератор случайных чисел."""
+
+    def __init__(self, make_client, recorder: Recorder, forms: List[SurveyForm], args, rng: random.Random):
+        self.recorder = recorder
+        self.forms = forms
+        self.args = args
+        self.rng = rng
+        self.anon = make_client()
+        self.user = make_client()
+        self.admin = make_client()
+
+    async def setup(self, email: Optional[str]):
+        if email and not await login(self.user, email, self.args.password):
+            console.print(f"[yellow]Не удалось войти как {email}[/yellow]")
+        if "admin" in self.args.mix_weights and not await login(self.admin, self.args.admin_email, self.args.password):
+            console.print(f"[yellow]Не удалось войти как {self.args.admin_email}[/yellow]")
+
+    def pick_survey(self) -> SurveyForm:
+        return self.rng.choice(self.forms)
+
+    async def step(self, name: str, method: str, url: str, anonymous: bool = False, admin: bool = False, **kwargs):
+        client = self.admin if admin else self.anon if anonymous else self.user
+        await self.recorder.request(client, name, method, url, **kwargs)
+        if self.args.think_ms:
+            await asyncio.sleep(self.args.think_ms / 1000)
+
+    async def run(self, deadline: float):
+        names = list(self.args.mix_weights)
+        weights = list(self.args.mix_weights.values())
+        while time.perf_counter() < deadline:
+            scenario = SCENARIOS[self.rng.choices(names, weights)[0]]
+            await scenario(self)
+
+    async def close(self):
+        for client in (self.anon, self.user, self.admin):
+            await client.aclose()
+
+
+async def sample_metrics(client: httpx.AsyncClient, recorder: Recorder, interval: float, stop: asyncio.Event, timeline: list):
+    """Периодически читает /metrics приложения: насыщение пула и запросы в обработке."""
+    while not stop.is_set():
+        try:
+            response = await client.get("/metrics")
+            values = {m.group(1): float(m.group(2)) for m in _METRIC_RE.finditer(response.text)}
+            values["t"] = time.perf_counter() - recorder.started
+            timeline.append(values)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+# --- ОТЧЕТ ---
+
+def summarize(recorder: Recorder, elapsed: float) -> Dict[str, dict]:
+    by_step: Dict[str, List[Sample]] = defaultdict(list)
+    for s in recorder.samples:
+        by_step[s.step].append(s)
+    by_step["TOTAL"] = recorder.samples
+
+    report = {}
+    for step, samples in by_step.items():
+        latencies = sorted(s.latency * 1000 for s in samples)
+        errors = sum(1 for s in samples if s.status == 0 or s.status >= 400)
+        report[step] = {
+            "requests": len(samples),
+            "rps": round(len(samples) / elapsed, 1) if elapsed else 0,
+            "error_rate": round(errors / len(samples), 4) if samples else 0,
+            **{f"p{p}_ms": round(percentile(latencies, p), 1) for p in (50, 90, 95, 99)},
+            "max_ms": round(latencies[-1], 1) if latencies else 0,
+        }
+    return report
+
+
+def build_timeline(recorder: Recorder, metrics: list, interval: float) -> List[dict]:
+    """Поинтервальные RPS/p99 по клиентским замерам + состояние пула из /metrics."""
+    buckets: Dict[int, List[float]] = defaultdict(list)
+    for s in recorder.samples:
+        buckets[int((s.started + s.latency) // interval)].append(s.latency * 1000)
+
+    rows = []
+    prev = None
+    for point in metrics:
+        idx = int(point["t"] // interval)
+        latencies = sorted(buckets.get(idx, []))
+        wait_avg = None
+        if prev is not None:
+            waits = point.get("db_pool_checkout_wait_seconds_count", 0) - prev.get("db_pool_checkout_wait_seconds_count", 0)
+            wait_sum = point.get("db_pool_checkout_wait_seconds_sum", 0) - prev.get("db_pool_checkout_wait_seconds_sum", 0)
+            wait_avg = round(wait_sum / waits * 1000, 2) if waits > 0 else 0.0
+        rows.append({
+            "t": round(point["t"], 1),
+            "rps": round(len(latencies) / interval, 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "in_flight": int(point.get("http_requests_in_flight", 0)),
+            "pool_checked_out": int(point.get("db_pool_checked_out", 0)),
+            "pool_size": int(point.get("db_pool_size", 0)),
+            "pool_wait_avg_ms": wait_avg,
+            "pool_timeouts": int(point.get("db_pool_checkout_timeouts_total", 0)),
+        })
+        prev = point
+    return rows
+
+
+def print_report(report: dict, timeline: list, recorder: Recorder, args):
+    table = Table(title=f"Нагрузка: {args.concurrency} пользователей, {args.duration:.0f}s, mix {args.mix}",
+                  header_style="bold magenta")
+    table.add_column("Шаг", style="cyan")
+    for col in ("Запросов", "RPS", "Ошибки", "p50", "p90", "p95", "p99", "max"):
+        table.add_column(col, justify="right")
+    for step, r in report.items():
+        style = "bold" if step == "TOTAL" else ""
+        table.add_row(
+            f"[{style}]{step}[/{style}]" if style else step,
+            str(r["requests"]), f"{r['rps']}", f"{r['error_rate']:.1%}",
+            *(f"{r[k]}" for k in ("p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms"))
+        )
+    console.print(table)
+
+    if timeline:
+        pool = Table(title="Пул соединений во времени", header_style="bold magenta")
+        for col in ("t, s", "RPS", "p99, мс", "В обработке", "Пул занят", "Ожидание пула, мс", "Таймауты пула"):
+            pool.add_column(col, justify="right")
+        for row in timeline:
+            saturated = row["pool_size"] and row["pool_checked_out"] >= row["pool_size"]
+            busy = f"{row['pool_checked_out']}/{row['pool_size']}"
+            pool.add_row(
+                f"{row['t']}", f"{row['rps']}", f"{row['p99_ms']}", str(row["in_flight"]),
+                f"[bold red]{busy}[/bold red]" if saturated else busy,
+                "—" if row["pool_wait_avg_ms"] is None else f"{row['pool_wait_avg_ms']}",
+                str(row["pool_timeouts"]),
+            )
+        console.print(pool)
+
+    if recorder.errors:
+        console.print("[bold red]Ошибки:[/bold red]")
+        for key, count in sorted(recorder.errors.items(), key=lambda kv: -kv[1]):
+            console.print(f"  {key}: {count}")
+
+
+async def main():
+    args = parse_args()
+    args.mix_weights = parse_mix(args.mix)
+
+    forms, emails = await load_fixtures(args.concurrency)
+    if not forms:
+        console.print("[bold red]В БД нет активных опросов — сначала запустите scripts.seed[/bold red]")
+        sys.exit(1)
+    if "take" in args.mix_weights and not emails:
+        console.print("[bold red]В БД нет пользователей для сценария take[/bold red]")
+        sys.exit(1)
+
+    limits = httpx.Limits(max_connections=args.concurrency * 3 + 1)
+    if args.url:
+        def make_client():
+            return httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+    else:
+        from app.main import create_app
+        # Исключения приложения превращаются в 500, как за настоящим сервером
+        transport = httpx.ASGITransport(app=create_app(), raise_app_exceptions=False, client=("127.0.0.1", 50000))
+
+        def make_client():
+            return httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout)
+
+    recorder = Recorder()
+    users = [
+        VirtualUser(make_client, recorder, forms, args, random.Random(args.seed * 1000 + i))
+        for i in range(args.concurrency)
+    ]
+    with console.status("[bold cyan]Вход виртуальных пользователей...", spinner="dots"):
+        for i, user in enumerate(users):
+            await user.setup(emails[i % len(emails)] if emails else None)
+
+    metrics_client = make_client()
+    if settings.METRICS_TOKEN:
+        metrics_client.headers["Authorization"] = f"Bearer {settings.METRICS_TOKEN}"
+    stop = asyncio.Event()
+    metrics_points: list = []
+    recorder.started = time.perf_counter()
+    sampler = asyncio.create_task(sample_metrics(metrics_client, recorder, args.sample_interval, stop, metrics_points))
+
+    deadline = recorder.started + args.ramp_up + args.duration
+
+    async def start(user: VirtualUser, delay: float):
+        await asyncio.sleep(delay)
+        await user.run(deadline)
+
+    with console.status(f"[bold magenta]Нагрузка ({args.concurrency} пользователей)...", spinner="dots"):
+        await asyncio.gather(*(
+            start(user, args.ramp_up * i / max(1, args.concurrency)) for i, user in enumerate(users)
+        ))
+    elapsed = time.perf_counter() - recorder.started
+
+    stop.set()
+    await sampler
+    for user in users:
+        await user.close()
+    await metrics_client.aclose()
+
+    report = summarize(recorder, elapsed)
+    timeline = build_timeline(recorder, metrics_points, args.sample_interval)
+    print_report(report, timeline, recorder, args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "concurrency": args.concurrency,
+                "duration_s": round(elapsed, 1),
+                "mix": args.mix_weights,
+                "target": args.url or "in-process",
+                "steps": report,
+                "timeline": timeline,
+                "errors": dict(recorder.errors),
+            }, f, ensure_ascii=False, indent=2)
+        console.print(f"[green]Отчет сохранен: {args.json}[/green]")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
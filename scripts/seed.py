@@ -27,6 +27,7 @@ from app.models import (
     QuestionType
 )
 from app.core.security import get_password_hash
+from app.services.rollups import ActivityRollupService, CohortRollupService, DurationStatsService
 
 # --- GLOBAL CONFIG ---
 fake = Faker('ru_RU')
@@ -352,6 +353,13 @@ async def main():
             console.print("―" * 30, style="dim")
             
             await generate_responses(session, users, surveys)
+
+            # Данные вставлены напрямую, минуя сервисы: пересчитываем rollup-таблицы
+            with console.status("[bold cyan]Пересчет rollup-таблиц...", spinner="dots"):
+                await ActivityRollupService(session).rebuild()
+                await CohortRollupService(session).rebuild()
+                await DurationStatsService(session).rebuild()
+                await session.commit()
             
             # Финальная таблица
             table = Table(title="Данные для входа", show_header=True, header_style="bold magenta", border_style="green")
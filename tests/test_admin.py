@@ -0,0 +1,356 @@
+import pytest
+from httpx import AsyncClient
+from app.models import Country
+from app.services.admin import AdminService
+
+
+@pytest.fixture
+async def many_countries(db_session):
+    """Фикстура: 30 стран с предсказуемыми именами"""
+    countries = [Country(name=f"Тестландия {i:02d}") for i in range(30)]
+    db_session.add_all(countries)
+    await db_session.commit()
+    return countries
+
+
+@pytest.mark.asyncio
+async def test_table_keyset_pagination(client: AsyncClient, admin_token_cookies, db_session, many_countries):
+    """Тест: Курсор следующей страницы продолжает выдачу после последнего PK"""
+    client.cookies.update(admin_token_cookies)
+    service = AdminService(db_session)
+
+    first = await service.get_paginated_table_data("countries", 1, 10, "Тестландия")
+    assert first["has_next"] and first["next_cursor"]
+
+    second = await service.get_paginated_table_data("countries", 2, 10, "Тестландия", after=first["next_cursor"])
+    first_ids = [r[0] for r in first["rows"]]
+    second_ids = [r[0] for r in second["rows"]]
+    assert len(second_ids) == 10
+    assert min(second_ids) > max(first_ids)
+
+    back = await service.get_paginated_table_data("countries", 1, 10, "Тестландия", before=second["prev_cursor"])
+    assert [r[0] for r in back["rows"]] == first_ids
+
+
+@pytest.mark.asyncio
+async def test_table_exact_count_on_request(client: AsyncClient, admin_token_cookies, many_countries):
+    """Тест: С exact=true количество строк считается точно"""
+    client.cookies.update(admin_token_cookies)
+
+    response = await client.get("/admin/tables/data/countries?q=Тестландия&limit=10&exact=true")
+
+    assert response.status_code == 200
+    assert "из 3" in response.text
+
+
+@pytest.mark.asyncio
+async def test_table_search_is_type_aware(db_session, many_countries):
+    """Тест: Число ищется равенством по PK, `колонка:значение` — только по колонке"""
+    service = AdminService(db_session)
+    target = many_countries[7]
+
+    by_id = await service.get_paginated_table_data("countries", 1, 10, str(target.country_id))
+    assert [r[0] for r in by_id["rows"]] == [target.country_id]
+
+    by_column = await service.get_paginated_table_data("countries", 1, 50, "name:Тестландия 0")
+    assert len(by_column["rows"]) == 10
+
+    condition, _ = await service.build_search_clause(await service.get_table_meta("countries"), "name:xyz")
+    assert '"country_id"' not in condition
+
+
+@pytest.mark.asyncio
+async def test_table_search_skips_out_of_range_numbers():
+    """Тест: Число вне диапазона integer не ищется по int4-колонке, nan/inf — по numeric"""
+    from sqlalchemy import BigInteger, Integer, Numeric
+    from app.services.table_search import build_search_condition
+
+    columns = [{"name": "id", "type": Integer()}, {"name": "big", "type": BigInteger()}, {"name": "score", "type": Numeric()}]
+    meta = {"columns": columns, "column_names": [c["name"] for c in columns], "fks": []}
+
+    async def no_tables(name):
+        return None
+
+    condition, params = await build_search_condition(meta, "3000000000", no_tables)
+    assert '"id"' not in condition and '"big"' in condition
+    assert 3000000000 in params.values()
+
+    condition, _ = await build_search_condition(meta, "nan", no_tables)
+    assert condition == "FALSE"
+
+@pytest.mark.asyncio
+async def test_table_fk_labels_resolved_in_page_query(db_session, many_countries):
+    """Тест: Внешний ключ country_id подписывается названием страны"""
+    from app.models import User
+    service = AdminService(db_session)
+    country = many_countries[3]
+    user = User(full_name="FK Label", email="fk_label@test.com", password_hash="x", country_id=country.country_id)
+    db_session.add(user)
+    await db_session.commit()
+
+    data = await service.get_paginated_table_data("users", 1, 10, "email:fk_label@test.com")
+
+    assert len(data["rows"]) == 1
+    assert data["resolved_data"]["country_id"][country.country_id] == country.name
+
+
+@pytest.mark.asyncio
+async def test_fk_typeahead_options(client: AsyncClient, admin_token_cookies, many_countries):
+    """Тест: Поиск вариантов FK возвращает совпадения из связанной таблицы"""
+    client.cookies.update(admin_token_cookies)
+
+    response = await client.get("/admin/tables/fk-options/users/country_id?q=Тестландия 07")
+    assert response.status_code == 200
+    assert "Тестландия 07" in response.text
+    assert "Тестландия 08" not in response.text
+
+    response = await client.get("/admin/tables/fk-options/users/email?q=x")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_fk_typeahead_without_text_display_column(client: AsyncClient, admin_token_cookies, many_countries):
+    """Тест: FK на таблицу без текстовой колонки (survey_responses) ищется по id, длинное число не дает 500"""
+    client.cookies.update(admin_token_cookies)
+
+    for q in ("abc", "12", "99999999999"):
+        response = await client.get(f"/admin/tables/fk-options/user_answers/response_id?q={q}")
+        assert response.status_code == 200
+
+    # Короткий ввод ищется только с начала строки
+    response = await client.get("/admin/tables/fk-options/users/country_id?q=ия")
+    assert response.status_code == 200
+    assert "Тестландия" not in response.text
+
+
+@pytest.mark.asyncio
+async def test_csv_import_reports_rejected_rows(client: AsyncClient, admin_token_cookies, db_session):
+    """Тест: Импорт CSV добавляет валидные строки и перечисляет отклоненные"""
+    from sqlalchemy import select, func
+    client.cookies.update(admin_token_cookies)
+    csv_body = "name\nИмпортия 1\nИмпортия 2\n" + "Д" * 150 + "\n"
+
+    response = await client.post(
+        "/admin/tables/import/countries",
+        files={"file": ("countries.csv", csv_body.encode("utf-8"), "text/csv")}
+    )
+
+    assert response.status_code == 200
+    assert "name: длиннее 100 символов" in response.text
+    imported = await db_session.scalar(select(func.count()).where(Country.name.like("Импортия %")))
+    assert imported == 2
+
+
+@pytest.mark.asyncio
+async def test_import_form_unknown_table_404(client: AsyncClient, admin_token_cookies):
+    """Тест: Форма импорта для несуществующей таблицы — 404, а не 500"""
+    client.cookies.update(admin_token_cookies)
+    response = await client.get("/admin/tables/import-form/no_such_table")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_dry_run_then_execute(client: AsyncClient, admin_token_cookies, db_session, many_countries):
+    """Тест: Массовое удаление сначала считает строки, затем удаляет одним запросом"""
+    from sqlalchemy import select, func
+    client.cookies.update(admin_token_cookies)
+    ids = [str(c.country_id) for c in many_countries[:5]]
+
+    preview = await client.post("/admin/tables/bulk/countries", data={"action": "delete", "scope": "selected", "ids": ids})
+    assert preview.status_code == 200
+    assert "<b>5</b>" in preview.text
+
+    response = await client.post(
+        "/admin/tables/bulk/countries",
+        data={"action": "delete", "scope": "selected", "ids": ids, "dry_run": "false"}
+    )
+    assert response.status_code == 200
+    left = await db_session.scalar(select(func.count()).where(Country.name.like("Тестландия %")))
+    assert left == 25
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_composite_pk_removes_only_selected(client: AsyncClient, admin_token_cookies, db_session):
+    """Тест: В survey_tags (PK survey_id, tag_id) массовое удаление затрагивает только отмеченную пару"""
+    from sqlalchemy import select, func
+    from app.models import Survey, SurveyStatus, Tag, survey_tags
+    from app.services.admin import AdminService
+    client.cookies.update(admin_token_cookies)
+
+    survey = Survey(title="Теги", status=SurveyStatus.active)
+    tags = [Tag(name="bulk-tag-1"), Tag(name="bulk-tag-2")]
+    db_session.add_all([survey, *tags])
+    await db_session.flush()
+    await db_session.execute(survey_tags.insert(), [{"survey_id": survey.survey_id, "tag_id": t.tag_id} for t in tags])
+    await db_session.commit()
+
+    key = AdminService.encode_pk_cursor([survey.survey_id, tags[0].tag_id])
+    preview = await client.post("/admin/tables/bulk/survey_tags", data={"action": "delete", "scope": "selected", "ids": [key]})
+    assert "<b>1</b>" in preview.text
+
+    await client.post(
+        "/admin/tables/bulk/survey_tags",
+        data={"action": "delete", "scope": "selected", "ids": [key], "dry_run": "false"}
+    )
+    left = await db_session.scalar(
+        select(func.array_agg(survey_tags.c.tag_id)).where(survey_tags.c.survey_id == survey.survey_id)
+    )
+    assert left == [tags[1].tag_id]
+
+
+@pytest.mark.asyncio
+async def test_explain_inspector_runs_service_query(client: AsyncClient, admin_token_cookies, many_countries):
+    """Тест: Инспектор перехватывает SQL метода сервиса и показывает план с таймингами"""
+    client.cookies.update(admin_token_cookies)
+    response = await client.post("/admin/explain/run", data={"query": "table_page", "table": "countries", "q": "Тест"})
+    assert response.status_code == 200
+    assert "Execution:" in response.text
+    assert "countries" in response.text
+
+    bad = await client.post("/admin/explain/run", data={"query": "nope"})
+    assert "не зарегистрирован" in bad.text
+
+
+def test_profile_flag_requires_exact_query_param():
+    """Тест: Профилирование включает только параметр _profile=1, а не подстрока в другом параметре"""
+    from app.core.profiling import is_profile_requested
+
+    assert is_profile_requested({"query_string": b"a=1&_profile=1"})
+    assert is_profile_requested({"query_string": b"", "headers": [(b"x-profile", b"1")]})
+    for query in (b"x_profile=10", b"foo=a_profile=1", b"_profile=10"):
+        assert not is_profile_requested({"query_string": query, "headers": []})
+
+
+def test_profile_report_saved_and_listed(tmp_path, monkeypatch):
+    """Тест: Профиль сохраняется как HTML и speedscope, дети в дереве не длиннее родителя"""
+    import cProfile
+    import json
+    from app.core import profiling
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+
+    def work():
+        return sorted(str(i) for i in range(20000))
+
+    profiler = cProfile.Profile()
+    profiler.runcall(work)
+    profile_id = profiling.new_profile_id()
+    profiling.save_profile(profile_id, profiler, {
+        "id": profile_id, "created_at": "2026-01-01T00:00:00+00:00", "method": "GET",
+        "path": "/surveys", "query": "_profile=1", "status": 200, "duration_ms": 1.0,
+        "queries": 0, "db_ms": 0.0,
+    })
+
+    assert [p["id"] for p in profiling.list_profiles()] == [profile_id]
+    assert "work" in profiling.profile_file(profile_id, ".html").read_text(encoding="utf-8")
+    assert profiling.profile_file("../secret", ".html") is None
+
+    speedscope = json.loads(profiling.profile_file(profile_id, ".speedscope.json").read_text(encoding="utf-8"))
+    events = speedscope["profiles"][0]["events"]
+    assert len(events) % 2 == 0 and events[0]["type"] == "O" and events[-1]["type"] == "C"
+
+    def check(node):
+        assert sum(c["value"] for c in node["children"]) <= node["value"] * 1.0001
+        for child in node["children"]:
+            check(child)
+    check(profiling.build_call_tree(profiling.pstats.Stats(profiler)))
+
+
+@pytest.mark.asyncio
+async def test_profiling_concurrent_requests_profile_one(tmp_path, monkeypatch):
+    """Тест: Из двух одновременных запросов с флагом профилируется один, оба отвечают 200"""
+    import asyncio
+    from app.core import middleware
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+
+    async def slow_admin_check(scope):
+        await asyncio.sleep(0.01)
+        return True
+    monkeypatch.setattr(middleware, "is_admin_request", slow_admin_check)
+
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.01)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    profiled = middleware.ProfilingMiddleware(app)
+
+    async def call():
+        messages = []
+        scope = {"type": "http", "method": "GET", "path": "/", "query_string": b"_profile=1", "headers": []}
+
+        async def send(message):
+            messages.append(message)
+        await profiled(scope, None, send)
+        return dict(messages[0]["headers"]), messages[0]["status"]
+
+    results = await asyncio.gather(call(), call())
+
+    assert [status for _, status in results] == [200, 200]
+    assert sum(b"x-profile-id" in headers for headers, _ in results) == 1
+    assert not profiled._active
+
+@pytest.mark.asyncio
+async def test_activity_stats_bucket_by_range(db_session):
+    """Тест: График активности за несколько лет идет по месяцам, за месяц — по дням"""
+    from datetime import date
+    from sqlalchemy import text
+    from app.models import Survey, SurveyStatus
+    from app.services.admin import choose_activity_bucket
+
+    assert choose_activity_bucket(date(2026, 1, 1), date(2026, 1, 31)) == "day"
+    assert choose_activity_bucket(date(2025, 1, 1), date(2026, 1, 1)) == "week"
+    assert choose_activity_bucket(date(2020, 1, 1), date(2026, 1, 1)) == "month"
+
+    survey = Survey(title="Активность", status=SurveyStatus.active)
+    db_session.add(survey)
+    await db_session.flush()
+    # По одному часу в каждый из 1000 дней
+    await db_session.execute(text("""
+        INSERT INTO activity_hourly (hour_bucket, survey_id, starts, completions)
+        SELECT TIMESTAMPTZ '2023-01-01 12:00+00' + d * interval '1 day', :sid, 1, 1
+        FROM generate_series(0, 999) d
+    """), {"sid": survey.survey_id})
+
+    service = AdminService(db_session)
+    long_range = await service.get_activity_stats(date(2023, 1, 1), date(2025, 9, 27))
+    assert long_range["bucket"] == "month" and len(long_range["dates"]) <= 33
+    assert sum(long_range["counts"]) == 1000
+
+    one_month = await service.get_activity_stats(date(2023, 1, 1), date(2023, 1, 31))
+    assert one_month["bucket"] == "day" and sum(one_month["counts"]) == 31
+
+
+def test_fraud_signals_vectorized():
+    """Тест: Детектор помечает одну позицию ответов, всплеск с одного IP и одинаковые тексты"""
+    import pandas as pd
+    from app.services.fraud import detect_signals
+
+    start = 1_000_000.0
+    responses = pd.DataFrame({
+        "response_id": range(1, 9),
+        "survey_id": [1] * 8,
+        "ip": ["10.0.0.1"] * 5 + ["10.0.0.2", "10.0.0.3", None],
+        # Первое прохождение — хвост предыдущей партиции: участвует в окне, но не помечается
+        "started": [start - 100] + [start + i * 10 for i in range(1, 8)],
+        "completed": [start + 3600 * i for i in range(8)],
+    })
+    answers = []
+    for response_id in range(1, 9):
+        for question_id in range(1, 7):
+            position = 1 if response_id == 2 else (response_id + question_id) % 3 + 1
+            answers.append((response_id, question_id, question_id * 10 + position, None))
+        answers.append((response_id, 100, None, "dup" if response_id in (3, 4, 5) else f"text-{response_id}"))
+    answers = pd.DataFrame(answers, columns=["response_id", "question_id", "selected_option_id", "text_hash"])
+    positions = pd.Series({q * 10 + k: k for q in range(1, 7) for k in range(1, 4)})
+
+    flags = detect_signals(responses, answers, positions, start, 86400).set_index("response_id")
+
+    assert set(flags.index) == {2, 3, 4, 5}
+    assert flags.loc[2, "straightline"] == 1.0
+    assert flags.loc[5, "ip_burst"] == 5
+    assert flags.loc[3, "duplicate_text"] == 3
+    assert flags.loc[5, "score"] > flags.loc[3, "score"]
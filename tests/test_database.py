@@ -0,0 +1,111 @@
+import pytest
+from sqlalchemy import text
+from starlette.requests import Request
+
+from app.core.database import route_class
+
+
+@pytest.mark.asyncio
+async def test_route_class_sets_statement_timeout(db_session):
+    """Тест: Класс маршрута задает statement_timeout для транзакции сессии"""
+    dependency = route_class("analytics")
+    await dependency(Request({"type": "http"}), db_session)
+
+    timeout = (await db_session.execute(text("SHOW statement_timeout"))).scalar()
+
+    assert timeout == "15s"
+
+
+@pytest.mark.asyncio
+async def test_query_stats_detect_repeated_statements(db_session):
+    """Тест: Статистика запроса считает SQL и находит повторяющуюся форму (N+1)"""
+    from app.core.query_stats import QueryStats, current_query_stats, statement_shape
+
+    stats = QueryStats()
+    token = current_query_stats.set(stats)
+    try:
+        for i in range(5):
+            await db_session.execute(text(f"SELECT {i} AS n"))
+        await db_session.execute(text("SELECT 'other'"))
+    finally:
+        current_query_stats.reset(token)
+
+    assert stats.count >= 6
+    assert stats.total_ms > 0
+    assert statement_shape("SELECT 1 AS n") == statement_shape("SELECT  42 AS n")
+    assert stats.repeated(4) == [("SELECT ? AS n", 5)]
+
+
+def test_metrics_render_prometheus_format():
+    """Тест: Гистограмма выдается кумулятивными корзинами в формате Prometheus"""
+    from app.core.metrics import Histogram, render_metrics, _REGISTRY
+
+    histogram = Histogram("test_latency_seconds", "Test latency", (0.1, 1), ["route"])
+    try:
+        histogram.observe(0.05, route="/a")
+        histogram.observe(0.5, route="/a")
+        histogram.observe(5, route="/a")
+        output = render_metrics()
+    finally:
+        # Гистограмма регистрируется в общем реестре процесса: убираем ее из вывода /metrics
+        _REGISTRY.remove(histogram)
+
+    assert "# TYPE test_latency_seconds histogram" in output
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in output
+    assert 'test_latency_seconds_bucket{route="/a",le="1"} 2' in output
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in output
+    assert 'test_latency_seconds_count{route="/a"} 3' in output
+    assert "test_latency_seconds" not in render_metrics()
+
+
+def test_metrics_require_token_or_localhost(monkeypatch):
+    """Тест: /metrics без токена доступен только с localhost, с токеном — только по нему"""
+    from starlette.requests import Request
+    from app.core.config import settings
+    from app.routers.general import metrics_allowed
+
+    def request(host, auth=None):
+        headers = [(b"authorization", auth.encode())] if auth else []
+        return Request({"type": "http", "method": "GET", "path": "/metrics", "headers": headers, "client": (host, 1)})
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    assert metrics_allowed(request("127.0.0.1"))
+    assert not metrics_allowed(request("10.0.0.5"))
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "s3cret")
+    assert metrics_allowed(request("10.0.0.5", "Bearer s3cret"))
+    assert not metrics_allowed(request("127.0.0.1"))
+    assert not metrics_allowed(request("10.0.0.5", "Bearer wrong"))
+
+
+def test_templates_share_precompiled_environment():
+    """Тест: Роутеры используют одно окружение Jinja, все шаблоны компилируются при старте"""
+    from app.core.templating import templates, precompile_templates
+    from app.core import exceptions
+    from app.routers import admin, general, surveys
+
+    assert admin.templates is general.templates is surveys.templates is exceptions.templates is templates
+    assert precompile_templates() == len(templates.env.list_templates(extensions=["html"])) > 0
+    assert "base.html" in [key[1] for key in templates.env.cache.keys()]
+
+
+@pytest.mark.asyncio
+async def test_warmup_fills_caches_and_reports_ready(client, db_session):
+    """Тест: /ready возвращает 503 до окончания прогрева, прогрев заполняет кэш стран"""
+    from app.core.warmup import warm_caches, warmup_state
+    from app.services.user import countries_cache
+
+    warmup_state.reset()
+    countries_cache.clear()
+    try:
+        assert (await client.get("/ready")).status_code == 503
+
+        await warm_caches(db_session, limit=5)
+        assert countries_cache.get("all") is not None
+
+        warmup_state.ready = True
+        response = await client.get("/ready")
+        assert response.status_code == 200 and response.json()["ready"] is True
+    finally:
+        warmup_state.reset()
+        countries_cache.clear()
@@ -89,4 +89,159 @@ async def test_submit_to_completed_survey_error(client: AsyncClient, db_session,
     
     # Ожидаем 400 и текст из SurveyService
     assert response.status_code == 400
-    assert "Опрос не активен" in response.text
\ No newline at end of file
+    assert "Опрос не активен" in response.text
+
+@pytest.mark.asyncio
+async def test_export_wide_one_row_per_response(client: AsyncClient, admin_token_cookies, sample_survey):
+    """Тест: Широкий экспорт содержит колонку на вопрос и строку на прохождение"""
+    survey, question, options = sample_survey
+    client.cookies.update(admin_token_cookies)
+
+    payload = {f"q_{question.question_id}": str(options[1].option_id)}
+    await client.post(f"/surveys/{survey.survey_id}/submit", data=payload)
+
+    response = await client.get(f"/surveys/{survey.survey_id}/export?layout=wide")
+
+    assert response.status_code == 200
+    lines = response.content.decode("utf-8-sig").strip().splitlines()
+    assert question.question_text in lines[0]
+    assert len(lines) == 2
+    assert lines[1].endswith("Вариант Б")
+
+
+@pytest.mark.asyncio
+async def test_submit_bumps_survey_data_version(client: AsyncClient, db_session, admin_token_cookies, sample_survey):
+    """Тест: Отправка ответа увеличивает версию данных опроса (инвалидация кэша результатов)"""
+    survey, question, options = sample_survey
+    client.cookies.update(admin_token_cookies)
+
+    before = await db_session.scalar(select(Survey.data_version).where(Survey.survey_id == survey.survey_id))
+
+    payload = {f"q_{question.question_id}": str(options[0].option_id)}
+    await client.post(f"/surveys/{survey.survey_id}/submit", data=payload)
+
+    after = await db_session.scalar(select(Survey.data_version).where(Survey.survey_id == survey.survey_id))
+    assert after == before + 1
+
+
+@pytest.mark.asyncio
+async def test_submit_updates_activity_rollup(client: AsyncClient, db_session, admin_token_cookies, sample_survey):
+    """Тест: Прохождение увеличивает activity_hourly, повторная отправка не считается дважды, rebuild дает то же"""
+    from sqlalchemy import text
+    from app.services.rollups import ActivityRollupService
+
+    survey, question, options = sample_survey
+    client.cookies.update(admin_token_cookies)
+    payload = {f"q_{question.question_id}": str(options[0].option_id)}
+
+    async def rollup():
+        res = await db_session.execute(text(
+            "SELECT SUM(starts), SUM(completions) FROM activity_hourly WHERE survey_id = :sid"
+        ), {"sid": survey.survey_id})
+        return tuple(res.one())
+
+    await client.post(f"/surveys/{survey.survey_id}/submit", data=payload)
+    await client.post(f"/surveys/{survey.survey_id}/submit", data=payload)
+    assert await rollup() == (1, 1)
+
+    await ActivityRollupService(db_session).rebuild()
+    assert await rollup() == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_submit_updates_cohort_activity(client: AsyncClient, db_session, admin_token_cookies, sample_survey):
+    """Тест: Прохождение отмечает пользователя активным в месяце, матрица когорт совпадает с пересчетом"""
+    from app.services.admin import AdminService
+    from app.services.rollups import CohortRollupService
+
+    survey, question, options = sample_survey
+    client.cookies.update(admin_token_cookies)
+    await CohortRollupService(db_session).rebuild()
+
+    before = await AdminService(db_session).get_cohort_stats()
+    await client.post(
+        f"/surveys/{survey.survey_id}/submit",
+        data={f"q_{question.question_id}": str(options[0].option_id)}
+    )
+    incremental = await AdminService(db_session).get_cohort_stats()
+    assert incremental != before
+
+    await CohortRollupService(db_session).rebuild()
+    assert await AdminService(db_session).get_cohort_stats() == incremental
+
+
+@pytest.mark.asyncio
+async def test_submit_updates_duration_stats(client: AsyncClient, db_session, admin_token_cookies, sample_survey):
+    """Тест: Повторная отправка заменяет длительность в статистике Уэлфорда, rebuild дает то же"""
+    from sqlalchemy import text
+    from app.services.rollups import DurationStatsService
+
+    survey, question, options = sample_survey
+    client.cookies.update(admin_token_cookies)
+    payload = {f"q_{question.question_id}": str(options[0].option_id)}
+
+    async def stats():
+        res = await db_session.execute(text(
+            "SELECT n, mean FROM survey_duration_stats WHERE survey_id = :sid"
+        ), {"sid": survey.survey_id})
+        return res.one()
+
+    await client.post(f"/surveys/{survey.survey_id}/submit", data=payload)
+    await client.post(f"/surveys/{survey.survey_id}/submit", data=payload)
+    n, mean = await stats()
+    assert n == 1
+
+    await DurationStatsService(db_session).rebuild(survey.survey_id)
+    n_rebuilt, mean_rebuilt = await stats()
+    assert n_rebuilt == 1
+    assert mean_rebuilt == pytest.approx(mean)
+
+
+@pytest.mark.asyncio
+async def test_admin_edit_recounts_activity_hour(client: AsyncClient, db_session, admin_token_cookies, sample_survey):
+    """Тест: Правка started_at в админке переносит прохождение в другой час activity_hourly"""
+    from datetime import timedelta
+    from sqlalchemy import text
+    from app.services.admin import AdminService
+
+    survey, question, options = sample_survey
+    client.cookies.update(admin_token_cookies)
+    await client.post(
+        f"/surveys/{survey.survey_id}/submit",
+        data={f"q_{question.question_id}": str(options[0].option_id)}
+    )
+    response = (await db_session.execute(
+        select(SurveyResponse).where(SurveyResponse.survey_id == survey.survey_id)
+    )).scalar_one()
+    moved = response.started_at - timedelta(days=1)
+
+    await AdminService(db_session).update_row("survey_responses", response.response_id, {"started_at": moved})
+
+    rows = (await db_session.execute(text(
+        "SELECT hour_bucket, starts FROM activity_hourly WHERE survey_id = :sid"
+    ), {"sid": survey.survey_id})).all()
+    assert len(rows) == 1
+    assert rows[0].starts == 1
+    assert rows[0].hour_bucket <= moved
+
+
+@pytest.mark.asyncio
+async def test_survey_delete_decrements_cohort_activity(client: AsyncClient, db_session, admin_token_cookies, sample_survey):
+    """Тест: Удаление опроса снимает активность его участников, матрица когорт совпадает с пересчетом"""
+    from app.services.admin import AdminService
+    from app.services.rollups import CohortRollupService
+
+    survey, question, options = sample_survey
+    client.cookies.update(admin_token_cookies)
+    await CohortRollupService(db_session).rebuild()
+    before = await AdminService(db_session).get_cohort_stats()
+
+    await client.post(
+        f"/surveys/{survey.survey_id}/submit",
+        data={f"q_{question.question_id}": str(options[0].option_id)}
+    )
+    await client.delete(f"/surveys/{survey.survey_id}/delete")
+
+    incremental = await AdminService(db_session).get_cohort_stats()
+    await CohortRollupService(db_session).rebuild()
+    assert await AdminService(db_session).get_cohort_stats() == incremental == before
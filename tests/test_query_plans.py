@@ -0,0 +1,189 @@
+import json
+import os
+import re
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from scripts.dataset import dataset_size, insert_dataset, truncate_dataset_tables
+from tests.conftest import test_engine
+
+# Все тесты модуля работают с одним набором данных в одном event loop
+pytestmark = pytest.mark.asyncio(loop_scope="module")
+
+# Масштаб набора (прохождений); в CI можно поднять через переменную окружения
+RESPONSES = int(os.getenv("PLAN_TEST_RESPONSES", "40000"))
+# Таблица считается большой, если в ней больше строк (по reltuples)
+LARGE_TABLE_ROWS = 10_000
+# Seq Scan с фильтром, который оставляет меньше этой доли таблицы, должен идти по индексу
+SELECTIVE_FRACTION = 0.05
+# Nested Loop, перебирающий больше пар строк (оценка), считаем деградацией
+NESTED_LOOP_MAX_ROWS = 1_000_000
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def plan_db():
+    """
+    Фикстура: масштабированный детерминированный набор + ANALYZE внутри транзакции.
+    TRUNCATE ... RESTART IDENTITY и статистика откатываются вместе с данными.
+    """
+    connection = await test_engine.connect()
+    transaction = await connection.begin()
+    session = AsyncSession(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        await truncate_dataset_tables(session)
+        # Больше опросов, чем в бенчмарке: выборка по одному опросу должна быть селективной
+        size = {**dataset_size(RESPONSES), "surveys": max(20, RESPONSES // 200)}
+        await insert_dataset(session, size, seed=42)
+        await session.execute(text("ANALYZE"))
+
+        rows = (await session.execute(text("""
+            SELECT relname, reltuples::bigint FROM pg_class
+            WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace
+        """))).all()
+        base_cost = (await explain(session, "SELECT * FROM user_answers"))["Total Cost"]
+        yield {"session": session, "rows": dict(rows), "base_cost": base_cost}
+    finally:
+        await session.close()
+        await transaction.rollback()
+        await connection.close()
+
+
+async def explain(session: AsyncSession, sql: str, params: dict = None) -> dict:
+    res = await session.execute(text("EXPLAIN (FORMAT JSON) " + sql), params or {})
+    plan = res.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def iter_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from iter_nodes(child)
+
+
+async def function_query(session: AsyncSession, signature: str, substitutions: dict) -> str:
+    """
+    Достает запрос RETURN QUERY из тела PL/pgSQL-функции, как она развернута в БД,
+    и подставляет значения параметров: EXPLAIN самой функции показал бы только Function Scan.
+    """
+    source = await session.scalar(
+        text("SELECT prosrc FROM pg_proc WHERE oid = CAST(:sig AS regprocedure)"), {"sig": signature}
+    )
+    match = re.search(r"RETURN QUERY(.*?);\s*END;", source, re.S | re.I)
+    assert match, f"{signature}: не найден RETURN QUERY"
+    sql = match.group(1)
+    for name, value in substitutions.items():
+        sql = re.sub(rf"\b{name}\b", value, sql)
+    return sql
+
+
+def plan_problems(plan: dict, rows: dict, budget: float) -> list:
+    problems = []
+    if plan["Total Cost"] > budget:
+        problems.append(f"стоимость {plan['Total Cost']:.0f} > бюджета {budget:.0f}")
+
+    for node in iter_nodes(plan):
+        relation = node.get("Relation Name")
+        table_rows = rows.get(relation, 0)
+        if (
+            node["Node Type"] == "Seq Scan"
+            and table_rows > LARGE_TABLE_ROWS
+            and "Filter" in node
+            and node["Plan Rows"] < table_rows * SELECTIVE_FRACTION
+        ):
+            problems.append(
+                f"Seq Scan по {relation} ({table_rows} строк) ради {node['Plan Rows']} строк: {node['Filter']}"
+            )
+        if node["Node Type"] == "Nested Loop":
+            outer, inner = node["Plans"][0], node["Plans"][1]
+            pairs = outer["Plan Rows"] * inner["Plan Rows"]
+            if pairs > NESTED_LOOP_MAX_ROWS:
+                problems.append(f"Nested Loop на {pairs} пар строк ({outer['Node Type']} x {inner['Node Type']})")
+    return problems
+
+
+def uses_index(plan: dict, table: str) -> bool:
+    return any(
+        node.get("Relation Name") == table
+        and node["Node Type"] in ("Index Scan", "Index Only Scan", "Bitmap Heap Scan")
+        for node in iter_nodes(plan)
+    )
+
+
+async def check_plan(plan_db, sql: str, params: dict = None, budget_fraction: float = 1.0, indexed: tuple = ()):
+    """
+    Бюджет задается долей стоимости полного чтения user_answers (самой большой
+    таблицы), поэтому не зависит от масштаба набора и настроек планировщика.
+    """
+    plan = await explain(plan_db["session"], sql, params)
+    problems = plan_problems(plan, plan_db["rows"], plan_db["base_cost"] * budget_fraction)
+    problems += [f"{table}: нет индексного доступа" for table in indexed if not uses_index(plan, table)]
+    assert not problems, "\n".join(problems) + "\n" + json.dumps(plan, ensure_ascii=False, indent=1)[:4000]
+
+
+async def test_flat_view_by_question_uses_indexes(plan_db):
+    """Тест: v_survey_responses_flat по вопросу (статистика опроса) читает ответы по индексу"""
+    await check_plan(plan_db, """
+        SELECT answer_content, AVG(respondent_age), COUNT(*)
+        FROM v_survey_responses_flat WHERE question_id = :qid GROUP BY answer_content
+    """, {"qid": 1}, budget_fraction=0.1, indexed=("user_answers",))
+
+
+async def test_flat_view_export_uses_indexes(plan_db):
+    """Тест: Экспорт опроса из v_survey_responses_flat не сканирует все ответы"""
+    await check_plan(plan_db, """
+        SELECT respondent_name, respondent_age, question_text, answer_content, completed_at
+        FROM v_survey_responses_flat WHERE survey_id = :id
+        ORDER BY completed_at DESC, question_id ASC
+    """, {"id": 1}, budget_fraction=0.3, indexed=("user_answers",))
+
+
+async def test_anomaly_candidates_by_survey_uses_indexes(plan_db):
+    """Тест: v_anomaly_candidates с фильтром по опросу проталкивает условие в агрегат"""
+    await check_plan(plan_db, """
+        SELECT * FROM v_anomaly_candidates
+        WHERE speed_ratio < 0.3 AND survey_id = :sid
+        ORDER BY speed_ratio ASC LIMIT 50
+    """, {"sid": 1}, budget_fraction=0.3, indexed=("survey_responses",))
+
+
+async def test_anomaly_candidates_all_surveys_within_budget(plan_db):
+    """Тест: v_anomaly_candidates по всем опросам без Nested Loop по всей таблице"""
+    await check_plan(plan_db, """
+        SELECT * FROM v_anomaly_candidates WHERE speed_ratio < 0.3
+        ORDER BY speed_ratio ASC LIMIT 50
+    """, budget_fraction=1.0)
+
+
+async def test_anomalies_by_duration_use_index(plan_db):
+    """Тест: Быстрые прохождения опроса читаются диапазоном индекса (survey_id, duration)"""
+    await check_plan(plan_db, """
+        SELECT response_id FROM survey_responses
+        WHERE survey_id = :sid AND completed_at IS NOT NULL AND duration < interval '30 seconds'
+        ORDER BY duration ASC LIMIT 50
+    """, {"sid": 1}, budget_fraction=0.01, indexed=("survey_responses",))
+
+
+async def test_search_surveys_ranked_plan(plan_db):
+    """Тест: Запрос search_surveys_ranked укладывается в бюджет"""
+    sql = await function_query(plan_db["session"], "search_surveys_ranked(text)", {"p_query": "'опрос'"})
+    await check_plan(plan_db, sql, budget_fraction=0.05)
+
+
+async def test_survey_recommendations_plan(plan_db):
+    """Тест: Запрос get_survey_recommendations ищет прохождения пользователя по индексу"""
+    sql = await function_query(plan_db["session"], "get_survey_recommendations(integer)", {"p_user_id": "2"})
+    await check_plan(plan_db, sql, budget_fraction=0.2, indexed=("survey_responses",))
+
+
+async def test_survey_benchmark_plan(plan_db):
+    """Тест: Запрос get_survey_benchmark укладывается в бюджет"""
+    sql = await function_query(plan_db["session"], "get_survey_benchmark(integer)", {
+        "p_survey_id": "1",
+        "v_tag_ids": "(SELECT array_agg(tag_id) FROM survey_tags WHERE survey_id = 1)",
+    })
+    await check_plan(plan_db, sql, budget_fraction=0.5, indexed=("survey_responses",))
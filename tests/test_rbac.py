@@ -75,4 +75,27 @@ async def test_user_can_access_own_profile(client: AsyncClient, user_token_cooki
     response = await client.get("/users/me")
     
     assert response.status_code == 200
-    assert "Личный кабинет" in response.text
\ No newline at end of file
+    assert "Личный кабинет" in response.text
+
+@pytest.mark.asyncio
+async def test_profile_history_fragment_requires_auth(client: AsyncClient):
+    """Тест: Фрагмент истории профиля недоступен анонимно"""
+    response = await client.get("/users/me/history")
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_profile_history_fragment_rejects_bad_cursor(client: AsyncClient, user_token_cookies):
+    """Тест: Некорректный курсор пагинации отклоняется с 400"""
+    client.cookies.update(user_token_cookies)
+    response = await client.get("/users/me/history?cursor=garbage")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_profile_history_fragment_rejects_out_of_range_cursor(client: AsyncClient, user_token_cookies):
+    """Тест: Курсор с датой вне диапазона datetime или id вне int4 отклоняется с 400, а не 500"""
+    client.cookies.update(user_token_cookies)
+    for cursor in ("999999999999999999999_1", "0_99999999999", "0_-5"):
+        response = await client.get(f"/users/me/history?cursor={cursor}")
+        assert response.status_code == 400